@@ -0,0 +1,50 @@
+"""
+Benchmark reading PlateResults.txt files from tests/test_data with
+`ingest.read_plate_results()` against the previous `pd.read_csv()` call.
+
+    python benchmarks/bench_ingest.py
+
+from the repository root, with plaque_assay installed.
+"""
+
+import os
+import timeit
+from glob import glob
+
+import pandas as pd
+
+from plaque_assay import ingest
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(CURRENT_DIR, os.pardir, "tests", "test_data")
+PLATE_RESULTS = sorted(
+    glob(os.path.join(TEST_DATA_DIR, "**", "PlateResults.txt"), recursive=True)
+)
+N_REPEATS = 5
+
+
+def read_all_previous():
+    for path in PLATE_RESULTS:
+        pd.read_csv(path, skiprows=8, sep="\t")
+
+
+def read_all(use_pyarrow=False):
+    for path in PLATE_RESULTS:
+        ingest.read_plate_results(path, use_pyarrow)
+
+
+def main():
+    print(f"{len(PLATE_RESULTS)} PlateResults.txt files, best of {N_REPEATS}")
+    benchmarks = {
+        "pd.read_csv (previous)": read_all_previous,
+        "read_plate_results": read_all,
+        "read_plate_results (pyarrow)": lambda: read_all(use_pyarrow=True),
+    }
+    for name, func in benchmarks.items():
+        best = min(timeit.repeat(func, number=1, repeat=N_REPEATS))
+        per_file = best / len(PLATE_RESULTS) * 1000
+        print(f"{name:<30} {best * 1000:8.1f} ms total {per_file:6.2f} ms/file")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Benchmark each stage of the analysis pipeline, and whole runs, over
+synthetic workflows from `synthetic.py`, uploading to in-memory SQLite.
+
+    python benchmarks/bench_pipeline.py [--workflows N] [--repeats R]
+        [--output results.json] [--compare baseline.json] [--threshold 0.2]
+
+from the repository root, with plaque_assay installed.
+
+Stages are timed separately across all workflows:
+
+- `ingest`: `main.read_plates()` and streaming the indexfiles
+- `plate_qc`: `Plate` normalisation and QC with `process_plates()`
+- `fit`: fitting curves for every sample, `Experiment.make_samples()`
+- `results`: assembling the output dataframes from an `Experiment`
+- `upload`: `main.upload()` of the results to SQLite
+- `run`: end-to-end `main.run()` for every workflow
+
+Times are the best of `--repeats`, reported per workflow. `--output`
+saves the results as JSON along with the git commit and package
+versions. `--compare` compares times with previously saved results, and
+exits with status 1 if any stage is slower than the baseline by more
+than `--threshold`, so can be used to catch regressions.
+
+The result cache, sidecars and profiling output are disabled, so every
+repeat does the full work.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import scipy
+import sqlalchemy
+import sqlalchemy.orm
+
+from plaque_assay import cache, db_models, ingest, instrument, main, sidecar, utils
+from plaque_assay.db_uploader import AnalysisDatabaseUploader
+from plaque_assay.experiment import Experiment
+from plaque_assay.plate import Plate, process_plates
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # noqa: E402
+
+STAGES = ("ingest", "plate_qc", "fit", "results", "upload", "run")
+
+
+def make_database(workflow_ids: List[int]) -> sqlalchemy.engine.Engine:
+    """In-memory SQLite LIMS database, shared with upload threads"""
+    engine = sqlalchemy.create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=sqlalchemy.pool.StaticPool,
+    )
+    db_models.Base.metadata.create_all(engine)
+    with sqlalchemy.orm.Session(engine) as session:
+        session.add(
+            db_models.NE_available_strains(
+                mutant_strain=synthetic.VARIANT,
+                plate_id_1=synthetic.PLATE_PREFIXES[0],
+                plate_id_2=synthetic.PLATE_PREFIXES[1],
+            )
+        )
+        for workflow_id in workflow_ids:
+            session.add(
+                db_models.NE_workflow_tracking(
+                    master_plate=f"master_plate_{workflow_id}",
+                    start_date=datetime.now() - timedelta(days=1),
+                    no_of_variants=1,
+                    workflow_id=workflow_id,
+                )
+            )
+        session.commit()
+    return engine
+
+
+def best_time(
+    func: Callable, repeats: int, setup: Callable = lambda: None
+) -> Dict[str, float]:
+    """Time `func(setup())`, with `setup()` untimed"""
+    times = []
+    for _ in range(repeats):
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "median": float(np.median(times))}
+
+
+def run_benchmarks(
+    workflows: Dict[int, List[str]], repeats: int
+) -> Dict[str, Dict[str, float]]:
+    """Time each stage over all workflows
+
+    Returns
+    --------
+    dict
+        `{stage: {"best": seconds, "median": seconds}}`
+    """
+    plate_lists = list(workflows.values())
+    variant = synthetic.VARIANT
+    datasets = [main.read_plates(plate_list, variant) for plate_list in plate_lists]
+    experiments = [Experiment(dataset) for dataset in datasets]
+    results = [
+        main.analyse_dataset(plate_list, dataset)
+        for plate_list, dataset in zip(plate_lists, datasets)
+    ]
+
+    def ingest_all(_):
+        for plate_list in plate_lists:
+            main.read_plates(plate_list, variant)
+            for _ in ingest.iter_indexfiles(plate_list):
+                pass
+
+    def plate_qc_all(_):
+        for dataset in datasets:
+            plates = [
+                Plate(df, process=False)
+                for _, df in dataset.groupby("Plate_barcode", observed=True)
+            ]
+            process_plates(plates)
+
+    def fit_all(_):
+        for experiment in experiments:
+            experiment.make_samples()
+
+    def results_all(_):
+        for experiment in experiments:
+            experiment.get_normalised_data()
+            experiment.get_results_as_dataframe()
+            experiment.get_failures_as_dataframe()
+            experiment.get_model_parameters()
+
+    def new_database():
+        utils.invalidate_strain_index()
+        return make_database(list(workflows))
+
+    def upload_all(engine):
+        with sqlalchemy.orm.Session(engine) as session:
+            for plate_list, result in zip(plate_lists, results):
+                context = utils.get_run_context(plate_list, session)
+                main.upload(AnalysisDatabaseUploader(session), result, context)
+
+    def run_all(engine):
+        for plate_list in plate_lists:
+            main.run(plate_list, engine=engine)
+
+    stages = {
+        "ingest": (ingest_all, lambda: None),
+        "plate_qc": (plate_qc_all, lambda: None),
+        "fit": (fit_all, lambda: None),
+        "results": (results_all, lambda: None),
+        "upload": (upload_all, new_database),
+        "run": (run_all, new_database),
+    }
+    timings = {}
+    for name in STAGES:
+        func, setup = stages[name]
+        timings[name] = best_time(func, repeats, setup)
+        per_workflow = timings[name]["best"] / len(workflows)
+        print(f"{name:<10} {per_workflow * 1000:9.1f} ms/workflow")
+    return timings
+
+
+def environment() -> Dict[str, str]:
+    """Versions and git commit, saved with the results"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scipy": scipy.__version__,
+        "sqlalchemy": sqlalchemy.__version__,
+    }
+
+
+def compare(
+    timings: Dict[str, Dict[str, float]],
+    n_workflows: int,
+    baseline: Dict,
+    threshold: float,
+) -> List[str]:
+    """Print the time per workflow relative to the baseline for each stage
+
+    Returns
+    --------
+    list
+        stages slower than the baseline by more than `threshold`
+    """
+    regressions = []
+    print(f"\ncompared to {baseline['environment']['commit'][:10]}")
+    for name, timing in timings.items():
+        if name not in baseline["stages"]:
+            continue
+        baseline_best = baseline["stages"][name]["best"] / baseline["n_workflows"]
+        ratio = timing["best"] / n_workflows / baseline_best
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<10} {ratio:6.2f}x time{flag}")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workflows", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="save results as JSON")
+    parser.add_argument("--compare", help="JSON results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="fractional slowdown counted as a regression",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    for env in (cache.CACHE_DIR_ENV, sidecar.SIDECAR_ENV, instrument.PROFILE_JSON_ENV):
+        os.environ.pop(env, None)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workflows = synthetic.write_workflows(tmp_dir, args.workflows)
+        print(f"{args.workflows} synthetic workflows, best of {args.repeats}")
+        timings = run_benchmarks(workflows, args.repeats)
+    results = {
+        "environment": environment(),
+        "n_workflows": args.workflows,
+        "repeats": args.repeats,
+        "stages": timings,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results saved to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(timings, args.workflows, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,173 @@
+"""
+Benchmark the start-up cost of analysing a plate pair in a new process,
+as when the LIMS launches one process per plate pair.
+
+    python benchmarks/bench_startup.py [--repeats R]
+        [--output results.json] [--compare baseline.json] [--threshold 0.2]
+
+from the repository root, with plaque_assay installed.
+
+Each repeat runs `main.run()` on a synthetic workflow from `synthetic.py`
+in a new Python process, uploading to in-memory SQLite, and times:
+
+- `import`: `import plaque_assay`
+- `run`: `main.run()`
+- `first_result`: from starting the process to `main.run()` returning
+
+with an empty numba cache (`cold`), and with the cache filled by a
+previous run (`warm`). Times are the best of `--repeats`. `--output` and
+`--compare` are as for `bench_pipeline.py`, using the same threshold for
+regressions.
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# nothing else is imported at the top, so `import plaque_assay` is timed
+# from a new process
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("cold", "warm")
+PHASES = ("import", "run", "first_result")
+# modules which should not be imported by `import plaque_assay`
+LAZY_MODULES = ("numba", "matplotlib")
+
+
+def child(plate_list: List[str]) -> None:
+    """Run a plate pair and print the timings as JSON, run in a new process"""
+    start = time.perf_counter()
+    import plaque_assay
+
+    imported = time.perf_counter()
+    lazy = {name: name in sys.modules for name in LAZY_MODULES}
+    import bench_pipeline
+    import synthetic
+
+    engine = bench_pipeline.make_database([synthetic.FIRST_WORKFLOW_ID])
+    run_start = time.perf_counter()
+    plaque_assay.main.run(plate_list, engine=engine)
+    finished = time.time()
+    timings = {
+        "import": imported - start,
+        "run": time.perf_counter() - run_start,
+        "finished": finished,
+        "imported_on_import": lazy,
+    }
+    print(json.dumps(timings))
+
+
+def run_child(plate_list: List[str], numba_cache_dir: str) -> Dict:
+    """Time `child()` in a new Python process"""
+    env = dict(os.environ, NUMBA_CACHE_DIR=numba_cache_dir)
+    started = time.time()
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", *plate_list],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["first_result"] = timings.pop("finished") - started
+    return timings
+
+
+def run_benchmarks(
+    plate_list: List[str], repeats: int, tmp_dir: str
+) -> Dict[str, Dict[str, float]]:
+    """Time each phase with a cold and warm numba cache
+
+    Returns
+    --------
+    dict
+        `{scenario_phase: {"best": seconds, "median": seconds}}`
+    """
+    runs: Dict[str, List[Dict]] = {scenario: [] for scenario in SCENARIOS}
+    warm_cache = tempfile.mkdtemp(dir=tmp_dir)
+    # fill the cache for warm runs
+    run_child(plate_list, warm_cache)
+    for _ in range(repeats):
+        runs["cold"].append(run_child(plate_list, tempfile.mkdtemp(dir=tmp_dir)))
+        runs["warm"].append(run_child(plate_list, warm_cache))
+    for name, imported in runs["warm"][0]["imported_on_import"].items():
+        if imported:
+            print(f"warning: `import plaque_assay` imports {name}")
+    timings = {}
+    for scenario in SCENARIOS:
+        for phase in PHASES:
+            times = [timing[phase] for timing in runs[scenario]]
+            timings[f"{scenario}_{phase}"] = {
+                "best": min(times),
+                "median": statistics.median(times),
+            }
+        print(
+            f"{scenario:<5} "
+            + "  ".join(
+                f"{phase} {timings[f'{scenario}_{phase}']['best'] * 1000:7.1f} ms"
+                for phase in PHASES
+            )
+        )
+    return timings
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="save results as JSON")
+    parser.add_argument("--compare", help="JSON results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="fractional slowdown counted as a regression",
+    )
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.child:
+        child(args.child)
+        return None
+    import bench_pipeline
+    import synthetic
+    from plaque_assay import cache, instrument, priors, sidecar
+
+    # inherited by the child processes
+    for env in (
+        cache.CACHE_DIR_ENV,
+        sidecar.SIDECAR_ENV,
+        instrument.PROFILE_JSON_ENV,
+        priors.PRIORS_ENV,
+    ):
+        os.environ.pop(env, None)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workflows = synthetic.write_workflows(tmp_dir, 1)
+        (plate_list,) = workflows.values()
+        print(f"1 synthetic workflow, new process per run, best of {args.repeats}")
+        timings = run_benchmarks(plate_list, args.repeats, tmp_dir)
+    results = {
+        "environment": bench_pipeline.environment(),
+        "n_workflows": 1,
+        "repeats": args.repeats,
+        "stages": timings,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results saved to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if bench_pipeline.compare(timings, 1, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,105 @@
+"""
+Benchmark uploading the raw PlateResults and indexfile data for a plate
+pair from tests/test_data with `plaque_assay.bulk`, against the previous
+`fix_for_mysql()` null replacement and ORM `bulk_insert_mappings()` path.
+Reports the best time and the peak memory allocated during the upload.
+
+    python benchmarks/bench_upload.py [database_url]
+
+from the repository root, with plaque_assay installed. Defaults to a
+temporary SQLite file, a MySQL stand-in can be given as a SQLAlchemy
+url. Tables are created and dropped, so don't use the LIMS database.
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from glob import glob
+
+import numpy as np
+
+import sqlalchemy
+import sqlalchemy.orm
+
+from plaque_assay import db_models, ingest
+from plaque_assay.db_uploader import AnalysisDatabaseUploader
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PLATE_LIST = sorted(
+    glob(
+        os.path.join(
+            CURRENT_DIR,
+            os.pardir,
+            "tests",
+            "test_data",
+            "dilution_1_10",
+            "NA_raw_data_1283_Eng2",
+            "S*",
+        )
+    )
+)
+N_REPEATS = 5
+
+
+class PreviousUploader(AnalysisDatabaseUploader):
+    """uploads through the ORM in 1000 row slices"""
+
+    def bulk_insert_dataframe(self, model, df):
+        # previous `fix_for_mysql()`
+        df = df.replace({np.inf: None, -np.inf: None}).replace({np.nan: None})
+        for i in range(0, len(df), 1000):
+            self.session.bulk_insert_mappings(
+                model, df.iloc[i : i + 1000].to_dict(orient="records")
+            )
+
+
+def upload(Session, uploader_class, dataset, indexfiles, **kwargs):
+    with Session() as session:
+        uploader = uploader_class(session, **kwargs)
+        uploader.upload_plate_results(dataset)
+        uploader.upload_indexfiles(indexfiles)
+        session.rollback()
+
+
+def main():
+    if len(sys.argv) > 1:
+        url = sys.argv[1]
+    else:
+        url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+    engine = sqlalchemy.create_engine(url)
+    db_models.Base.metadata.create_all(engine)
+    Session = sqlalchemy.orm.sessionmaker(bind=engine)
+    dataset = ingest.read_data_from_list(PLATE_LIST)
+    indexfiles = ingest.read_indexfiles_from_list(PLATE_LIST)
+    dataset["variant"] = indexfiles["variant"] = "England2"
+    n_rows = len(dataset) + len(indexfiles)
+    print(f"{n_rows} rows to {engine.dialect.name}, best of {N_REPEATS}")
+    benchmarks = {
+        "bulk_insert_mappings (previous)": (PreviousUploader, {}),
+        "executemany": (AnalysisDatabaseUploader, {"load_data": False}),
+    }
+    if engine.dialect.name == "mysql":
+        benchmarks["LOAD DATA LOCAL INFILE"] = (
+            AnalysisDatabaseUploader,
+            {"load_data": True},
+        )
+    try:
+        for name, (uploader_class, kwargs) in benchmarks.items():
+
+            def func():
+                upload(Session, uploader_class, dataset, indexfiles, **kwargs)
+
+            best = min(timeit.repeat(func, number=1, repeat=N_REPEATS))
+            tracemalloc.start()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:<35} {best * 1000:8.1f} ms {peak / 1024 ** 2:6.1f} MB peak")
+    finally:
+        db_models.Base.metadata.drop_all(engine)
+
+
+if __name__ == "__main__":
+    main()
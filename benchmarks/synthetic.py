@@ -0,0 +1,245 @@
+"""
+Generate synthetic Phenix plate directories for benchmarking.
+
+Each workflow is a replicate pair of 384-well plates, laid out as in a
+real run: 4 dilutions of 96 samples with the virus-only and no-virus
+control wells. Samples have dose-response curves with random EC50s and
+hill slopes, including some with no and with complete inhibition, plus
+measurement noise, so curve fitting and QC take realistic paths.
+
+    python benchmarks/synthetic.py OUTPUT_DIR [n_workflows]
+
+from the repository root, with plaque_assay installed.
+"""
+
+import os
+import sys
+import uuid
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from plaque_assay import consts, utils
+
+# replicate plate prefixes, registered as "England2" in the test databases
+PLATE_PREFIXES = ("S01", "S02")
+VARIANT = "England2"
+TIMESTAMP = "2023-08-16T17_29_53"
+FIRST_WORKFLOW_ID = 900_000
+ODA_HOST = "10.6.58.91"
+
+PLATE_RESULTS_COLUMNS = [
+    "Row",
+    "Column",
+    "Plane",
+    "Timepoint",
+    *list(consts.PLATE_RESULTS_DTYPES)[2:],
+    "Global Image Binning",
+    "Height [µm]",
+    "Time [s]",
+    "Compound",
+    "Concentration",
+    "Cell Type",
+    "Cell Count",
+]
+INDEXFILE_COLUMNS = [
+    "Row",
+    "Column",
+    "Plane",
+    "Timepoint",
+    *list(consts.INDEXFILE_COLUMNS)[2:],
+]
+CHANNELS = ((1, "DAPI"), (2, "Alexa 488"))
+
+# (row, column) of every well on a 384-well plate
+ROWS_384, COLS_384 = np.divmod(np.arange(384), 24)
+ROWS_384 += 1
+COLS_384 += 1
+WELLS_96 = [
+    utils.well_384_to_96(utils.row_col_to_well(row, col))
+    for row, col in zip(ROWS_384, COLS_384)
+]
+DILUTIONS = np.array(
+    [
+        consts.PLATE_MAPPING[
+            utils.get_dilution_from_384_well_label(utils.row_col_to_well(row, col))
+        ]
+        for row, col in zip(ROWS_384, COLS_384)
+    ]
+)
+
+
+def sample_curves(rng: np.random.Generator) -> Dict[str, Tuple[float, float]]:
+    """Random `(ec50, hill_slope)` for each 96-well sample position"""
+    curves = {}
+    for well in set(WELLS_96):
+        kind = rng.random()
+        if kind < 0.1:
+            # no inhibition
+            ec50 = 1.0
+        elif kind < 0.2:
+            # complete inhibition
+            ec50 = 1e-6
+        else:
+            ec50 = 10 ** rng.uniform(-4, -2)
+        curves[well] = (ec50, rng.uniform(1, 3))
+    return curves
+
+
+def infected_fraction(
+    rng: np.random.Generator, curves: Dict[str, Tuple[float, float]]
+) -> np.ndarray:
+    """Fraction of cells infected in each well of a 384-well plate"""
+    fraction = np.empty(384)
+    for i, (well, dilution) in enumerate(zip(WELLS_96, DILUTIONS)):
+        ec50, hill_slope = curves[well]
+        fraction[i] = 1 / (1 + (dilution / ec50) ** hill_slope)
+    fraction[np.isin(WELLS_96, consts.VIRUS_ONLY_WELLS)] = 1.0
+    fraction[np.isin(WELLS_96, consts.NO_VIRUS_WELLS)] = 0.0
+    return np.clip(fraction + rng.normal(0, 0.03, 384), 0, None)
+
+
+def make_plate_results(
+    rng: np.random.Generator,
+    barcode: str,
+    curves: Dict[str, Tuple[float, float]],
+    n_fields: int = 1,
+) -> str:
+    """Contents of a PlateResults.txt file"""
+    plaque_area = 0.005 + 0.6 * infected_fraction(rng, curves)
+    cell_region_area = 3.7e6 * rng.normal(1, 0.03, 384)
+    dapi_mean = rng.normal(720, 20, 384)
+    lines = [
+        f"Database Name\t{ODA_HOST}",
+        f"Database Location\thttp://{ODA_HOST}/ODA/OdaService.asmx",
+        f"Evaluation Signature\t{uuid.UUID(int=int(rng.integers(2 ** 63)))}",
+        f"Plate Name\t{barcode}",
+        "Measurement\tMeasurement 1",
+        "Evaluation\tEvaluation1",
+        "",
+        "[Data]",
+        "\t".join(PLATE_RESULTS_COLUMNS) + "\t",
+    ]
+    for i in range(384):
+        values = [
+            ROWS_384[i],
+            COLS_384[i],
+            1,
+            0,
+            plaque_area[i] * 3.7e6,
+            rng.normal(700, 30),
+            rng.normal(230, 20),
+            round(rng.normal(680, 20)),
+            round(plaque_area[i] * 4.5e8),
+            dapi_mean[i],
+            rng.normal(240, 10),
+            round(dapi_mean[i] - 40),
+            round(cell_region_area[i] * 130),
+            cell_region_area[i],
+            plaque_area[i],
+            plaque_area[i] * rng.normal(1, 0.02),
+            n_fields,
+            2,
+            0,
+            0,
+            "",
+            "",
+            "",
+            "",
+        ]
+        lines.append("\t".join(str(value) for value in values) + "\t")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def make_indexfile(rng: np.random.Generator, n_fields: int = 1) -> str:
+    """Contents of an indexfile.txt file, a row per well, field and channel"""
+    measurement_id = uuid.UUID(int=int(rng.integers(2 ** 63)))
+    lines = ["\t".join(INDEXFILE_COLUMNS) + "\t"]
+    for row, col in zip(ROWS_384, COLS_384):
+        for field in range(1, n_fields + 1):
+            for channel_id, channel_name in CHANNELS:
+                image = "-".join(str(i) for i in rng.integers(0, 2000, 8))
+                values = [
+                    row,
+                    col,
+                    1,
+                    0,
+                    field,
+                    channel_id,
+                    channel_name,
+                    "Fluorescence",
+                    f"http://{ODA_HOST}/ODA/Images/C/{measurement_id}/{image}.tiff",
+                    "2.39190432382705E-06",
+                    "2.39190432382705E-06",
+                    1080,
+                    1080,
+                    0,
+                    0,
+                    "2023-08-16T17:30:21.027+01:00",
+                ]
+                lines.append("\t".join(str(value) for value in values) + "\t")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def write_workflow(
+    root_dir: str,
+    workflow_id: int,
+    rng: np.random.Generator,
+    prefixes: Sequence[str] = PLATE_PREFIXES,
+    n_fields: int = 1,
+) -> List[str]:
+    """Write a replicate pair of plate directories
+
+    Returns
+    --------
+    list
+        paths to the plate directories
+    """
+    curves = sample_curves(rng)
+    plate_list = []
+    for prefix in prefixes:
+        barcode = f"{prefix}{workflow_id:06d}"
+        plate_dir = os.path.join(root_dir, f"{barcode}__{TIMESTAMP}-Measurement 1")
+        evaluation_dir = os.path.join(plate_dir, "Evaluation1")
+        os.makedirs(evaluation_dir, exist_ok=True)
+        plate_results = make_plate_results(rng, barcode, curves, n_fields)
+        with open(
+            os.path.join(evaluation_dir, "PlateResults.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write(plate_results)
+        with open(os.path.join(plate_dir, "indexfile.txt"), "w", encoding="utf-8") as f:
+            f.write(make_indexfile(rng, n_fields))
+        plate_list.append(plate_dir)
+    return plate_list
+
+
+def write_workflows(
+    root_dir: str, n_workflows: int, seed: int = 0, n_fields: int = 1
+) -> Dict[int, List[str]]:
+    """Write plate pairs for `n_workflows` workflows
+
+    Parameters
+    -----------
+    root_dir : str
+    n_workflows : int
+    seed : int
+        random seed, the same seed gives the same plates
+    n_fields : int
+        imaged fields per well, only changes the size of the indexfiles
+
+    Returns
+    --------
+    dict
+        `{workflow_id: [plate_dir, plate_dir]}`
+    """
+    rng = np.random.default_rng(seed)
+    return {
+        workflow_id: write_workflow(root_dir, workflow_id, rng, n_fields=n_fields)
+        for workflow_id in range(FIRST_WORKFLOW_ID, FIRST_WORKFLOW_ID + n_workflows)
+    }
+
+
+if __name__ == "__main__":
+    n_workflows = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    workflows = write_workflows(sys.argv[1], n_workflows)
+    print(f"wrote {len(workflows)} workflows to {sys.argv[1]}")
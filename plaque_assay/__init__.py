@@ -1,5 +1,6 @@
-from plaque_assay import (consts, db_models, errors, experiment, failure,
-                          ingest, main, plate, qc_criteria, sample, stats,
-                          titration, utils)
+from plaque_assay import (bulk, cache, consts, db_models, errors, executor,
+                          experiment, failure, ingest, instrument, kernels,
+                          main, plate, priors, qc_criteria, sample, sidecar,
+                          stats, titration, utils)
 
-from .main import run
+from .main import run, run_batch
@@ -0,0 +1,240 @@
+"""
+Bulk loading of dataframes into LIMS tables.
+
+Rows are converted column-wise into tuples of python values, with NaN
+and inf replaced by `None` (as null), and inserted with SQLAlchemy Core
+`insert()` executemany calls in chunks. Chunks are sized from the
+estimated row width unless a chunk size is given, so wide rows such as
+the indexfile URLs are sent in fewer rows per statement.
+
+On MySQL, `LOAD DATA LOCAL INFILE` can be used instead by setting the
+`PLAQUE_ASSAY_LOAD_DATA` environment variable, which also enables
+`local_infile` on connections made with `plaque_assay.main.create_engine()`.
+Other databases, such as the SQLite databases used in testing, always
+use executemany.
+"""
+
+import logging
+import os
+import tempfile
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+LOAD_DATA_ENV = "PLAQUE_ASSAY_LOAD_DATA"
+# approximate size of an executemany chunk, well under the default MySQL
+# max_allowed_packet of 4MB once rendered as SQL
+TARGET_CHUNK_BYTES = 1024 ** 2
+MIN_CHUNK_SIZE = 100
+MAX_CHUNK_SIZE = 20_000
+# number of rows used to estimate the width of string columns
+N_SAMPLE_ROWS = 200
+
+
+def load_data_enabled() -> bool:
+    """Whether `LOAD DATA LOCAL INFILE` is enabled in the environment"""
+    return os.environ.get(LOAD_DATA_ENV, "").lower() in ("1", "true", "yes")
+
+
+def table_columns(table: sqlalchemy.Table, df: pd.DataFrame) -> List[str]:
+    """Dataframe columns which are also in the table, in dataframe order.
+
+    Other columns are ignored, as with `Session.bulk_insert_mappings()`.
+    """
+    return [col for col in df.columns if col in table.c]
+
+
+def dataframe_rows(df: pd.DataFrame, columns: Sequence[str]) -> List[Tuple]:
+    """Convert dataframe columns to a list of row tuples.
+
+    Values are python objects, with NaN, inf and other missing values
+    replaced by `None`. This replaces `DataFrame.replace()`, which copies
+    the whole dataframe to object dtype, by working on one column's numpy
+    array at a time: float columns are masked with `np.isfinite()`,
+    integer and boolean columns can't hold nulls so are converted
+    directly, and only other columns are checked with `pd.isna()`.
+
+    Parameters
+    -----------
+    df : pandas.DataFrame
+    columns : list of str
+
+    Returns
+    --------
+    list of tuples
+    """
+    return list(zip(*(_column_values(df[col]) for col in columns)))
+
+
+def _column_values(series: pd.Series) -> List:
+    kind = series.dtype.kind
+    if kind == "f":
+        arr = series.to_numpy(dtype=float, na_value=np.nan)
+        values = arr.tolist()
+        for idx in np.flatnonzero(~np.isfinite(arr)):
+            values[idx] = None
+        return values
+    if kind in "biu" and not isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+        return series.to_numpy().tolist()
+    values = series.to_numpy(dtype=object, copy=True)
+    missing = pd.isna(values)
+    if missing.any():
+        values[missing] = None
+    return values.tolist()
+
+
+def adaptive_chunk_size(
+    df: pd.DataFrame, target_bytes: int = TARGET_CHUNK_BYTES
+) -> int:
+    """Number of rows per chunk so a chunk is about `target_bytes`.
+
+    Numeric columns are counted by item size, string columns by the mean
+    length of the first `N_SAMPLE_ROWS` values.
+
+    Parameters
+    -----------
+    df : pandas.DataFrame
+    target_bytes : int
+
+    Returns
+    --------
+    int
+    """
+    row_bytes = 0
+    sample = df.head(N_SAMPLE_ROWS)
+    for col in df.columns:
+        if sample[col].dtype.kind in "biuf":
+            row_bytes += sample[col].dtype.itemsize
+        else:
+            lengths = sample[col].astype(str).str.len().fillna(0)
+            row_bytes += int(lengths.mean()) if len(lengths) else 0
+    n_rows = target_bytes // max(row_bytes, 1)
+    return int(np.clip(n_rows, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE))
+
+
+def row_chunks(
+    df: pd.DataFrame, columns: Sequence[str], chunk_size: int
+) -> Iterator[List[Tuple]]:
+    """Rows from `dataframe_rows()`, converted `chunk_size` rows at a time
+
+    Only one chunk of python objects exists at a time, rather than a copy
+    of the whole dataframe.
+    """
+    for i in range(0, len(df), chunk_size):
+        yield dataframe_rows(df.iloc[i : i + chunk_size], columns)
+
+
+def executemany(
+    connection: sqlalchemy.engine.Connection,
+    table: sqlalchemy.Table,
+    columns: Sequence[str],
+    chunks: Iterable[List[Tuple]],
+) -> None:
+    """Insert each chunk of rows with a Core `insert()` executemany call"""
+    statement = table.insert()
+    for chunk in chunks:
+        connection.execute(statement, [dict(zip(columns, row)) for row in chunk])
+
+
+def load_data_local_infile(
+    connection: sqlalchemy.engine.Connection,
+    table: sqlalchemy.Table,
+    columns: Sequence[str],
+    chunks: Iterable[List[Tuple]],
+) -> None:
+    """Insert chunks of rows with MySQL `LOAD DATA LOCAL INFILE` from a temporary file
+
+    Requires `local_infile` to be enabled on both the client connection
+    and the server.
+    """
+    quote = connection.dialect.identifier_preparer.quote
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=".tsv", encoding="utf-8", newline="\n", delete=False
+    ) as f:
+        for chunk in chunks:
+            for row in chunk:
+                f.write("\t".join(_escape(value) for value in row))
+                f.write("\n")
+    try:
+        connection.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {quote(table.name)} "
+            "CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+            "LINES TERMINATED BY '\\n' "
+            f"({', '.join(quote(col) for col in columns)})",
+            (f.name,),
+        )
+    finally:
+        os.remove(f.name)
+
+
+def _escape(value) -> str:
+    """format a value for a `LOAD DATA` file with the default escaping"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, str):
+        return (
+            value.replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+    if isinstance(value, (bool, np.bool_)):
+        return str(int(value))
+    return str(value)
+
+
+def insert_dataframe(
+    connection: sqlalchemy.engine.Connection,
+    table: sqlalchemy.Table,
+    df: pd.DataFrame,
+    chunk_size: Optional[int] = None,
+    load_data: bool = False,
+) -> int:
+    """Insert dataframe rows into a table.
+
+    Parameters
+    -----------
+    connection : sqlalchemy.engine.Connection
+        typically `Session.connection()` so rows are inserted in the
+        session's transaction
+    table : sqlalchemy.Table
+    df : pandas.DataFrame
+        columns not in the table are ignored
+    chunk_size : int, optional
+        rows converted and sent per executemany call, if `None` then
+        chosen with `adaptive_chunk_size()`
+    load_data : bool
+        use `LOAD DATA LOCAL INFILE` if the connection is to MySQL,
+        otherwise falls back to executemany.
+
+    Returns
+    --------
+    int
+        number of rows inserted
+    """
+    columns = table_columns(table, df)
+    if len(df) == 0:
+        return 0
+    if chunk_size is None:
+        chunk_size = adaptive_chunk_size(df[columns])
+    if load_data and connection.dialect.name == "mysql":
+        try:
+            load_data_local_infile(
+                connection, table, columns, row_chunks(df, columns, chunk_size)
+            )
+            return len(df)
+        except sqlalchemy.exc.DBAPIError as error:
+            logging.warning(
+                "LOAD DATA LOCAL INFILE into %s failed, using executemany: %s",
+                table.name,
+                error,
+            )
+    elif load_data:
+        logging.debug(
+            "LOAD DATA not supported by %s, using executemany", connection.dialect.name
+        )
+    executemany(connection, table, columns, row_chunks(df, columns, chunk_size))
+    return len(df)
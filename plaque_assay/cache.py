@@ -0,0 +1,256 @@
+"""
+Persistent on-disk cache of parsed datasets and model fits.
+
+Entries are content-addressed: the key is a hash of the inputs, i.e the
+PlateResults.txt bytes and the columns read for parsed datasets, and
+the fitted values for model results, together with the `qc_criteria`
+and `stats` fitting configuration. Changing any of these gives a new key, so stale entries
+are never returned and are eventually evicted.
+
+The cache is only used when the `PLAQUE_ASSAY_CACHE_DIR` environment
+variable is set. The maximum size in bytes can be set with
+`PLAQUE_ASSAY_CACHE_MAX_BYTES`, once exceeded the least recently used
+entries are removed.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import scipy
+
+from plaque_assay import qc_criteria
+from plaque_assay import stats
+
+CACHE_DIR_ENV = "PLAQUE_ASSAY_CACHE_DIR"
+CACHE_MAX_BYTES_ENV = "PLAQUE_ASSAY_CACHE_MAX_BYTES"
+DEFAULT_MAX_BYTES = 1024 ** 3
+# bump when the format of cached values changes
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".pkl"
+
+# caches from `get_cache()`, by directory and maximum size
+_CACHES: Dict[Tuple[str, int], "ResultCache"] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+class ResultCache:
+    """Directory of pickled values, evicted least recently used first.
+
+    Parameters
+    -----------
+    cache_dir : str
+        directory to store entries, created if it doesn't exist
+    max_bytes : int
+        maximum total size of entries
+
+    Attributes
+    -----------
+    hits : int
+    misses : int
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # estimated total size of entries, so the directory is only
+        # scanned when it may be over `max_bytes`. Other processes can
+        # write to the same directory, so this is corrected by `evict()`.
+        self._size: Optional[int] = None
+        self._size_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def _entries(self):
+        return [
+            entry
+            for entry in os.scandir(self.cache_dir)
+            if entry.is_file() and entry.name.endswith(CACHE_SUFFIX)
+        ]
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return cached value, or `None` if not in the cache
+
+        Parameters
+        -----------
+        key : str
+
+        Returns
+        --------
+        cached value or None
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            logging.warning("removing unreadable cache entry %s", path)
+            self._remove(path)
+            self.misses += 1
+            return None
+        # modification time records last use for eviction
+        os.utime(path)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Store value in the cache, then evict old entries if over size
+
+        The total size is tracked as entries are written, so the cache
+        directory is only scanned when the size may exceed `max_bytes`.
+
+        Parameters
+        -----------
+        key : str
+        value : picklable object
+
+        Returns
+        --------
+        None
+        """
+        # write to a temporary file then rename so concurrent readers
+        # never see a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        with self._size_lock:
+            if self._size is None:
+                self._size = sum(entry.stat().st_size for entry in self._entries())
+            else:
+                self._size += size
+            over_size = self._size > self.max_bytes
+        if over_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until within `max_bytes`"""
+        with self._size_lock:
+            entries = [(entry, entry.stat()) for entry in self._entries()]
+            total = sum(stat.st_size for _, stat in entries)
+            entries.sort(key=lambda entry_stat: entry_stat[1].st_mtime)
+            for entry, stat in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(entry.path)
+                total -= stat.st_size
+            self._size = total
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._size_lock:
+            for entry in self._entries():
+                self._remove(entry.path)
+            self._size = 0
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def get_cache() -> Optional[ResultCache]:
+    """Return the cache set by the environment, or `None` if not enabled
+
+    The same `ResultCache` is returned while the environment is
+    unchanged, so its size is only measured once per process.
+
+    Returns
+    --------
+    ResultCache or None
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    max_bytes = int(os.environ.get(CACHE_MAX_BYTES_ENV, DEFAULT_MAX_BYTES))
+    key = (cache_dir, max_bytes)
+    with _CACHES_LOCK:
+        result_cache = _CACHES.get(key)
+        if result_cache is None:
+            result_cache = ResultCache(cache_dir, max_bytes)
+            _CACHES[key] = result_cache
+    return result_cache
+
+
+def config_fingerprint() -> str:
+    """Representation of the QC and model fitting configuration.
+
+    This is read when called rather than on import, so changes to
+    `qc_criteria` at runtime are reflected in cache keys. Changes to
+    the fitting code are covered by `stats.FIT_VERSION`, and the scipy
+    version is included as its optimiser does the fitting.
+
+    Returns
+    --------
+    str
+    """
+    config = {
+        "version": CACHE_VERSION,
+        "low_cells_image_region_area_low": qc_criteria.low_cells_image_region_area_low,
+        "low_cells_image_region_area_high": qc_criteria.low_cells_image_region_area_high,
+        "infection_rate_default": qc_criteria.infection_rate.default_factory(),
+        "infection_rate": sorted(qc_criteria.infection_rate.items()),
+        "p0": stats.P0,
+        "bounds": stats.BOUNDS,
+        "maxfev": stats.MAXFEV,
+        "collapsed_hill_slope": stats.COLLAPSED_HILL_SLOPE,
+        "fit_version": stats.FIT_VERSION,
+        "scipy": scipy.__version__,
+    }
+    return repr(config)
+
+
+def make_key(*parts: Any) -> str:
+    """Hash parts into a cache key
+
+    Parts can be bytes, numpy arrays, or anything with a stable `repr()`.
+    Sequences of these are hashed element-wise.
+
+    Returns
+    --------
+    str
+        hex digest
+    """
+    digest = hashlib.sha256()
+    _update(digest, parts)
+    return digest.hexdigest()
+
+
+def _update(digest, part: Any) -> None:
+    if isinstance(part, bytes):
+        digest.update(b"b%d:" % len(part))
+        digest.update(part)
+    elif isinstance(part, np.ndarray):
+        part = np.ascontiguousarray(part)
+        digest.update(f"a{part.dtype.str}{part.shape}:".encode())
+        digest.update(part.tobytes())
+    elif isinstance(part, (list, tuple)):
+        digest.update(b"l%d:" % len(part))
+        for item in part:
+            _update(digest, item)
+    else:
+        text = repr(part).encode()
+        digest.update(b"r%d:" % len(text))
+        digest.update(text)
@@ -17,6 +17,46 @@ UNWANTED_METADATA = [
     "Cell Count",
 ]
 
+# columns read from the Phenix PlateResults.txt files and their types,
+# everything else in the file is unused
+PLATE_RESULTS_DTYPES = {
+    "Row": "int64",
+    "Column": "int64",
+    "Viral Plaques (global) - Area of Viral Plaques Area [µm²] - Mean per Well": "float64",
+    "Viral Plaques (global) - Intensity Viral Plaques Alexa 488 (global) Mean - Mean per Well": "float64",
+    "Viral Plaques (global) - Intensity Viral Plaques Alexa 488 (global) StdDev - Mean per Well": "float64",
+    "Viral Plaques (global) - Intensity Viral Plaques Alexa 488 (global) Median - Mean per Well": "float64",
+    "Viral Plaques (global) - Intensity Viral Plaques Alexa 488 (global) Sum - Mean per Well": "float64",
+    "Cells - Intensity Image Region DAPI (global) Mean - Mean per Well": "float64",
+    "Cells - Intensity Image Region DAPI (global) StdDev - Mean per Well": "float64",
+    "Cells - Intensity Image Region DAPI (global) Median - Mean per Well": "float64",
+    "Cells - Intensity Image Region DAPI (global) Sum - Mean per Well": "float64",
+    "Cells - Image Region Area [µm²] - Mean per Well": "float64",
+    "Normalised Plaque area": "float64",
+    "Normalised Plaque intensity": "float64",
+    # blank in partially imaged wells, so float to hold NaN
+    "Number of Analyzed Fields": "float64",
+}
+
+# columns read from the Phenix indexfile.txt files, with their names in
+# the NE_raw_index table and their types
+INDEXFILE_COLUMNS = {
+    "Row": ("row", "int64"),
+    "Column": ("column", "int64"),
+    "Field": ("field", "int64"),
+    "Channel ID": ("channel_id", "int64"),
+    "Channel Name": ("channel_name", "str"),
+    "Channel Type": ("channel_type", "str"),
+    "URL": ("url", "str"),
+    "ImageResolutionX [m]": ("image_resolutionx", "float64"),
+    "ImageResolutionY [m]": ("image_resolutiony", "float64"),
+    "ImageSizeX": ("image_sizex", "int64"),
+    "ImageSizeY": ("image_sizey", "int64"),
+    "PositionX [m]": ("positionx", "float64"),
+    "PositionY [m]": ("positiony", "float64"),
+    "Time Stamp": ("time_stamp", "str"),
+}
+
 DILUTION_1 = 40
 DILUTION_2 = 400
 DILUTION_3 = 4000
@@ -1,45 +1,171 @@
 import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
 
 import pandas as pd
-import numpy as np
 
+from plaque_assay import bulk
+from plaque_assay import consts
 from plaque_assay import db_models
+from plaque_assay import instrument
 from plaque_assay import utils
 
 
 class BaseDatabaseUploader:
-    """Base class for DataBaseUploader and TitrationDatabaseUploader"""
-
-    def __init__(self, session):
+    """Base class for DataBaseUploader and TitrationDatabaseUploader
+
+    Parameters
+    -----------
+    session : sqlalchemy.orm.Session
+    chunk_size : int, optional
+        rows per insert statement for bulk uploads, default is
+        chosen from the size of the rows, see `plaque_assay.bulk`.
+    load_data : bool, optional
+        use MySQL `LOAD DATA LOCAL INFILE` for bulk uploads, default is
+        set by the `PLAQUE_ASSAY_LOAD_DATA` environment variable.
+    """
+
+    def __init__(
+        self,
+        session,
+        chunk_size: Optional[int] = None,
+        load_data: Optional[bool] = None,
+    ):
         self.session = session
+        self.chunk_size = chunk_size
+        if load_data is None:
+            load_data = bulk.load_data_enabled()
+        self.load_data = load_data
 
-    @staticmethod
-    def fix_for_mysql(df: pd.DataFrame) -> pd.DataFrame:
+    def bulk_insert_dataframe(self, model, df: pd.DataFrame) -> None:
         """
-        Replace NaN and inf values with None, as these cannot be used
-        with MySQL and None values are converted to null
+        Insert rows of a dataframe with `plaque_assay.bulk.insert_dataframe()`
+
+        NaN and inf values are inserted as null, as these cannot be
+        used with MySQL.
 
         Parameters
         ----------
+        model : db_models.Base
+            table class from `plaque_assay.db_models`
         df : pd.DataFrame
+            with column names matching the table's columns
 
         Returns
         --------
-        pd.DataFrame
+        None
         """
-        return df.replace({np.inf: None, -np.inf: None}).replace({np.nan: None})
+        with instrument.timer("bulk_insert"):
+            n_rows = bulk.insert_dataframe(
+                self.session.connection(),
+                model.__table__,
+                df,
+                chunk_size=self.chunk_size,
+                load_data=self.load_data,
+            )
+        instrument.count(f"rows_inserted.{model.__tablename__}", n_rows)
 
     def commit(self) -> None:
         """commit data to LIMS serology database"""
-        self.session.commit()
+        with instrument.timer("commit"):
+            self.session.commit()
+
+
+class UploadQueue:
+    """Run uploads in a background thread while analysis continues.
+
+    Tasks run one at a time in the order they were submitted, in a
+    single thread which is the only user of the uploader's session
+    until the queue is closed. If a task fails then later tasks are
+    skipped and the session is rolled back, so the uploads are still a
+    single all-or-nothing transaction committed by the last task.
+
+    Use as a context manager, which closes the queue on exit, or if
+    the block raises an exception then pending tasks are skipped and the
+    session is rolled back.
+
+    Parameters
+    -----------
+    uploader : BaseDatabaseUploader
+    """
+
+    def __init__(self, uploader: BaseDatabaseUploader):
+        self.uploader = uploader
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="plaque_assay_upload"
+        )
+        self._cancelled = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def __enter__(self) -> "UploadQueue":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.cancel()
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """Queue `func(*args, **kwargs)` to run in the upload thread
+
+        Arguments must not be modified until the task has run.
+
+        Parameters
+        -----------
+        func : callable
+
+        Returns
+        --------
+        concurrent.futures.Future
+        """
+        return self._executor.submit(self._run, func, args, kwargs)
+
+    def _run(self, func: Callable, args, kwargs):
+        if self._cancelled.is_set() or self._error is not None:
+            logging.debug("skipping upload task %s", func.__qualname__)
+            return None
+        try:
+            return func(*args, **kwargs)
+        except BaseException as error:
+            logging.error("upload task %s failed, rolling back", func.__qualname__)
+            self._error = error
+            self.uploader.session.rollback()
+            raise
+
+    def close(self) -> None:
+        """Wait for all tasks to finish
+
+        Raises
+        -------
+        Exception
+            the first exception raised by a task, after which the
+            session was rolled back
+        """
+        with instrument.timer("upload_wait"):
+            self._executor.shutdown(wait=True)
+        if self._error is not None:
+            raise self._error
+
+    def cancel(self) -> None:
+        """Skip pending tasks, wait for a running task, then roll back"""
+        self._cancelled.set()
+        self._executor.shutdown(wait=True)
+        self.uploader.session.rollback()
 
 
 class AnalysisDatabaseUploader(BaseDatabaseUploader):
     """analysis-specific database uploader"""
 
-    def __init__(self, session):
-        super().__init__(session)
+    def __init__(
+        self,
+        session,
+        chunk_size: Optional[int] = None,
+        load_data: Optional[bool] = None,
+    ):
+        super().__init__(session, chunk_size, load_data)
 
     def already_uploaded(self, workflow_id: int, variant: str) -> bool:
         """
@@ -69,69 +195,6 @@ class AnalysisDatabaseUploader(BaseDatabaseUploader):
         )
         return result is not None
 
-    def is_final_upload(self, workflow_id: int) -> bool:
-        """
-        This determines if a given workflow_id is the last to be
-        uploaded for that workflow_id. This is determined by the
-        number of unique variants for a workflow_id currently in the
-        LIMS database. If this is 1 short of the expected number, then
-        we can determine the current upload is the final one.
-
-        Parameters
-        -----------
-        workflow_id: int
-
-        Returns
-        ---------
-        bool
-            whether or not this is the final upload
-
-        Raises
-        ------
-        RuntimeError
-            when trying to upload more variants than specified in the
-            workflow_tracking LIMS database table.
-        """
-        # get expected number of variants from NE_workflow_tracking
-        # fmt: off
-        expected = (
-            self.session
-            .query(db_models.NE_workflow_tracking)
-            .filter(db_models.NE_workflow_tracking.workflow_id == workflow_id)
-            .first()
-        )
-        # get number of uploaded variants from NE_final_results
-        current_variants = (
-            self.session
-            .query(db_models.NE_final_results.variant)
-            .filter(db_models.NE_final_results.workflow_id == workflow_id)
-        )
-        # fmt: on
-        current_n_variants = current_variants.distinct().count()
-        # NOTE: the sqlalchemy queries are reading from NE_final_results data
-        # that includes results from this session that have not yet been
-        # committed, and as is_final_upload() is called *after*
-        # upload_final_results(), we pretend the results are already in the
-        # database.
-        is_final = int(expected.no_of_variants) == int(current_n_variants)
-        if int(current_n_variants) > int(expected.no_of_variants):
-            raise RuntimeError(
-                f"unexpected no. of variants {current_n_variants}, expecting max of {expected.no_of_variants}"
-            )
-        logging.debug(f"expected no. of variants: {expected.no_of_variants}")
-        logging.debug(
-            f"current no. uploaded variants: {current_n_variants}: {current_variants}"
-        )
-        if is_final:
-            logging.info(
-                f"Final variant upload, marking workflow {workflow_id} as complete"
-            )
-        else:
-            logging.info(
-                f"Not final variant upload for workflow {workflow_id}, this is variant {current_n_variants}/{expected.no_of_variants}"
-            )
-        return is_final
-
     def upload_plate_results(self, plate_results_dataset: pd.DataFrame) -> None:
         """Upload raw concatenated data into database.
 
@@ -175,15 +238,16 @@ class AnalysisDatabaseUploader(BaseDatabaseUploader):
         plate_results_dataset.rename(columns=rename_dict, inplace=True)
         # filter to only desired columns
         plate_results_dataset = plate_results_dataset[list(rename_dict.values())]
+        # read as float so blanks are NaN, but stored as integers
+        plate_results_dataset["number_analyzed_fields"] = plate_results_dataset[
+            "number_analyzed_fields"
+        ].astype("Int64")
         workflow_id = [int(i[3:]) for i in plate_results_dataset["plate_barcode"]]
         plate_results_dataset["workflow_id"] = workflow_id
         plate_results_dataset["well"] = utils.unpad_well_col(
             plate_results_dataset["well"]
         )
-        plate_results_dataset = self.fix_for_mysql(plate_results_dataset)
-        self.session.bulk_insert_mappings(
-            db_models.NE_raw_results, plate_results_dataset.to_dict(orient="records")
-        )
+        self.bulk_insert_dataframe(db_models.NE_raw_results, plate_results_dataset)
 
     def upload_indexfiles(self, indexfiles_dataset: pd.DataFrame) -> None:
         """Upload indexfiles from the Phenix into the database
@@ -203,36 +267,39 @@ class AnalysisDatabaseUploader(BaseDatabaseUploader):
         None
         """
         indexfiles_dataset = indexfiles_dataset.copy()
-        rename_dict = {
-            "Row": "row",
-            "Column": "column",
-            "Field": "field",
-            "Channel ID": "channel_id",
-            "Channel Name": "channel_name",
-            "Channel Type": "channel_type",
-            "URL": "url",
-            "ImageResolutionX [m]": "image_resolutionx",
-            "ImageResolutionY [m]": "image_resolutiony",
-            "ImageSizeX": "image_sizex",
-            "ImageSizeY": "image_sizey",
-            "PositionX [m]": "positionx",
-            "PositionY [m]": "positiony",
-            "Time Stamp": "time_stamp",
-            "Plate_barcode": "plate_barcode",
-            "variant": "variant",  # not renamed, just to keep it
-        }
+        rename_dict = {col: name for col, (name, _) in consts.INDEXFILE_COLUMNS.items()}
+        rename_dict["Plate_barcode"] = "plate_barcode"
+        rename_dict["variant"] = "variant"  # not renamed, just to keep it
         indexfiles_dataset.rename(columns=rename_dict, inplace=True)
         # filter to only desired columns
         indexfiles_dataset = indexfiles_dataset[list(rename_dict.values())]
         # get workflow ID
         workflow_id = [int(i[3:]) for i in indexfiles_dataset["plate_barcode"]]
         indexfiles_dataset["workflow_id"] = workflow_id
-        indexfiles_dataset = self.fix_for_mysql(indexfiles_dataset)
-        for i in range(0, len(indexfiles_dataset), 1000):
-            df_slice = indexfiles_dataset.iloc[i : i + 1000]
-            self.session.bulk_insert_mappings(
-                db_models.NE_raw_index, df_slice.to_dict(orient="records")
-            )
+        self.bulk_insert_dataframe(db_models.NE_raw_index, indexfiles_dataset)
+
+    def upload_indexfile_batches(
+        self, batches: Iterable[pd.DataFrame], variant: str
+    ) -> None:
+        """Upload indexfiles streamed from `plaque_assay.ingest.iter_indexfiles()`
+
+        Each batch is uploaded as it is read, so the indexfiles are never
+        held in memory all at once.
+
+        Parameters
+        ----------
+        batches : iterable of pandas.DataFrame
+            from `plaque_assay.ingest.iter_indexfiles()`
+        variant : str
+
+        Returns
+        -------
+        None
+        """
+        for batch in batches:
+            batch["workflow_id"] = batch["plate_barcode"].str[3:].astype(int)
+            batch["variant"] = variant
+            self.bulk_insert_dataframe(db_models.NE_raw_index, batch)
 
     def upload_normalised_results(self, norm_results: pd.DataFrame) -> None:
         """Upload normalised results into the database.
@@ -266,10 +333,7 @@ class AnalysisDatabaseUploader(BaseDatabaseUploader):
         assert len(set(workflow_id)) == 1
         norm_results["workflow_id"] = workflow_id
         norm_results["well"] = utils.unpad_well_col(norm_results["well"])
-        norm_results = self.fix_for_mysql(norm_results)
-        self.session.bulk_insert_mappings(
-            db_models.NE_normalized_results, norm_results.to_dict(orient="records")
-        )
+        self.bulk_insert_dataframe(db_models.NE_normalized_results, norm_results)
 
     def upload_final_results(self, results: pd.DataFrame) -> None:
         """Upload final results to database
@@ -292,10 +356,7 @@ class AnalysisDatabaseUploader(BaseDatabaseUploader):
         assert results["variant"].nunique() == 1
         results["workflow_id"] = results["experiment"].astype(int)
         results["well"] = utils.unpad_well_col(results["well"])
-        results = self.fix_for_mysql(results)
-        self.session.bulk_insert_mappings(
-            db_models.NE_final_results, results.to_dict(orient="records")
-        )
+        self.bulk_insert_dataframe(db_models.NE_final_results, results)
 
     def upload_failures(self, failures: pd.DataFrame) -> None:
         """Upload failure information to database
@@ -312,9 +373,7 @@ class AnalysisDatabaseUploader(BaseDatabaseUploader):
         if failures.shape[0] > 0:
             assert failures["experiment"].nunique() == 1
             failures["workflow_id"] = failures["experiment"].astype(int)
-            self.session.bulk_insert_mappings(
-                db_models.NE_failed_results, failures.to_dict(orient="records")
-            )
+            self.bulk_insert_dataframe(db_models.NE_failed_results, failures)
 
     def upload_model_parameters(self, model_parameters: pd.DataFrame) -> None:
         """Upload model parameters to database
@@ -329,18 +388,15 @@ class AnalysisDatabaseUploader(BaseDatabaseUploader):
         """
         model_parameters = model_parameters.copy()
         model_parameters.rename(columns={"experiment": "workflow_id"}, inplace=True)
-        model_parameters = self.fix_for_mysql(model_parameters)
         model_parameters["well"] = utils.unpad_well_col(model_parameters["well"])
-        self.session.bulk_insert_mappings(
-            db_models.NE_model_parameters, model_parameters.to_dict(orient="records")
-        )
+        self.bulk_insert_dataframe(db_models.NE_model_parameters, model_parameters)
 
     def update_workflow_tracking(self, workflow_id: int) -> None:
         """Update workflow_tracking table to indicate all variants for
         a workflow have been uploaded.
 
         This doesn't check that a workflow is complete, that is handled
-        by `DatabaseUploader.is_final_upload()`.
+        by `plaque_assay.utils.RunContext.is_final_upload()`.
 
         Parameters
         -----------
@@ -0,0 +1,137 @@
+"""
+Fit samples in parallel across a process pool.
+
+Only the dilution and percentage infected arrays for each sample are sent
+to the worker processes, which return `plaque_assay.stats.ModelResults`.
+The `Sample` objects are then built in the parent process, in the same
+order as the input.
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from plaque_assay import cache
+from plaque_assay import instrument
+from plaque_assay import stats
+
+
+# number of samples sent to a worker process in a single task
+DEFAULT_CHUNKSIZE = 32
+
+
+def fit_samples(
+    names: Sequence[str],
+    dilutions: Sequence[np.ndarray],
+    values: Sequence[np.ndarray],
+    batch_fit: bool = True,
+    n_workers: Optional[int] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    p0s: Optional[Sequence[Optional[Sequence[float]]]] = None,
+) -> List[stats.ModelResults]:
+    """Calculate model results for many samples.
+
+    Parameters
+    -----------
+    names : list of str
+        sample names, typically well labels
+    dilutions : list of array-like
+        dilution values for each sample
+    values : list of array-like
+        percentage infected values for each sample
+    batch_fit : bool
+        if `True` then samples within a chunk are fitted and checked with
+        `plaque_assay.stats.calc_model_results_batch()`, otherwise
+        each sample is fitted with `plaque_assay.stats.calc_model_results()`.
+    n_workers : int, optional
+        number of worker processes. If `None` or 1 then all samples are
+        fitted in the current process. If 0 then uses the number
+        of available CPUs.
+    chunksize : int
+        number of samples sent to a worker process at a time.
+    p0s : list, optional
+        initial guess of the model parameters for each sample, or `None`
+        for samples which start from the default, see
+        `plaque_assay.priors.PriorStore`.
+
+    Notes
+    ------
+    If the cache is enabled, the results are keyed on the sample names
+    and values, `batch_fit`, `p0s`, and the fitting and QC configuration.
+
+    Returns
+    --------
+    list
+        `plaque_assay.stats.ModelResults` for each sample, in the same
+        order as `names`.
+    """
+    result_cache = cache.get_cache()
+    if result_cache is not None:
+        key = cache.make_key(
+            "model_results",
+            cache.config_fingerprint(),
+            batch_fit,
+            [str(name) for name in names],
+            [np.asarray(d, dtype=float) for d in dilutions],
+            [np.asarray(v, dtype=float) for v in values],
+            p0s,
+        )
+        cached = result_cache.get(key)
+        if cached is not None:
+            logging.info("using cached model results for %d samples", len(cached))
+            instrument.count("model_results_cache_hits")
+            return cached
+    chunks = [
+        (
+            list(names[i : i + chunksize]),
+            [np.asarray(d, dtype=float) for d in dilutions[i : i + chunksize]],
+            [np.asarray(v, dtype=float) for v in values[i : i + chunksize]],
+            batch_fit,
+            None if p0s is None else list(p0s[i : i + chunksize]),
+        )
+        for i in range(0, len(names), chunksize)
+    ]
+    if n_workers == 0:
+        n_workers = os.cpu_count()
+    with instrument.timer("fit_samples"):
+        if n_workers is None or n_workers <= 1 or len(chunks) <= 1:
+            chunk_results = [_fit_chunk(chunk)[0] for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(n_workers, len(chunks))) as pool:
+                # map() returns results in submission order
+                chunk_results = []
+                for chunk_result, fits in pool.map(_fit_chunk, chunks):
+                    chunk_results.append(chunk_result)
+                    # fits are recorded in the worker process
+                    instrument.RECORDER.fits.extend(fits)
+    results = [result for chunk in chunk_results for result in chunk]
+    instrument.count("samples_fitted", len(results))
+    if result_cache is not None:
+        result_cache.put(key, results)
+    return results
+
+
+def _fit_chunk(
+    chunk: Tuple[List[str], List[np.ndarray], List[np.ndarray], bool, Optional[List]]
+) -> Tuple[List[stats.ModelResults], List[instrument.FitRecord]]:
+    """Fit a chunk of samples, also returning the chunk's `FitRecord`s"""
+    names, dilutions, values, batch_fit, p0s = chunk
+    n_fits = len(instrument.RECORDER.fits)
+    if batch_fit:
+        results = stats.calc_model_results_batch(names, dilutions, values, p0s=p0s)
+    else:
+        if p0s is None:
+            p0s = [None] * len(names)
+        results = [
+            stats.calc_model_results(
+                name,
+                pd.DataFrame({"Dilution": dilution, "Percentage Infected": value}),
+                p0=p0,
+            )
+            for name, dilution, value, p0 in zip(names, dilutions, values, p0s)
+        ]
+    return results, instrument.RECORDER.fits[n_fits:]
@@ -6,12 +6,15 @@ Class to encapsulate all plates and samples.
 import logging
 import os
 from collections import defaultdict
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 
+import numpy as np
 import pandas as pd
 
+from plaque_assay import executor
 from plaque_assay import utils
-from plaque_assay.plate import Plate
+from plaque_assay.plate import Plate, process_plates
+from plaque_assay.priors import PriorStore
 from plaque_assay.sample import Sample
 
 
@@ -21,10 +24,22 @@ class Experiment:
     Parameters
     ----------
     df : pandas.DataFrame
+    batch_fit : bool
+        if `True` then the fitted curves of all samples are checked
+        together with `plaque_assay.stats.calc_model_results_batch()`,
+        otherwise each sample is fitted and checked individually.
+    n_workers : int, optional
+        number of processes used to fit samples, see
+        `plaque_assay.executor.fit_samples()`. Default is to fit in the
+        current process.
+    priors : plaque_assay.priors.PriorStore, optional
+        starting points for the curve fits from previous runs. Default
+        is to start every fit from `plaque_assay.stats.P0`.
 
     Attributes
     -----------
     df : pandas.DataFrame
+        all plates' dataframes concatenated, only built when first accessed
     experiment_name : str
     plate_store : dict
     sample_store : dict
@@ -33,14 +48,33 @@ class Experiment:
 
     """
 
-    def __init__(self, df: pd.DataFrame):
-        self.df = df
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        batch_fit: bool = True,
+        n_workers: Optional[int] = None,
+        priors: Optional[PriorStore] = None,
+    ):
+        self.batch_fit = batch_fit
+        self.n_workers = n_workers
+        self.priors = priors
         self.experiment_name = df["Plate_barcode"].values[0][3:]
         self.variant = df["variant"].values[0]
-        self.plate_store = {name: Plate(df) for name, df in df.groupby("Plate_barcode")}
-        self.df = pd.concat([plate.df for plate in self.plate_store.values()])
+        self.plate_store = {
+            name: Plate(df, process=False)
+            for name, df in df.groupby("Plate_barcode", observed=True)
+        }
+        process_plates(list(self.plate_store.values()))
+        self._df: Optional[pd.DataFrame] = None
         self.sample_store = self.make_samples()
 
+    @property
+    def df(self) -> pd.DataFrame:
+        """All plates' dataframes concatenated"""
+        if self._df is None:
+            self._df = pd.concat([plate.df for plate in self.plate_store.values()])
+        return self._df
+
     @property
     def samples(self):
         """Key-value store of all samples in the experiment"""
@@ -60,9 +94,35 @@ class Experiment:
             `{sample_name: Sample}`
         """
         sample_dict = dict()
-        for name, group in self.df.groupby("Well"):
-            sample_df = group[["Dilution", "Percentage Infected"]]
-            sample_dict[name] = Sample(name, sample_df, self.variant)
+        plates = list(self.plate_store.values())
+        # (n_plates, 96) arrays, a sample is a column across all plates
+        dilutions = np.array([plate.dilution for plate in plates], dtype=float)
+        percentage_infected = np.array([plate.percentage_infected for plate in plates])
+        present = np.zeros(percentage_infected.shape, dtype=bool)
+        for i, plate in enumerate(plates):
+            present[i, plate.positions] = True
+        positions = np.flatnonzero(present.any(axis=0))
+        names = list(utils.WELLS_96[positions])
+        sample_dilutions = [dilutions[present[:, pos]] for pos in positions]
+        sample_values = [percentage_infected[present[:, pos], pos] for pos in positions]
+        p0s = None
+        if self.priors is not None:
+            p0s = self.priors.starting_points(self.variant, names)
+        all_model_results = executor.fit_samples(
+            names,
+            sample_dilutions,
+            sample_values,
+            batch_fit=self.batch_fit,
+            n_workers=self.n_workers,
+            p0s=p0s,
+        )
+        for name, dilution, value, model_results in zip(
+            names, sample_dilutions, sample_values, all_model_results
+        ):
+            sample_df = pd.DataFrame(
+                {"Dilution": dilution, "Percentage Infected": value}
+            )
+            sample_dict[name] = Sample(name, sample_df, self.variant, model_results)
         return sample_dict
 
     def get_failures_as_dataframe(self) -> pd.DataFrame:
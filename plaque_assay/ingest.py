@@ -2,19 +2,173 @@
 Data I/O
 """
 
-
+import io
 import logging
 import os
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
-from typing import List
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional
 
+import numpy as np
 import pandas as pd
 
-from plaque_assay import utils
+from plaque_assay import cache
 from plaque_assay import consts
+from plaque_assay import sidecar
+from plaque_assay import utils
+
+# plate directories are named "{prefix}{workflow_id}__{timestamp}"
+# e.g "S01001283__2023-08-16T17_29_53-Measurement 1"
+PLATE_DIR_REGEX = re.compile(r"^[A-Z]\d{8}__")
+
+# line in PlateResults.txt preceding the column headers
+DATA_MARKER = "[Data]"
+
+# resolved once, as pandas is slow to look up dtypes given as strings
+_PLATE_RESULTS_DTYPES = {
+    col: np.dtype(dtype) for col, dtype in consts.PLATE_RESULTS_DTYPES.items()
+}
+
+# rows per dataframe from `iter_indexfiles()`
+INDEXFILE_BATCH_SIZE = 5000
+
+# maximum threads used to read plate files concurrently, as plate
+# directories are on a network filesystem where each open and stat is slow
+INGEST_THREADS = 16
+
+
+def map_threads(
+    func: Callable, items: Iterable, n_threads: Optional[int] = None
+) -> List:
+    """`[func(item) for item in items]`, run concurrently in a thread pool
+
+    Parameters
+    -----------
+    func : callable
+    items : iterable
+    n_threads : int, optional
+        maximum number of threads, default is `INGEST_THREADS`. There is
+        never more than one thread per item, and a single thread runs in
+        the current thread.
+
+    Returns
+    --------
+    list
+        results in the same order as `items`
+    """
+    items = list(items)
+    if n_threads is None:
+        n_threads = INGEST_THREADS
+    n_threads = min(n_threads, len(items))
+    if n_threads <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(
+        n_threads, thread_name_prefix="plaque_assay_ingest"
+    ) as pool:
+        return list(pool.map(func, items))
+
+
+def find_plate_results(path: str) -> str:
+    """Path to the PlateResults.txt file in a plate directory
+
+    Should usually be in Evaluation1, might be in Evaluation2 if there's
+    been a re-analysis. Hopefully never multiple, but select the most
+    recent just-in-case.
+
+    Parameters
+    -----------
+    path : str
+        path to plate directory
+
+    Returns
+    --------
+    str
+    """
+    all_evaluations = glob(os.path.join(path, "Evaluation*", "PlateResults.txt"))
+    if len(all_evaluations) == 0:
+        raise FileNotFoundError(f"no Evaluation*/PlateResults.txt in {path}")
+    plate_results_path = sorted(all_evaluations)[-1]
+    if len(all_evaluations) > 1:
+        logging.warning(
+            "multiple Evaluation directories found, using the latest: %s",
+            plate_results_path,
+        )
+    return plate_results_path
+
+
+def read_plate_results(
+    path: str, use_pyarrow: bool = False, use_sidecar: Optional[bool] = None
+) -> pd.DataFrame:
+    """Read a Phenix PlateResults.txt file.
+
+    Only the columns in `consts.PLATE_RESULTS_DTYPES` are read, with those
+    types. The metadata header is skipped by finding the `[Data]` line
+    rather than assuming a fixed number of lines.
+
+    Parameters
+    -----------
+    path : str
+        path to PlateResults.txt
+    use_pyarrow : bool
+        if `True` use the pyarrow csv engine, falling back to the default
+        engine if pyarrow is not installed.
+    use_sidecar : bool, optional
+        if `True` then memory-map the parsed columns from a binary
+        sidecar if there is an up to date one, otherwise parse the file
+        and save a sidecar, see `plaque_assay.sidecar`. Default is set
+        by the `PLAQUE_ASSAY_SIDECAR` environment variable.
 
+    Returns
+    --------
+    pandas.DataFrame
+    """
+    if use_sidecar is None:
+        use_sidecar = sidecar.sidecar_enabled()
+    if use_sidecar:
+        df = sidecar.read_sidecar(path)
+        if df is not None:
+            return df
+    with open(path, "rb") as f:
+        df = _parse_plate_results(f, path, _csv_engine(use_pyarrow))
+    if use_sidecar:
+        sidecar.write_sidecar(path, df)
+    return df
+
+
+def _csv_engine(use_pyarrow: bool) -> str:
+    engine = "c"
+    if use_pyarrow:
+        try:
+            import pyarrow  # noqa: F401
+
+            engine = "pyarrow"
+        except ImportError:
+            logging.warning("pyarrow not installed, using default csv engine")
+    return engine
+
+
+def _parse_plate_results(f: BinaryIO, path: str, engine: str) -> pd.DataFrame:
+    # leave the file positioned at the column headers
+    for line in f:
+        if line.strip() == DATA_MARKER.encode():
+            break
+    else:
+        raise ValueError(f"no {DATA_MARKER} line found in {path}")
+    return pd.read_csv(
+        f,
+        sep="\t",
+        usecols=list(consts.PLATE_RESULTS_DTYPES),
+        dtype=_PLATE_RESULTS_DTYPES,
+        encoding="utf-8",
+        engine=engine,
+    )
 
-def read_data_from_list(plate_list: List) -> pd.DataFrame:
+
+def read_data_from_list(
+    plate_list: List, use_pyarrow: bool = False, n_threads: Optional[int] = None
+) -> pd.DataFrame:
     """Read in data from plate list and assign dilution values by well position.
 
     Notes
@@ -22,37 +176,71 @@ def read_data_from_list(plate_list: List) -> pd.DataFrame:
     This will mock the data so the 4 dilutions on a single 384-well
     plate are re-labelled to appear from 4 different 96 well plates.
 
+    The plates are found and read concurrently, see `map_threads()`.
+
     Parameters
     ----------
     plate_list : list
+    use_pyarrow : bool
+        use the pyarrow csv engine, see `read_plate_results()`
+    n_threads : int, optional
+        maximum number of threads reading plates, default is
+        `INGEST_THREADS`
 
     Returns:
     ---------
     pandas.DataFrame
     """
-    dataframes = []
+    plate_results_paths = map_threads(find_plate_results, plate_list, n_threads)
     barcodes = []
     for path in plate_list:
-        # should usually be Evaluation1, sometimes might be Evaluation2 if
-        # there's been a re-anaysis. Hopefully never multiple, but select
-        # the most recent just-in-case
-        all_evaluations = glob(os.path.join(path, "Evaluation*", "PlateResults.txt"))
-        if len(all_evaluations) > 1:
-            logging.warning("multiple Evaluation directories found, using the latest")
-        plate_result_path = sorted(all_evaluations)[-1]
-        df = pd.read_csv(
-            # NOTE: might not always be Evaluation1
-            plate_result_path,
-            skiprows=8,
-            sep="\t",
-        )
         plate_barcode = path.split(os.sep)[-1].split("__")[0]
         barcodes.append(plate_barcode)
         logging.info("plate barcode detected as %s", plate_barcode)
-        well_labels = []
-        for row, col in df[["Row", "Column"]].itertuples(index=False):
-            well_labels.append(utils.row_col_to_well(row, col))
-        df["Well"] = well_labels
+    engine = _csv_engine(use_pyarrow)
+    result_cache = cache.get_cache()
+    if result_cache is None:
+        dataframes = map_threads(
+            lambda path: read_plate_results(path, use_pyarrow),
+            plate_results_paths,
+            n_threads,
+        )
+        return _concat_plate_results(dataframes, barcodes)
+    contents = map_threads(_read_bytes, plate_results_paths, n_threads)
+    # the columns and types read, and how dilutions are assigned, change
+    # the parsed dataset as well as the file contents
+    key = cache.make_key(
+        "dataset",
+        cache.CACHE_VERSION,
+        consts.PLATE_RESULTS_DTYPES,
+        consts.PLATE_MAPPING,
+        barcodes,
+        contents,
+    )
+    df_concat = result_cache.get(key)
+    if df_concat is not None:
+        logging.info("using cached dataset for %s", barcodes)
+        return df_concat
+    # parse the contents already read for the key rather than reading again
+    dataframes = map_threads(
+        lambda args: _parse_plate_results(io.BytesIO(args[0]), args[1], engine),
+        zip(contents, plate_results_paths),
+        n_threads,
+    )
+    df_concat = _concat_plate_results(dataframes, barcodes)
+    result_cache.put(key, df_concat)
+    return df_concat
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _concat_plate_results(
+    dataframes: List[pd.DataFrame], barcodes: List[str]
+) -> pd.DataFrame:
+    for df, plate_barcode in zip(dataframes, barcodes):
         df["Plate_barcode"] = plate_barcode
         # Empty wells with no background produce NaNs rather than 0 in the
         # image analysis, which causes missing data for truely complete
@@ -61,16 +249,19 @@ def read_data_from_list(plate_list: List) -> pd.DataFrame:
         fillna_cols = ["Normalised Plaque area", "Normalised Plaque intensity"]
         for colname in fillna_cols:
             df[colname] = df[colname].fillna(0)
-        dataframes.append(df)
     df_concat = pd.concat(dataframes)
-    # NOTE: mock barcodes before changing wells
-    df_concat["Plate_barcode"] = utils.mock_384_barcode(
-        existing_barcodes=df_concat["Plate_barcode"], wells=df_concat["Well"]
+    rows = df_concat["Row"].values
+    cols = df_concat["Column"].values
+    # mock barcodes and wells from the position on the 384-well plate
+    df_concat["Plate_barcode"] = utils.mock_384_barcode_array(
+        df_concat["Plate_barcode"], rows, cols
+    )
+    df_concat["Well"] = utils.well_384_to_96_array(rows, cols)
+    plate_num = utils.dilution_from_384_array(rows, cols)
+    df_concat["PlateNum"] = plate_num
+    df_concat["Dilution"] = pd.Series(plate_num, index=df_concat.index).map(
+        consts.PLATE_MAPPING
     )
-    # mock wells
-    df_concat["Well"] = [utils.well_384_to_96(i) for i in df_concat["Well"]]
-    df_concat["PlateNum"] = [int(i[1]) for i in df_concat["Plate_barcode"]]
-    df_concat["Dilution"] = [consts.PLATE_MAPPING[i] for i in df_concat["PlateNum"]]
     logging.debug("input data shape: %s", df_concat.shape)
     return df_concat
 
@@ -101,6 +292,34 @@ def get_plate_list(data_dir: str) -> List:
     return plate_list
 
 
+def find_plate_dirs(root_dir: str) -> Dict[int, List[str]]:
+    """Find all plate directories under a root directory
+
+    Titration plates (prefixed with "T") are ignored.
+
+    Parameters
+    -----------
+    root_dir : str
+        directory which is searched recursively for plate directories
+
+    Returns
+    --------
+    dict
+        `{workflow_id: [plate_path, ...]}` with sorted plate paths
+    """
+    plates = defaultdict(list)
+    for dirpath, dirnames, _ in os.walk(root_dir):
+        for dirname in sorted(dirnames):
+            if PLATE_DIR_REGEX.match(dirname) and not dirname.startswith("T"):
+                plate_path = os.path.join(dirpath, dirname)
+                workflow_id = utils.get_workflow_id_from_full_path(plate_path)
+                plates[workflow_id].append(plate_path)
+        # don't descend into plate directories
+        dirnames[:] = [i for i in dirnames if not PLATE_DIR_REGEX.match(i)]
+    logging.debug("found plates for %s workflows in %s", len(plates), root_dir)
+    return {workflow_id: sorted(paths) for workflow_id, paths in plates.items()}
+
+
 def read_data_from_directory(data_dir: str) -> pd.DataFrame:
     """Read actual barcoded plate directory
 
@@ -120,24 +339,32 @@ def read_data_from_directory(data_dir: str) -> pd.DataFrame:
     return read_data_from_list(plate_list)
 
 
-def read_indexfiles_from_list(plate_list: List) -> pd.DataFrame:
+def _read_indexfile(path: str) -> pd.DataFrame:
+    df = pd.read_csv(os.path.join(path, "indexfile.txt"), sep="\t")
+    df["Plate_barcode"] = path.split(os.sep)[-1].split("__")[0]
+    return df
+
+
+def read_indexfiles_from_list(
+    plate_list: List, n_threads: Optional[int] = None
+) -> pd.DataFrame:
     """Read indexfiles from a plate list
 
+    The plates are read concurrently, see `map_threads()`.
+
     Parameters
     ------------
     plate_list : list
         list of paths to plate directories
+    n_threads : int, optional
+        maximum number of threads reading plates, default is
+        `INGEST_THREADS`
 
     Returns
     -------
     pandas.DataFrame
     """
-    dataframes = []
-    for path in plate_list:
-        df = pd.read_csv(os.path.join(path, "indexfile.txt"), sep="\t")
-        plate_barcode = path.split(os.sep)[-1].split("__")[0]
-        df["Plate_barcode"] = plate_barcode
-        dataframes.append(df)
+    dataframes = map_threads(_read_indexfile, plate_list, n_threads)
     df_concat = pd.concat(dataframes)
     # remove annoying empty "Unnamed: 16" column
     to_rm = [col for col in df_concat.columns if col.startswith("Unnamed:")]
@@ -148,6 +375,49 @@ def read_indexfiles_from_list(plate_list: List) -> pd.DataFrame:
     return df_concat
 
 
+def iter_indexfiles(
+    plate_list: List, batch_size: int = INDEXFILE_BATCH_SIZE
+) -> Iterator[pd.DataFrame]:
+    """Read indexfiles from a plate list in batches of rows
+
+    Unlike `read_indexfiles_from_list()`, only the columns in
+    `consts.INDEXFILE_COLUMNS` are read, with those types, and renamed
+    to the NE_raw_index column names, so the batches can be uploaded
+    without further copies. At most `batch_size` rows are in memory at
+    once however many fields and channels are imaged.
+
+    Parameters
+    ------------
+    plate_list : list
+        list of paths to plate directories
+    batch_size : int
+        maximum number of rows per batch
+
+    Returns
+    -------
+    iterator of pandas.DataFrame
+        with the columns from `consts.INDEXFILE_COLUMNS` and
+        `plate_barcode`.
+    """
+    columns = {col: name for col, (name, _) in consts.INDEXFILE_COLUMNS.items()}
+    dtypes = {col: dtype for col, (_, dtype) in consts.INDEXFILE_COLUMNS.items()}
+    for path in plate_list:
+        plate_barcode = path.split(os.sep)[-1].split("__")[0]
+        reader = pd.read_csv(
+            os.path.join(path, "indexfile.txt"),
+            sep="\t",
+            usecols=list(columns),
+            dtype=dtypes,
+            encoding="utf-8",
+            chunksize=batch_size,
+        )
+        with reader:
+            for df in reader:
+                df = df.rename(columns=columns)
+                df["plate_barcode"] = plate_barcode
+                yield df
+
+
 def read_indexfiles_from_directory(data_dir: str) -> pd.DataFrame:
     """Return dataframe of indexfiles from a directory containing plates.
 
@@ -0,0 +1,217 @@
+"""
+Lightweight timing and counting of pipeline stages.
+
+Stages are timed with the `timer()` context manager or `timed()`
+decorator, and recorded in a module-level `Recorder`. Curve fits record
+the time and number of function evaluations for each well with
+`record_fit()`.
+
+`export()` writes the collected report to the log as a single JSON
+line, and to a JSON file if the `PLAQUE_ASSAY_PROFILE_JSON` environment
+variable is set to a path.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+PROFILE_JSON_ENV = "PLAQUE_ASSAY_PROFILE_JSON"
+
+
+class FitRecord(NamedTuple):
+    """Timing of a single well's curve fit.
+
+    `seconds` is the fitting time divided across the samples for
+    batched fits. `warm_start` is `True`
+    when the fit started from a prior rather than the default initial
+    guess, and `fallback` when that didn't converge so the well was
+    fitted again from the default, in which case `nfev` counts both.
+    """
+
+    well: str
+    seconds: float
+    nfev: int
+    converged: bool
+    batched: bool
+    warm_start: bool = False
+    fallback: bool = False
+
+
+class Recorder:
+    """Collects stage timings, counters and per-well fits
+
+    Attributes
+    -----------
+    timings : dict
+        `{stage: [seconds, ...]}`, one entry per call
+    counters : dict
+        `{name: count}`
+    fits : list
+        `FitRecord` for each fitted well
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.fits: List[FitRecord] = []
+        # stages can be recorded from upload threads
+        self.lock = threading.Lock()
+
+    def report(self) -> Dict:
+        """Summary of everything recorded
+
+        Returns
+        --------
+        dict
+        """
+        stages = {
+            name: {
+                "calls": len(durations),
+                "total": sum(durations),
+                "mean": sum(durations) / len(durations),
+                "max": max(durations),
+            }
+            for name, durations in self.timings.items()
+        }
+        fit_seconds = [fit.seconds for fit in self.fits]
+        fit_nfev = [fit.nfev for fit in self.fits]
+        warm_nfev = [fit.nfev for fit in self.fits if fit.warm_start]
+        cold_nfev = [fit.nfev for fit in self.fits if not fit.warm_start]
+        fits = {
+            "n_fits": len(self.fits),
+            "n_not_converged": sum(not fit.converged for fit in self.fits),
+            "total_seconds": sum(fit_seconds),
+            "max_seconds": max(fit_seconds, default=0.0),
+            "total_nfev": sum(fit_nfev),
+            "max_nfev": max(fit_nfev, default=0),
+            "n_warm_start": len(warm_nfev),
+            "n_fallback": sum(fit.fallback for fit in self.fits),
+            "mean_nfev_warm_start": sum(warm_nfev) / max(len(warm_nfev), 1),
+            "mean_nfev_cold_start": sum(cold_nfev) / max(len(cold_nfev), 1),
+            "wells": [fit._asdict() for fit in self.fits],
+        }
+        return {
+            "wall_time": time.perf_counter() - self.start,
+            "stages": stages,
+            "counters": dict(self.counters),
+            "fits": fits,
+        }
+
+
+RECORDER = Recorder()
+
+
+def reset() -> Recorder:
+    """Start a new recorder, discarding anything recorded so far
+
+    Returns
+    --------
+    Recorder
+        the new module-level recorder
+    """
+    global RECORDER
+    RECORDER = Recorder()
+    return RECORDER
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    """Time the enclosed block as stage `name`
+
+    Parameters
+    -----------
+    name : str
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        with RECORDER.lock:
+            RECORDER.timings[name].append(duration)
+        logging.debug("stage %s took %.4fs", name, duration)
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """Decorator to time every call of a function
+
+    Parameters
+    -----------
+    name : str, optional
+        stage name, defaults to the function's qualified name
+    """
+
+    def decorator(func: Callable) -> Callable:
+        stage = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, n: int = 1) -> None:
+    """Increment counter `name` by `n`"""
+    with RECORDER.lock:
+        RECORDER.counters[name] += n
+
+
+def record_fit(
+    well: str,
+    seconds: float,
+    nfev: int,
+    converged: bool,
+    batched: bool,
+    warm_start: bool = False,
+    fallback: bool = False,
+) -> None:
+    """Record a single well's curve fit, see `FitRecord`"""
+    record = FitRecord(
+        str(well),
+        seconds,
+        int(nfev),
+        bool(converged),
+        bool(batched),
+        bool(warm_start),
+        bool(fallback),
+    )
+    with RECORDER.lock:
+        RECORDER.fits.append(record)
+
+
+def export(name: str) -> Dict:
+    """Log the report, and save as JSON if `PLAQUE_ASSAY_PROFILE_JSON` is set
+
+    Parameters
+    -----------
+    name : str
+        name of the run, included in the report
+
+    Returns
+    --------
+    dict
+        the report
+    """
+    report = {"name": name, **RECORDER.report()}
+    summary = {key: value for key, value in report.items() if key != "fits"}
+    summary["fits"] = {
+        key: value for key, value in report["fits"].items() if key != "wells"
+    }
+    logging.info("profile: %s", json.dumps(summary))
+    path = os.environ.get(PROFILE_JSON_ENV)
+    if path:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info("profile saved to %s", path)
+    return report
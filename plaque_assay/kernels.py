@@ -0,0 +1,245 @@
+"""
+Compiled kernels for checking many fitted curves at once.
+
+These are used by `plaque_assay.stats` after the curves are fitted, to
+calculate the mean squared errors and Hampel outliers of every sample in
+a single call rather than one sample at a time. The curves themselves
+are evaluated with `plaque_assay.stats.dr_4_batch()`, as numpy's
+vectorised power function is already faster than a compiled loop.
+
+Kernels are compiled with numba and cached to disk with `cache=True`,
+so compilation is paid once per installation rather than once per
+process, later processes load the compiled kernels from the cache.
+numba is only imported when a kernel is first called, so importing
+`plaque_assay` doesn't pay for it. `warmup()` compiles every kernel up
+front, running it once after installing fills the cache so the first
+analysis doesn't compile them either:
+
+    python -c "from plaque_assay import kernels; kernels.warmup()"
+
+The cache is written to `__pycache__` next to this file, or a per-user
+cache directory if that isn't writable. Set `NUMBA_CACHE_DIR` to share
+a cache between users.
+"""
+
+import functools
+import threading
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+# scale factor making the median absolute deviation a consistent
+# estimator of the standard deviation, as used by `hampel()`
+MAD_SCALE = 1.4826
+
+# functions to compile, and their `numba.njit()` options, by name
+_KERNELS: Dict[str, Tuple[Callable, Dict]] = {}
+_COMPILE_LOCK = threading.Lock()
+_compiled = False
+
+
+def _kernel(**options) -> Callable:
+    """Decorator registering a function to be compiled with
+    `numba.njit(cache=True, **options)` when any kernel is first called
+
+    Every kernel in the module is swapped for its compiled version at
+    once, so kernels calling other kernels call the compiled versions.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        _KERNELS[func.__name__] = (func, options)
+
+        @functools.wraps(func)
+        def compile_and_call(*args, **kwargs):
+            _compile()
+            return globals()[func.__name__](*args, **kwargs)
+
+        return compile_and_call
+
+    return decorator
+
+
+def _compile() -> None:
+    """Import numba and replace every kernel with its compiled version"""
+    global _compiled
+    with _COMPILE_LOCK:
+        if _compiled:
+            return None
+        import numba
+
+        for name, (func, options) in _KERNELS.items():
+            globals()[name] = numba.njit(cache=True, **options)(func)
+        _compiled = True
+
+
+@_kernel(error_model="numpy")
+def mse_batch(
+    y_observed: np.ndarray, y_fitted: np.ndarray, lengths: np.ndarray
+) -> np.ndarray:
+    """`plaque_assay.stats.model_mse` for many samples
+
+    Parameters
+    -----------
+    y_observed : 2-d array
+        shape (n_samples, n_points)
+    y_fitted : 2-d array
+        same shape as `y_observed`
+    lengths : 1-d array
+        number of points in each sample, later values in each row
+        are ignored
+
+    Returns
+    --------
+    1-d array
+        mean squared error ignoring NaNs, for each sample
+    """
+    n_samples = y_observed.shape[0]
+    out = np.empty(n_samples)
+    for i in range(n_samples):
+        total = 0.0
+        count = 0
+        for j in range(lengths[i]):
+            square = (y_observed[i, j] - y_fitted[i, j]) ** 2
+            if not np.isnan(square):
+                total += square
+                count += 1
+        out[i] = total / count if count else np.nan
+    return out
+
+
+@_kernel()
+def _insert(window: np.ndarray, size: int, value: float) -> int:
+    """Insert `value` into the first `size` sorted values of `window`,
+    NaNs are not inserted. Returns the new size."""
+    if np.isnan(value):
+        return size
+    i = size
+    while i > 0 and window[i - 1] > value:
+        window[i] = window[i - 1]
+        i -= 1
+    window[i] = value
+    return size + 1
+
+
+@_kernel()
+def _remove(window: np.ndarray, size: int, value: float) -> int:
+    """Remove `value` from the first `size` sorted values of `window`,
+    as inserted by `_insert()`. Returns the new size."""
+    if np.isnan(value):
+        return size
+    i = _search(window, size, value)
+    while i < size - 1:
+        window[i] = window[i + 1]
+        i += 1
+    return size - 1
+
+
+@_kernel()
+def _search(window: np.ndarray, size: int, value: float) -> int:
+    """Index of the first of the `size` sorted values of `window` which
+    is not less than `value`"""
+    low, high = 0, size
+    while low < high:
+        middle = (low + high) // 2
+        if window[middle] < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+@_kernel()
+def _sorted_median(window: np.ndarray, size: int) -> float:
+    half = size // 2
+    if size % 2:
+        return window[half]
+    return (window[half - 1] + window[half]) / 2
+
+
+@_kernel()
+def _median_abs_deviation(window: np.ndarray, size: int, median: float) -> float:
+    """Median of the absolute deviations from `median` of the first
+    `size` sorted values of `window`
+
+    The deviations of values either side of the median are each sorted,
+    so are merged rather than sorted again.
+    """
+    right = _search(window, size, median)
+    left = right - 1
+    low = high = 0.0
+    for i in range(size // 2 + 1):
+        left_deviation = abs(window[left] - median) if left >= 0 else np.inf
+        right_deviation = abs(window[right] - median) if right < size else np.inf
+        if left_deviation <= right_deviation:
+            deviation = left_deviation
+            left -= 1
+        else:
+            deviation = right_deviation
+            right += 1
+        if i == (size - 1) // 2:
+            low = deviation
+        if i == size // 2:
+            high = deviation
+    if size % 2:
+        return low
+    return (low + high) / 2
+
+
+@_kernel(error_model="numpy")
+def hampel_batch(x: np.ndarray, k: int, t0: float = 3) -> np.ndarray:
+    """Hampel's outlier test for many series at once
+
+    Gives the same outliers as the pracma-derived
+    `plaque_assay.stats.hampel()` test, but keeps a sorted window of
+    values which is updated as it slides along each series rather than
+    taking the median of every window from scratch. Inserting and
+    removing a value shifts up to `2 * k` values, and the median
+    absolute deviation merges the `k + 1` deviations nearest the median,
+    so each point costs O(k) and a series O(n·k), rather than the
+    O(n·k log k) of sorting every window. A heap or skiplist would find
+    the median in O(log k), but the median absolute deviation would
+    still take O(k) per point.
+
+    Parameters
+    -----------
+    x : 2-d array
+        shape (n_series, n_points)
+    k : int
+        number of items either side of each point in the window
+    t0 : numeric
+        number of standard deviations to use
+
+    Returns
+    --------
+    2-d array
+        boolean, same shape as `x`, `True` for outliers
+    """
+    n_series, n = x.shape
+    outliers = np.zeros(x.shape, dtype=np.bool_)
+    window = np.empty(2 * k + 1)
+    for series in range(n_series):
+        row = x[series]
+        if n - k <= k + 1:
+            continue
+        # window around the first point tested, k + 1, without its last value
+        size = 0
+        for j in range(1, 2 * k + 1):
+            size = _insert(window, size, row[j])
+        for i in range(k + 1, n - k):
+            if i > k + 1:
+                size = _remove(window, size, row[i - k - 1])
+            size = _insert(window, size, row[i + k])
+            if size == 0:
+                continue
+            x0 = _sorted_median(window, size)
+            s0 = MAD_SCALE * _median_abs_deviation(window, size, x0)
+            if abs(row[i] - x0) > t0 * s0:
+                outliers[series, i] = True
+    return outliers
+
+
+def warmup() -> None:
+    """Compile every kernel, or load it from the disk cache, for the
+    argument types used by `plaque_assay.stats`"""
+    hampel_batch(np.zeros((1, 1)), 5, 3)
+    mse_batch(np.zeros((1, 1)), np.zeros((1, 1)), np.ones(1, dtype=int))
@@ -1,20 +1,45 @@
 """
-Main `run()` function to launch the analysis and `run_titration()` for
-the titration analysis.
+Main `run()` function to launch the analysis on a single plate pair,
+and `run_batch()` to analyse every plate pair under a directory.
 """
 
+import logging
 import os
-from typing import List
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
+import pandas as pd
 import sqlalchemy
+import sqlalchemy.orm
 
-from plaque_assay import ingest, utils
-from plaque_assay.db_uploader import AnalysisDatabaseUploader
-from plaque_assay.errors import DatabaseCredentialError
+from plaque_assay import bulk, ingest, instrument, priors, utils
+from plaque_assay.db_uploader import AnalysisDatabaseUploader, UploadQueue
+from plaque_assay.errors import DatabaseCredentialError, VariantLookupError
 from plaque_assay.experiment import Experiment
 
 
-def create_engine(test: bool = True) -> sqlalchemy.engine.base.Engine:
+# default connection pool options for `create_engine()`
+POOL_OPTIONS = {
+    "pool_size": 5,
+    "max_overflow": 5,
+    # check connections are alive before use, as the LIMS server closes
+    # idle connections
+    "pool_pre_ping": True,
+    # replace connections after an hour, before MySQL's wait_timeout
+    "pool_recycle": 3600,
+    # seconds to wait for a connection from the pool
+    "pool_timeout": 30,
+}
+# seconds to wait when opening a new connection to the LIMS server
+CONNECT_TIMEOUT = 10
+
+# engines created by `get_engine()`, reused for the life of the process
+_ENGINES: Dict[Tuple, sqlalchemy.engine.base.Engine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def create_engine(test: bool = True, **pool_options) -> sqlalchemy.engine.base.Engine:
     """Create a database engine.
 
     Create a database engine to the LIMS serology database.
@@ -26,11 +51,20 @@ def create_engine(test: bool = True) -> sqlalchemy.engine.base.Engine:
     - `NE_HOST_TEST` (if using testing database) host
     - `NE_PASSWORD` password
 
+    If `PLAQUE_ASSAY_LOAD_DATA` is set then `local_infile` is enabled on
+    the connection, see `plaque_assay.bulk`.
+
+    Use `get_engine()` to reuse an engine, and its pooled connections,
+    across runs.
+
 
     Parameters
     ----------
     test : bool
         If True, then will use the staging/testing database
+    **pool_options
+        `sqlalchemy.create_engine()` arguments overriding `POOL_OPTIONS`,
+        e.g `pool_size`, `pool_pre_ping`, `pool_recycle`, `pool_timeout`.
 
     Returns
     -------
@@ -47,12 +81,76 @@ def create_engine(test: bool = True) -> sqlalchemy.engine.base.Engine:
             "db credentials not found in environent.",
             "Need to set NE_USER, NE_HOST_{TEST,PROD}, NE_PASSWORD",
         )
+    connect_args = {"connect_timeout": CONNECT_TIMEOUT}
+    if bulk.load_data_enabled():
+        # allow LOAD DATA LOCAL INFILE for bulk uploads
+        connect_args["local_infile"] = 1
     engine = sqlalchemy.create_engine(
-        f"mysql+mysqldb://{user}:{password}@{host}/serology"
+        f"mysql+mysqldb://{user}:{password}@{host}/serology",
+        connect_args=connect_args,
+        **{**POOL_OPTIONS, **pool_options},
     )
     return engine
 
 
+def get_engine(test: bool = True, **pool_options) -> sqlalchemy.engine.base.Engine:
+    """Return a shared database engine, creating it on first use.
+
+    Engines are kept for the life of the process, keyed on the database
+    credentials, `test` and `pool_options`, so a long running process
+    analysing many plate pairs reuses pooled connections rather than
+    connecting to the LIMS server for each run.
+
+    Parameters
+    ----------
+    test : bool
+        If True, then will use the staging/testing database
+    **pool_options
+        see `create_engine()`
+
+    Returns
+    -------
+    sqlalchemy.engine.Engine
+    """
+    host_var = "NE_HOST_TEST" if test else "NE_HOST_PROD"
+    key = (
+        test,
+        os.environ.get("NE_USER"),
+        os.environ.get(host_var),
+        os.environ.get("NE_PASSWORD"),
+        bulk.load_data_enabled(),
+        tuple(sorted(pool_options.items())),
+    )
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            engine = create_engine(test, **pool_options)
+            _ENGINES[key] = engine
+    return engine
+
+
+def dispose_engines(close: bool = True) -> None:
+    """Discard pooled connections of all engines from `get_engine()`
+
+    This should be called before exiting a long-running process, and
+    with `close=False` in child processes after a fork.
+
+    Parameters
+    ----------
+    close : bool
+        If False, the pooled connections are dropped without being closed,
+        so a forked child doesn't close connections shared with its parent.
+    """
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            if close:
+                engine.dispose()
+            else:
+                # `engine.dispose(close=False)` needs sqlalchemy>=1.4.33
+                engine.pool = engine.pool.recreate()
+        _ENGINES.clear()
+
+
 def create_local_engine() -> sqlalchemy.engine.base.Engine:
     """Create a local database engine.
 
@@ -64,7 +162,216 @@ def create_local_engine() -> sqlalchemy.engine.base.Engine:
     return engine
 
 
-def run(plate_list: List[str]) -> None:
+class AnalysisResults(NamedTuple):
+    """Dataframes from analysing a single workflow and variant"""
+
+    plate_list: List[str]
+    dataset: pd.DataFrame
+    normalised_data: pd.DataFrame
+    final_results: pd.DataFrame
+    failures: pd.DataFrame
+    model_parameters: pd.DataFrame
+
+
+class BatchResult(NamedTuple):
+    """Outcome of a single plate pair within `run_batch()`"""
+
+    workflow_id: int
+    variant: Optional[str]
+    plate_list: List[str]
+    status: str
+    error: Optional[str] = None
+
+
+# `BatchResult.status` values
+UPLOADED = "uploaded"
+ALREADY_UPLOADED = "already uploaded"
+FAILED = "failed"
+
+
+def read_plates(plate_list: List[str], variant: str) -> pd.DataFrame:
+    """Read plate results for a pair of plates.
+
+    The indexfiles are not read here, they are streamed straight into
+    the database by `upload_raw_data()`.
+
+    Parameters
+    ------------
+    plate_list : list
+        List of paths to the 2 replicate plate directories.
+    variant : str
+        Variant name, added as a column.
+
+    Returns
+    --------
+    pandas.DataFrame
+    """
+    with instrument.timer("read_data"):
+        dataset = ingest.read_data_from_list(plate_list)
+    dataset["variant"] = variant
+    return dataset
+
+
+def analyse_dataset(
+    plate_list: List[str],
+    dataset: pd.DataFrame,
+    prior_store: Optional[priors.PriorStore] = None,
+) -> AnalysisResults:
+    """Analyse plate results from `read_plates()`
+
+    Parameters
+    ------------
+    plate_list : list
+        List of paths to the 2 replicate plate directories.
+    dataset : pandas.DataFrame
+    prior_store : plaque_assay.priors.PriorStore, optional
+        starting points for the curve fits, from `priors.get_priors()`
+
+    Returns
+    --------
+    AnalysisResults
+    """
+    with instrument.timer("experiment"):
+        experiment = Experiment(dataset, priors=prior_store)
+    with instrument.timer("results"):
+        return AnalysisResults(
+            plate_list=plate_list,
+            dataset=dataset,
+            normalised_data=experiment.get_normalised_data(),
+            final_results=experiment.get_results_as_dataframe(),
+            failures=experiment.get_failures_as_dataframe(),
+            model_parameters=experiment.get_model_parameters(),
+        )
+
+
+def analyse(
+    plate_list: List[str],
+    variant: str,
+    prior_store: Optional[priors.PriorStore] = None,
+) -> AnalysisResults:
+    """Analyse a pair of plates without touching the database.
+
+    Parameters
+    ------------
+    plate_list : list
+        List of paths to the 2 replicate plate directories.
+    variant : str
+        Variant name, as returned by `utils.get_run_context()`.
+    prior_store : plaque_assay.priors.PriorStore, optional
+        starting points for the curve fits, from `priors.get_priors()`
+
+    Returns
+    --------
+    AnalysisResults
+    """
+    dataset = read_plates(plate_list, variant)
+    return analyse_dataset(plate_list, dataset, prior_store)
+
+
+def upload_raw_data(
+    lims_db: AnalysisDatabaseUploader,
+    dataset: pd.DataFrame,
+    plate_list: List[str],
+    variant: str,
+) -> None:
+    """Upload raw plate results and indexfiles, without committing.
+
+    These need no analysis, so can be uploaded while the analysis runs.
+    Indexfiles are read in batches from the plate directories as they
+    are uploaded, see `plaque_assay.ingest.iter_indexfiles()`.
+
+    Parameters
+    -----------
+    lims_db : AnalysisDatabaseUploader
+    dataset : pandas.DataFrame
+    plate_list : list
+        List of paths to the 2 replicate plate directories.
+    variant : str
+
+    Returns
+    --------
+    None
+    """
+    lims_db.upload_plate_results(dataset)
+    with instrument.timer("upload_indexfiles"):
+        lims_db.upload_indexfile_batches(ingest.iter_indexfiles(plate_list), variant)
+
+
+def upload_analysis_results(
+    lims_db: AnalysisDatabaseUploader,
+    results: AnalysisResults,
+    context: utils.RunContext,
+) -> None:
+    """Upload analysis results, update workflow tracking and commit.
+
+    Parameters
+    -----------
+    lims_db : AnalysisDatabaseUploader
+    results : AnalysisResults
+        output from `analyse()`
+    context : plaque_assay.utils.RunContext
+        from `utils.get_run_context()`, fetched before any results
+        for this workflow and variant are uploaded. The variants already
+        uploaded are counted in this transaction, as runs of other
+        variants of the workflow may have been uploaded since.
+
+    Returns
+    --------
+    None
+    """
+    workflow_id = context.workflow_id
+    lims_db.upload_normalised_results(results.normalised_data)
+    lims_db.upload_final_results(results.final_results)
+    n_other_variants = utils.count_other_variants(
+        workflow_id, context.variant, lims_db.session
+    )
+    is_final = context.is_final_upload(n_other_variants)
+    lims_db.upload_failures(results.failures)
+    lims_db.upload_model_parameters(results.model_parameters)
+    lims_db.upload_reporter_plate_status(workflow_id, context.variant)
+    if is_final:
+        logging.info(
+            "Final variant upload, marking workflow %s as complete", workflow_id
+        )
+        lims_db.update_workflow_tracking(workflow_id)
+    else:
+        logging.info(
+            "Not final variant upload for workflow %s, this is variant %d/%d",
+            workflow_id,
+            n_other_variants + 1,
+            context.expected_n_variants,
+        )
+    lims_db.commit()
+
+
+def upload(
+    lims_db: AnalysisDatabaseUploader,
+    results: AnalysisResults,
+    context: utils.RunContext,
+) -> None:
+    """Upload analysis results to the LIMS database and commit.
+
+    Parameters
+    -----------
+    lims_db : AnalysisDatabaseUploader
+    results : AnalysisResults
+        output from `analyse()`
+    context : plaque_assay.utils.RunContext
+        from `utils.get_run_context()`, fetched before any results
+        for this workflow and variant are uploaded.
+
+    Returns
+    --------
+    None
+    """
+    with instrument.timer("upload"):
+        upload_raw_data(lims_db, results.dataset, results.plate_list, context.variant)
+        upload_analysis_results(lims_db, results, context)
+
+
+def run(
+    plate_list: List[str], engine: Optional[sqlalchemy.engine.base.Engine] = None
+) -> None:
     """Run analysis pipeline.
 
     This runs the entire analysis on a pair of plates, given that the 2
@@ -76,39 +383,183 @@ def run(plate_list: List[str]) -> None:
     plate_list : list
         List of paths to the plate directories to analyse. This will be 2 plates
         for the 2 replicates for a single workflow and variant.
+    engine : sqlalchemy.engine.Engine, optional
+        Database engine, if `None` then connects to the production
+        LIMS database with `get_engine()`.
 
     Returns
     ----------
     None
+
+    Notes
+    ------
+    Raw plate results and indexfiles are uploaded in a background thread
+    with `plaque_assay.db_uploader.UploadQueue` while the analysis runs.
+    Everything is still committed in a single transaction after the
+    analysis results are uploaded, or rolled back if anything fails.
+
+    The time taken by each stage is logged at the end of the run, see
+    `plaque_assay.instrument.export()`.
+
+    Curve fits start from the parameters of previous runs if enabled
+    with the `PLAQUE_ASSAY_PRIORS` environment variable, see
+    `plaque_assay.priors`.
+    """
+    instrument.reset()
+    if engine is None:
+        engine = get_engine(test=False)
+    Session = sqlalchemy.orm.sessionmaker(bind=engine)
+    # closing the session returns its connection to the engine's pool
+    with Session() as session:
+        with instrument.timer("lims_lookup"):
+            context = utils.get_run_context(plate_list, session)
+        workflow_id, variant = context.workflow_id, context.variant
+        if context.already_uploaded:
+            print(
+                f"workflow:{workflow_id} variant:{variant} already have results in the database"
+            )
+            # still exit successfully so task is marked as complete
+            return None
+        with instrument.timer("priors"):
+            prior_store = priors.get_priors(session, variant)
+        lims_db = AnalysisDatabaseUploader(session)
+        # the raw data is uploaded in the background while the analysis
+        # runs, the session is only used by the upload thread from here
+        with UploadQueue(lims_db) as uploads:
+            dataset = read_plates(plate_list, variant)
+            # copy so the upload thread doesn't share data with the analysis
+            uploads.submit(
+                upload_raw_data, lims_db, dataset.copy(), plate_list, variant
+            )
+            results = analyse_dataset(plate_list, dataset, prior_store)
+            uploads.submit(upload_analysis_results, lims_db, results, context)
+        # only once the upload is committed, so failed uploads don't leave
+        # warm starts from results that aren't in the database
+        priors.save_priors(variant, results.model_parameters)
+    instrument.export(f"workflow:{workflow_id} variant:{variant}")
+
+
+def find_plate_pairs(
+    root_dir: str, session: sqlalchemy.orm.Session
+) -> Tuple[List[Tuple[List[str], int, str]], List[BatchResult]]:
+    """Find replicate plate pairs under a root directory.
+
+    Plates are grouped by workflow_id, then paired by matching barcode
+    prefixes to a variant in the LIMS database.
+
+    Parameters
+    -----------
+    root_dir : str
+    session : sqlalchemy.orm.Session
+
+    Returns
+    --------
+    tuple
+        list of `(plate_list, workflow_id, variant)` for each pair,
+        and a list of `BatchResult` failures for plates which could
+        not be paired.
     """
-    engine = create_engine(test=False)
+    pairs = []
+    unpaired = []
+    for workflow_id, plates in ingest.find_plate_dirs(root_dir).items():
+        remaining = list(plates)
+        while remaining:
+            plate = remaining.pop(0)
+            for other in remaining:
+                try:
+                    variant = utils.get_variant_from_plate_list([plate, other], session)
+                except VariantLookupError:
+                    continue
+                remaining.remove(other)
+                pairs.append(([plate, other], workflow_id, variant))
+                break
+            else:
+                unpaired.append(
+                    BatchResult(
+                        workflow_id,
+                        None,
+                        [plate],
+                        FAILED,
+                        "no matching replicate plate for a known variant",
+                    )
+                )
+    return pairs, unpaired
+
+
+def run_batch(
+    root_dir: str,
+    n_workers: Optional[int] = None,
+    engine: Optional[sqlalchemy.engine.base.Engine] = None,
+) -> List[BatchResult]:
+    """Analyse and upload every plate pair found under a directory.
+
+    Plate pairs are analysed across a pool of worker processes, while
+    uploads are carried out in this process through a single engine,
+    with a separate session and commit per pair so a failure in one pair
+    does not affect the others.
+
+    Parameters
+    -----------
+    root_dir : str
+        directory which is searched recursively for plate directories
+    n_workers : int, optional
+        number of worker processes, defaults to the number of CPUs
+    engine : sqlalchemy.engine.Engine, optional
+        Database engine, if `None` then connects to the production
+        LIMS database with `get_engine()`.
+
+    Returns
+    --------
+    list
+        `BatchResult` for each plate pair, plus any unpaired plates.
+    """
+    if engine is None:
+        engine = get_engine(test=False)
     Session = sqlalchemy.orm.sessionmaker(bind=engine)
-    session = Session()
-    lims_db = AnalysisDatabaseUploader(session)
-    variant = utils.get_variant_from_plate_list(plate_list, session)
-    workflow_id = utils.get_workflow_id_from_plate_list(plate_list)
-    if lims_db.already_uploaded(workflow_id, variant):
+    with Session() as session:
+        pairs, summary = find_plate_pairs(root_dir, session)
+        to_analyse = []
+        for plate_list, workflow_id, variant in pairs:
+            if AnalysisDatabaseUploader(session).already_uploaded(workflow_id, variant):
+                summary.append(
+                    BatchResult(workflow_id, variant, plate_list, ALREADY_UPLOADED)
+                )
+            else:
+                to_analyse.append((plate_list, workflow_id, variant))
+        prior_stores = {
+            variant: priors.get_priors(session, variant)
+            for variant in {variant for _, _, variant in to_analyse}
+        }
+    # workers don't inherit the parent's pooled database connections
+    with ProcessPoolExecutor(
+        max_workers=n_workers, initializer=dispose_engines, initargs=(False,)
+    ) as pool:
+        futures = {}
+        for plate_list, workflow_id, variant in to_analyse:
+            future = pool.submit(analyse, plate_list, variant, prior_stores[variant])
+            futures[future] = (plate_list, workflow_id, variant)
+        for future in as_completed(futures):
+            plate_list, workflow_id, variant = futures[future]
+            try:
+                results = future.result()
+                with Session() as session:
+                    # fetched now as earlier pairs may have uploaded
+                    # other variants of this workflow
+                    context = utils.get_run_context(plate_list, session)
+                    upload(AnalysisDatabaseUploader(session), results, context)
+                priors.save_priors(variant, results.model_parameters)
+            except Exception as error:
+                logging.exception("workflow %s variant %s failed", workflow_id, variant)
+                summary.append(
+                    BatchResult(workflow_id, variant, plate_list, FAILED, repr(error))
+                )
+            else:
+                logging.info("workflow %s variant %s uploaded", workflow_id, variant)
+                summary.append(BatchResult(workflow_id, variant, plate_list, UPLOADED))
+    summary.sort(key=lambda result: (result.workflow_id, str(result.variant)))
+    for result in summary:
         print(
-            f"workflow:{workflow_id} variant:{variant} already have results in the database"
+            f"workflow:{result.workflow_id} variant:{result.variant} {result.status}"
+            + (f" ({result.error})" if result.error else "")
         )
-        # still exit successfully so task is marked as complete
-        return None
-    dataset = ingest.read_data_from_list(plate_list)
-    indexfiles = ingest.read_indexfiles_from_list(plate_list)
-    dataset["variant"] = variant
-    indexfiles["variant"] = variant
-    experiment = Experiment(dataset)
-    normalised_data = experiment.get_normalised_data()
-    final_results = experiment.get_results_as_dataframe()
-    failures = experiment.get_failures_as_dataframe()
-    model_parameters = experiment.get_model_parameters()
-    lims_db.upload_plate_results(dataset)
-    lims_db.upload_indexfiles(indexfiles)
-    lims_db.upload_normalised_results(normalised_data)
-    lims_db.upload_final_results(final_results)
-    lims_db.upload_failures(failures)
-    lims_db.upload_model_parameters(model_parameters)
-    lims_db.upload_reporter_plate_status(workflow_id, variant)
-    if lims_db.is_final_upload(workflow_id):
-        lims_db.update_workflow_tracking(workflow_id)
-    lims_db.commit()
+    return summary
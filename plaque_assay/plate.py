@@ -30,13 +30,40 @@ This also means that the well labels in this class have been converted from thei
 """
 
 import os
-from typing import Set
+from typing import Optional, Sequence, Set, Tuple
 
+import numpy as np
 import pandas as pd
 
 from plaque_assay import failure
 from plaque_assay import qc_criteria
-from plaque_assay.consts import VIRUS_ONLY_WELLS, NO_VIRUS_WELLS
+from plaque_assay import utils
+from plaque_assay.consts import (
+    VIRUS_ONLY_WELLS,
+    NO_VIRUS_WELLS,
+    POSITIVE_CONTROL_WELLS,
+)
+
+# positions of control wells in arrays indexed by 96-well position
+VIRUS_ONLY_IDX = utils.well_96_positions(VIRUS_ONLY_WELLS)
+NO_VIRUS_IDX = utils.well_96_positions(NO_VIRUS_WELLS)
+POSITIVE_CONTROL_IDX = utils.well_96_positions(POSITIVE_CONTROL_WELLS)
+CONTROL_COLUMN_IDX = np.arange(11, 96, 12)
+
+PLAQUE_AREA = "Normalised Plaque area"
+CELL_REGION_AREA = "Cells - Image Region Area [µm²] - Mean per Well"
+
+# QC failure records, `plate` is the index of the plate in the sequence
+# passed to `process_plates()`. Well failures are ordered by plate, then
+# low outliers before high outliers, then input order.
+WELL_FAILURE_DTYPE = np.dtype([("plate", np.intp), ("position", np.intp)])
+PLATE_FAILURE_DTYPE = np.dtype(
+    [("plate", np.intp), ("reason", np.int8), ("infection", np.float64)]
+)
+# `PLATE_FAILURE_DTYPE` reasons
+CELL_IMAGE_AREA_FAILURE = 0
+DAPI_PLATE_FAILURE = 1
+INFECTION_FAILURE = 2
 
 
 class Plate:
@@ -45,173 +72,153 @@ class Plate:
     This is not the physical 384-well plate, but the mock 96-well
     plate of a single dilution.
 
+    Measurements are held in arrays of length 96 indexed by 96-well
+    position (see `plaque_assay.utils.WELLS_96`), with `NaN` for wells
+    not present in the input.
+
 
     Parameters
     -----------
     df : pandas.DataFrame
+    process : bool
+        if `True` then normalise and QC the plate on its own. Set to
+        `False` when plates are processed together with `process_plates()`.
 
     Attributes
     -----------
     df : pandas.DataFrame
-        Dataframe, similar to input `df` but with additional columns from
-        `Plate.subtract_plaque_area_background()` and
-        `Plate.calc_percentage_infected()`.
+        Dataframe of the wells on the plate, with "Background Subtracted
+        Plaque Area" and "Percentage Infected" columns. Only built when
+        first accessed.
     barcode : string
         Mock plate barcode. This is not the scanned barcode,
         but the mock 96-well plate barcode determined from the
         actual 384-well barcode.
     dilution : int
         Dilution integer of the plate, (1, 2, 3, 4).
+    positions : numpy.ndarray
+        96-well positions of the input rows, in input order.
+    plaque_area : numpy.ndarray
+    cell_region_area : numpy.ndarray
+    background_subtracted_plaque_area : numpy.ndarray
+    percentage_infected : numpy.ndarray
+    ratio : numpy.ndarray
+        `cell_region_area` divided by the plate median.
     plate_failed : bool
         `True` if the entire plate is a QC failure, otherwise `False`.
-    well_failures : list
-        List containing WellFailure classes if any wells have failed.
-    plate_failures : list
-        List containing PlateFailure classes if the plate has failed
-        for one of more QC reasons.
+    well_failure_records : numpy.ndarray
+        structured array with `WELL_FAILURE_DTYPE`
+    plate_failure_records : numpy.ndarray
+        structured array with `PLATE_FAILURE_DTYPE`
+    well_failures : set
+        `WellFailure`s built from `well_failure_records`.
+    plate_failures : set
+        `PlateFailure`s built from `plate_failure_records`.
     """
 
-    def __init__(self, df: pd.DataFrame):
-        self.df = self.subtract_plaque_area_background(df)
+    def __init__(self, df: pd.DataFrame, process: bool = True):
         assert df["PlateNum"].nunique() == 1
         self.barcode = df["Plate_barcode"].values[0]
         assert df["Dilution"].nunique() == 1
         self.dilution = df["Dilution"].values[0]
         self.variant = df["variant"].values[0]
-        self.plate_failed = False
-        self.well_failures: Set[failure.WellFailure] = set()
-        self.plate_failures: Set[failure.PlateFailure] = set()
-        self.calc_percentage_infected()
-        self.outside_image_area()
+        self.positions = utils.well_96_positions(df["Well"])
+        self.row = self._to_96(df["Row"].values, fill_value=0, dtype=np.int64)
+        self.column = self._to_96(df["Column"].values, fill_value=0, dtype=np.int64)
+        self.plaque_area = self._to_96(df[PLAQUE_AREA].values)
+        self.cell_region_area = self._to_96(df[CELL_REGION_AREA].values)
+        self._df: Optional[pd.DataFrame] = None
+        if process:
+            process_plates([self])
 
     def __len__(self):
-        return self.df.shape[0]
+        return len(self.positions)
 
     def __str__(self):
         return f"Plate {self.barcode}"
 
-    def outside_image_area(self) -> None:
-        """QC check for `cell_region_area`
+    def _to_96(
+        self, values: np.ndarray, fill_value: float = np.nan, dtype=np.float64
+    ) -> np.ndarray:
+        """place values in input order into an array indexed by 96-well position"""
+        arr = np.full(96, fill_value, dtype=dtype)
+        arr[self.positions] = values
+        return arr
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """Dataframe of the plate's wells, in input order"""
+        if self._df is None:
+            pos = self.positions
+            self._df = pd.DataFrame(
+                {
+                    "Row": self.row[pos],
+                    "Column": self.column[pos],
+                    "Well": pd.Categorical.from_codes(pos, categories=utils.WELLS_96),
+                    "Plate_barcode": self.barcode,
+                    "Dilution": self.dilution,
+                    "variant": self.variant,
+                    PLAQUE_AREA: self.plaque_area[pos],
+                    CELL_REGION_AREA: self.cell_region_area[pos],
+                    "Background Subtracted Plaque Area": self.background_subtracted_plaque_area[
+                        pos
+                    ],
+                    "Percentage Infected": self.percentage_infected[pos],
+                    "ratio": self.ratio[pos],
+                }
+            )
+        return self._df
 
-        Determines if `cell_region_area` is outside the expected range and
-        adds any failures to `well_failures`.
-        """
-        feature = "Cells - Image Region Area [µm²] - Mean per Well"
-        experiment_median = self.df[feature].median()
-        ratio = self.df[feature] / experiment_median
-        self.df["ratio"] = ratio
-        lower_limit = qc_criteria.low_cells_image_region_area_low
-        upper_limit = qc_criteria.low_cells_image_region_area_high
-        low = self.df[self.df["ratio"] < lower_limit]
-        high = self.df[self.df["ratio"] > upper_limit]
-        outliers = pd.concat([low, high])
-        control_outliers = outliers[outliers["Well"].str.endswith("12")]
-        if control_outliers.shape[0] > 0:
-            # plate failure due to control well failure
-            self.plate_failed = True
-            failed_plate = failure.PlateFailure(
+    @property
+    def well_failures(self) -> Set[failure.WellFailure]:
+        """Wells with a cell-region-area outside the expected range"""
+        return {
+            failure.WellFailure(
                 plate=self.barcode,
-                well=";".join(control_outliers["Well"]),
-                failure_reason=failure.CELL_IMAGE_AREA_FAILURE_REASON,
+                well=well,
+                failure_reason=failure.CELL_REGION_FAILURE_REASON,
             )
-            self.plate_failures.add(failed_plate)
-        if outliers.shape[0]:
-            for _, row in outliers.iterrows():
-                well_failure = failure.WellFailure(
+            for well in self._outlier_wells()
+        }
+
+    @property
+    def plate_failures(self) -> Set[failure.PlateFailure]:
+        """Plate failures from QC checks on control wells"""
+        plate_failures = set()
+        for reason, infection in self.plate_failure_records[["reason", "infection"]]:
+            if reason == CELL_IMAGE_AREA_FAILURE:
+                outliers = self._outlier_wells()
+                plate_failure = failure.PlateFailure(
                     plate=self.barcode,
-                    well=row["Well"],
-                    failure_reason=failure.CELL_REGION_FAILURE_REASON,
+                    well=";".join(i for i in outliers if i.endswith("12")),
+                    failure_reason=failure.CELL_IMAGE_AREA_FAILURE_REASON,
                 )
-                self.well_failures.add(well_failure)
-            # if there's more than 8 failures for DAPI wells, then flag
-            # as a possible plate failure
-            if outliers.shape[0] > 8:
-                # flag possible plate fail
-                self.plate_failed = True
+            elif reason == DAPI_PLATE_FAILURE:
                 # if there's too many wells then this string wont
                 # fit in the NE_failed_results.well column which
                 # is varchar(45)
-                well_names = ";".join(outliers["Well"])
+                well_names = ";".join(self._outlier_wells())
                 if len(well_names) >= 45:
                     well_names = "multiple wells (>8)"
-                failed_plate = failure.PlateFailure(
+                plate_failure = failure.PlateFailure(
                     plate=self.barcode,
                     well=well_names,
                     failure_reason=failure.DAPI_PLATE_FAILURE_REASON,
                 )
-                self.plate_failures.add(failed_plate)
-
-    def subtract_plaque_area_background(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Remove background from `plaque_area`.
-
-        1. Calculate the median of "Normalised Plaque area" fo no virus wells.
-
-        2. Subtract median from "Normalised Plaque area" for each well and save
-          as "Background Subtracted Plaque Area"
-
-        This is now done on a plate-by-plate basis.
-
-        Parameters
-        -----------
-        df : pandas.DataFrame
-
-        Returns
-        -------
-        pandas.DataFrame
-        """
-        feature = "Normalised Plaque area"
-        new_colname = "Background Subtracted Plaque Area"
-        no_virus_bool = df.Well.isin(NO_VIRUS_WELLS)
-        background = df[no_virus_bool][feature].median()
-        df[new_colname] = df[feature] - background
-        return df
-
-    def check_infection(self, infection: float) -> None:
-        """
-        Determines if infection rate of virus-only-wells is within
-        acceptable limts, flag as a plate failure if this is false.
-
-        Parameters
-        -----------
-        infection: float
-            infection rate of virus-only wells
-
-        Returns
-        -------
-        None
-            Adds a `plaque_assay.failure.PlateFailure` to
-            `self.plate_failures` if plate has failed.
-        """
-        infection_limits = qc_criteria.infection_rate[self.variant]
-        lower_limit = infection_limits["low"]
-        upper_limit = infection_limits["high"]
-        if infection < lower_limit or infection > upper_limit:
-            reason = f"virus-only infection median ({infection:3f}) outside range: ({lower_limit}, {upper_limit})"
-            self.plate_failed = True
-            failed_plate = failure.PlateFailure(
-                plate=self.barcode,
-                well=";".join(VIRUS_ONLY_WELLS),
-                failure_reason=reason,
-            )
-            self.plate_failures.add(failed_plate)
-
-    def calc_percentage_infected(self) -> None:
-        """Calculate percentage infected.
-
-        `Percentage Infected` is the `Background Subtracted Plaque Area`
-        divided by the median of the virus only wells x 100.
+            else:
+                infection_limits = qc_criteria.infection_rate[self.variant]
+                lower_limit = infection_limits["low"]
+                upper_limit = infection_limits["high"]
+                plate_failure = failure.PlateFailure(
+                    plate=self.barcode,
+                    well=";".join(VIRUS_ONLY_WELLS),
+                    failure_reason=f"virus-only infection median ({infection:3f}) outside range: ({lower_limit}, {upper_limit})",
+                )
+            plate_failures.add(plate_failure)
+        return plate_failures
 
-        Notes
-        ------
-        Also carries out a QC check. Determines if infection rate of
-        virus-only-wells is within acceptable limts, flag the plate if
-        this is false.
-        """
-        feature = "Background Subtracted Plaque Area"
-        virus_only_bool = self.df.Well.isin(VIRUS_ONLY_WELLS)
-        infection = self.df[virus_only_bool][feature].median()
-        self.check_infection(infection)
-        self.df["Percentage Infected"] = self.df[feature] / infection * 100
+    def _outlier_wells(self) -> np.ndarray:
+        return utils.WELLS_96[self.well_failure_records["position"]]
 
     def get_normalised_data(self) -> pd.DataFrame:
         """Return a simplified dataframe of just the normalised data
@@ -232,8 +239,7 @@ class Plate:
             "Percentage Infected",
             "variant",
         ]
-        temp_df = self.df.copy()
-        df_wanted = temp_df[wanted_cols]
+        df_wanted = self.df[wanted_cols]
         df_wanted = df_wanted.rename(
             columns={
                 "Background Subtracted Plaque Area": "Background_subtracted_plaque_area",
@@ -253,3 +259,118 @@ class Plate:
         norm_data = self.get_normalised_data()
         save_path = os.path.join(output_dir, f"{self.barcode}.csv")
         norm_data.to_csv(save_path, index=False)
+
+
+def process_plates(plates: Sequence[Plate]) -> None:
+    """Normalise and QC plates in a single pass.
+
+    1. Subtract the median "Normalised Plaque area" of the no virus wells
+       to give `background_subtracted_plaque_area`.
+    2. Divide by the median of the virus only wells x 100 to give
+       `percentage_infected`.
+    3. Flag plates where this infection rate is outside the variant's
+       limits, and wells and plates where the cell-region-area is outside
+       the expected range, see `plate_qc()`.
+
+    All plates must be the same variant. Results are set as attributes
+    on each plate.
+
+    Parameters
+    -----------
+    plates : list of Plate
+
+    Returns
+    --------
+    None
+    """
+    plaque_area = np.stack([plate.plaque_area for plate in plates])
+    cell_region_area = np.stack([plate.cell_region_area for plate in plates])
+    background = _nanmedian(plaque_area[:, NO_VIRUS_IDX])
+    background_subtracted = plaque_area - background[:, None]
+    infection = _nanmedian(background_subtracted[:, VIRUS_ONLY_IDX])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percentage_infected = background_subtracted / infection[:, None] * 100
+        ratio = cell_region_area / _nanmedian(cell_region_area)[:, None]
+    # position of each well in the input, for ordering failures
+    input_order = np.zeros(ratio.shape, dtype=np.intp)
+    for i, plate in enumerate(plates):
+        input_order[i, plate.positions] = np.arange(len(plate.positions))
+    well_failures, plate_failures = plate_qc(
+        ratio, infection, input_order, plates[0].variant
+    )
+    failed = np.zeros(len(plates), dtype=bool)
+    failed[plate_failures["plate"]] = True
+    for i, plate in enumerate(plates):
+        plate.background_subtracted_plaque_area = background_subtracted[i]
+        plate.percentage_infected = percentage_infected[i]
+        plate.ratio = ratio[i]
+        plate.well_failure_records = well_failures[well_failures["plate"] == i]
+        plate.plate_failure_records = plate_failures[plate_failures["plate"] == i]
+        plate.plate_failed = bool(failed[i])
+
+
+def plate_qc(
+    ratio: np.ndarray, infection: np.ndarray, input_order: np.ndarray, variant: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """QC checks for many plates at once.
+
+    - wells with a cell-region-area ratio outside the expected range are
+      well failures.
+    - if any of these are control wells (column 12), or there are more
+      than 8 on a plate, it is a plate failure.
+    - plates with a virus-only infection rate outside the variant's
+      limits are plate failures.
+
+    Parameters
+    -----------
+    ratio : numpy.ndarray
+        (n_plates, 96) cell-region-area divided by plate median
+    infection : numpy.ndarray
+        (n_plates,) median background subtracted plaque area of the
+        virus only wells
+    input_order : numpy.ndarray
+        (n_plates, 96) input position of each well, used to order failures
+    variant : str
+
+    Returns
+    --------
+    tuple
+        structured arrays of well failures (`WELL_FAILURE_DTYPE`) and
+        plate failures (`PLATE_FAILURE_DTYPE`)
+    """
+    low = ratio < qc_criteria.low_cells_image_region_area_low
+    high = ratio > qc_criteria.low_cells_image_region_area_high
+    outliers = low | high
+    plate_idx, position = np.nonzero(outliers)
+    order = np.lexsort(
+        (input_order[plate_idx, position], high[plate_idx, position], plate_idx)
+    )
+    well_failures = np.empty(len(order), dtype=WELL_FAILURE_DTYPE)
+    well_failures["plate"] = plate_idx[order]
+    well_failures["position"] = position[order]
+    infection_limits = qc_criteria.infection_rate[variant]
+    failed = [
+        (CELL_IMAGE_AREA_FAILURE, outliers[:, CONTROL_COLUMN_IDX].any(axis=1)),
+        (DAPI_PLATE_FAILURE, outliers.sum(axis=1) > 8),
+        (
+            INFECTION_FAILURE,
+            (infection < infection_limits["low"])
+            | (infection > infection_limits["high"]),
+        ),
+    ]
+    plate_failures = []
+    for reason, failed_plates in failed:
+        records = np.empty(np.count_nonzero(failed_plates), dtype=PLATE_FAILURE_DTYPE)
+        records["plate"] = np.flatnonzero(failed_plates)
+        records["reason"] = reason
+        records["infection"] = infection[failed_plates]
+        plate_failures.append(records)
+    return well_failures, np.concatenate(plate_failures)
+
+
+def _nanmedian(values: np.ndarray) -> np.ndarray:
+    """row medians ignoring missing wells, `NaN` if there are no values"""
+    medians = np.full(values.shape[0], np.nan)
+    has_values = ~np.isnan(values).all(axis=1)
+    medians[has_values] = np.nanmedian(values[has_values], axis=1)
+    return medians
@@ -0,0 +1,317 @@
+"""
+Starting points for curve fits from the parameters of previous runs.
+
+Positive controls, and samples of the same variant, have similar model
+parameters from one workflow to the next, so fitting from the parameters
+of previous runs rather than the default `plaque_assay.stats.P0` takes
+fewer function evaluations. Fits which don't converge from a prior are
+fitted again from `P0`, see `plaque_assay.stats.calc_model_results()`.
+
+A prior is the median of the fitted parameters for a variant and type of
+well, either the positive control wells (`consts.POSITIVE_CONTROL_WELLS`)
+or samples. Priors are only used when the `PLAQUE_ASSAY_PRIORS`
+environment variable is set, to either:
+
+- the path to a JSON file, which is read before fitting and updated
+  with the parameters of each run. Updates are locked with a
+  `<path>.lock` file, so concurrent runs sharing the file don't lose
+  each other's updates.
+- `lims`, to use the parameters of the last `PRIOR_WORKFLOWS` workflows
+  of the same variant from the `NE_model_parameters` table.
+"""
+
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import pandas as pd
+import sqlalchemy
+import sqlalchemy.orm
+
+from plaque_assay import consts, db_models, utils
+from plaque_assay.stats import ModelParams
+
+PRIORS_ENV = "PLAQUE_ASSAY_PRIORS"
+# value of `PRIORS_ENV` to read priors from the LIMS database
+PRIORS_FROM_LIMS = "lims"
+# suffix of the lock file held while updating a priors file
+LOCK_SUFFIX = ".lock"
+# number of previous workflows used for priors from the LIMS database
+PRIOR_WORKFLOWS = 10
+
+POSITIVE_CONTROL = "positive control"
+SAMPLE = "sample"
+PARAM_COLUMNS = ["param_top", "param_bottom", "param_ec50", "param_hillslope"]
+
+_POSITIVE_CONTROL_WELLS = {
+    utils.unpad_well(well) for well in consts.POSITIVE_CONTROL_WELLS
+}
+
+
+def well_type(well: str) -> str:
+    """Type of well used to look up priors
+
+    Parameters
+    -----------
+    well : str
+        96-well label, with or without zero-padding
+
+    Returns
+    --------
+    str
+        `POSITIVE_CONTROL` or `SAMPLE`
+    """
+    if utils.unpad_well(well) in _POSITIVE_CONTROL_WELLS:
+        return POSITIVE_CONTROL
+    return SAMPLE
+
+
+class PriorStore:
+    """Median model parameters for each variant and type of well.
+
+    Parameters
+    -----------
+    priors : dict, optional
+        `{variant: {well_type: [top, bottom, ec50, hillslope]}}`
+    """
+
+    def __init__(self, priors: Optional[Dict[str, Dict[str, List[float]]]] = None):
+        self.priors = priors if priors is not None else {}
+
+    def __len__(self):
+        return sum(len(i) for i in self.priors.values())
+
+    def get(self, variant: str, well: str) -> Optional[ModelParams]:
+        """Prior for a well
+
+        Parameters
+        -----------
+        variant : str
+        well : str
+
+        Returns
+        --------
+        `plaque_assay.stats.ModelParams` or None
+            `None` if there is no prior for the variant and type of well
+        """
+        params = self.priors.get(variant, {}).get(well_type(well))
+        if params is None:
+            return None
+        return ModelParams(*params)
+
+    def starting_points(
+        self, variant: str, wells: Sequence[str]
+    ) -> List[Optional[ModelParams]]:
+        """Priors for many wells, to pass to
+        `plaque_assay.stats.calc_model_results_batch()`
+
+        Parameters
+        -----------
+        variant : str
+        wells : list of str
+
+        Returns
+        --------
+        list
+            `plaque_assay.stats.ModelParams`, or `None` for each well
+            without a prior
+        """
+        return [self.get(variant, well) for well in wells]
+
+    def update(self, variant: str, model_parameters: pd.DataFrame) -> None:
+        """Replace priors with the medians of a run's fitted parameters
+
+        Wells without a fitted model are ignored, as are types of well
+        where no models were fitted.
+
+        Parameters
+        -----------
+        variant : str
+        model_parameters : pandas.DataFrame
+            with columns of `well` and `PARAM_COLUMNS`, as from
+            `plaque_assay.experiment.Experiment.get_model_parameters()`
+        """
+        params = model_parameters[PARAM_COLUMNS].astype(float)
+        fitted = params.notna().all(axis=1)
+        if not fitted.any():
+            return None
+        well_types = model_parameters["well"][fitted].map(well_type)
+        medians = params[fitted].groupby(well_types.values).median()
+        variant_priors = self.priors.setdefault(variant, {})
+        for name, row in medians.iterrows():
+            variant_priors[name] = [float(i) for i in row]
+        logging.debug("updated priors for %s: %s", variant, variant_priors)
+
+    @classmethod
+    def load(cls, path: str) -> "PriorStore":
+        """Read priors from a JSON file
+
+        A missing or unreadable file gives an empty store.
+
+        Parameters
+        -----------
+        path : str
+
+        Returns
+        --------
+        PriorStore
+        """
+        try:
+            with open(path) as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            logging.info("no priors file at %s", path)
+        except (OSError, ValueError) as error:
+            logging.warning("can't read priors from %s: %s", path, error)
+        return cls()
+
+    def save(self, path: str) -> None:
+        """Save priors as JSON
+
+        The file is written to a temporary file and then renamed, so
+        concurrent runs never read a partial file. Failures are logged
+        and otherwise ignored.
+
+        Parameters
+        -----------
+        path : str
+        """
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(path)), prefix=".priors."
+            )
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.priors, f, indent=2)
+            os.replace(tmp_path, path)
+            tmp_path = None
+        except OSError as error:
+            logging.warning("can't save priors to %s: %s", path, error)
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    @classmethod
+    def from_database(
+        cls,
+        session: sqlalchemy.orm.Session,
+        variant: str,
+        n_workflows: int = PRIOR_WORKFLOWS,
+    ) -> "PriorStore":
+        """Priors from the model parameters of previous workflows
+
+        Parameters
+        -----------
+        session : sqlalchemy.orm.Session
+        variant : str
+        n_workflows : int
+            number of the most recent workflows of `variant` to use
+
+        Returns
+        --------
+        PriorStore
+        """
+        table = db_models.NE_model_parameters
+        # joined rather than `IN (...)`, as MySQL doesn't support LIMIT
+        # in IN subqueries
+        workflows = (
+            sqlalchemy.select(table.workflow_id)
+            .where(table.variant == variant)
+            .distinct()
+            .order_by(table.workflow_id.desc())
+            .limit(n_workflows)
+            .subquery()
+        )
+        rows = session.execute(
+            sqlalchemy.select(
+                table.well,
+                table.param_top,
+                table.param_bottom,
+                table.param_ec50,
+                table.param_hillslope,
+            )
+            .join(workflows, table.workflow_id == workflows.c.workflow_id)
+            .where(table.variant == variant)
+        ).all()
+        store = cls()
+        if rows:
+            store.update(variant, pd.DataFrame(rows, columns=["well", *PARAM_COLUMNS]))
+        return store
+
+
+def get_priors(session: sqlalchemy.orm.Session, variant: str) -> Optional[PriorStore]:
+    """Priors for a run, if enabled with `PLAQUE_ASSAY_PRIORS`
+
+    Parameters
+    -----------
+    session : sqlalchemy.orm.Session
+    variant : str
+
+    Returns
+    --------
+    PriorStore or None
+        `None` if priors are not enabled
+    """
+    source = os.environ.get(PRIORS_ENV)
+    if not source:
+        return None
+    if source == PRIORS_FROM_LIMS:
+        return PriorStore.from_database(session, variant)
+    return PriorStore.load(source)
+
+
+def save_priors(variant: str, model_parameters: pd.DataFrame) -> None:
+    """Update the priors file with a run's model parameters, if
+    `PLAQUE_ASSAY_PRIORS` is set to a file
+
+    The file is read again before updating, as other runs may have
+    updated it in the meantime, and is locked from reading to saving so
+    concurrent updates are applied one after another, see `_locked()`.
+
+    Parameters
+    -----------
+    variant : str
+    model_parameters : pandas.DataFrame
+        from `plaque_assay.experiment.Experiment.get_model_parameters()`
+    """
+    path = os.environ.get(PRIORS_ENV)
+    if not path or path == PRIORS_FROM_LIMS:
+        return None
+    with _locked(path):
+        store = PriorStore.load(path)
+        store.update(variant, model_parameters)
+        store.save(path)
+
+
+@contextmanager
+def _locked(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on `path` + `LOCK_SUFFIX`
+
+    The lock is a separate file as the priors file itself is replaced
+    when saved. If the lock can't be taken, such as on platforms without
+    `fcntl`, the update goes ahead unlocked.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        logging.debug("fcntl not available, updating %s unlocked", path)
+        yield None
+        return None
+    try:
+        lock_file = open(path + LOCK_SUFFIX, "a")
+    except OSError as error:
+        logging.warning("can't lock priors file %s: %s", path, error)
+        yield None
+        return None
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield None
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
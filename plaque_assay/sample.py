@@ -1,11 +1,10 @@
 """
 module docstring
 """
-from typing import List, Union, Set
+from typing import List, Optional, Union, Set
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from plaque_assay import stats
 from plaque_assay import failure
@@ -30,6 +29,10 @@ class Sample:
         2 column dataframe: [dilution, value]
     variant : string
         virus variant name, used for variant-specific QC checks
+    model_results : plaque_assay.stats.ModelResults, optional
+        pre-computed model results, e.g from
+        `plaque_assay.stats.calc_model_results_batch()`. If `None` then
+        the model is fitted for this sample alone.
 
     Attributes
     ----------
@@ -62,18 +65,24 @@ class Sample:
         via fitting a curve.
     """
 
-    def __init__(self, sample_name: str, data: pd.DataFrame, variant: str):
+    def __init__(
+        self,
+        sample_name: str,
+        data: pd.DataFrame,
+        variant: str,
+        model_results: Optional[stats.ModelResults] = None,
+    ):
         self.sample_name = sample_name
         self.data = data
         self.variant = variant
         self.failures: Set[Union[failure.WellFailure, failure.PlateFailure]] = set()
-        self.calc_ic50()
+        self.calc_ic50(model_results)
         self.is_positive_control = sample_name in POSITIVE_CONTROL_WELLS
         self.check_positive_control()
         self.check_duplicate_differences()
         self.check_for_model_fit_failure()
 
-    def calc_ic50(self):
+    def calc_ic50(self, model_results: Optional[stats.ModelResults] = None):
         """calculate IC50 value
 
         This calculates an IC50 value if possible, though this could also
@@ -90,12 +99,16 @@ class Sample:
 
         Parameters
         ----------
+        model_results : plaque_assay.stats.ModelResults, optional
+            pre-computed model results, if `None` then these are
+            calculated from `data`.
 
         Returns
         --------
         None
         """
-        model_results = stats.calc_model_results(self.sample_name, self.data)
+        if model_results is None:
+            model_results = stats.calc_model_results(self.sample_name, self.data)
         self.fit_method = model_results.fit_method
         self.ic50 = model_results.result
         self.ic50_pretty = (
@@ -230,6 +243,9 @@ class Sample:
         --------
         matplotlib.pyplot.plot
         """
+        # imported here as it's slow to import and only needed for plots
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=[10, 6])
         plt.axhline(y=50, linestyle="--", color="grey")
         plt.scatter(1 / self.data["Dilution"], self.data["Percentage Infected"])
@@ -0,0 +1,165 @@
+"""
+Binary columnar sidecars of parsed PlateResults.txt files.
+
+The first time a PlateResults.txt file is parsed, the columns read by
+`plaque_assay.ingest.read_plate_results()` are saved to a
+`PlateResults.columns` sidecar file next to it, in the same `Evaluation*`
+directory. Later reads memory-map the columns from the sidecar rather
+than parsing the text again.
+
+A sidecar is a JSON header line, padded to `ALIGNMENT` bytes, followed
+by the raw bytes of each column in turn. The header records the size
+and modification time of the source file the sidecar was made from,
+along with the columns, their types and their offsets. The sidecar is
+ignored and replaced if the source file or columns no longer match.
+
+Sidecars are only used when the `PLAQUE_ASSAY_SIDECAR` environment
+variable is set. Plate directories which can't be written to, such as
+read-only archives, are read as normal.
+"""
+
+import json
+import logging
+import mmap
+import os
+import tempfile
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from plaque_assay import consts
+
+SIDECAR_ENV = "PLAQUE_ASSAY_SIDECAR"
+SIDECAR_NAME = "PlateResults.columns"
+# bump when the layout of sidecars changes
+SIDECAR_VERSION = 1
+# header and columns start on multiples of this many bytes
+ALIGNMENT = 64
+
+
+def sidecar_enabled() -> bool:
+    """Whether sidecars are enabled in the environment"""
+    return os.environ.get(SIDECAR_ENV, "").lower() in ("1", "true", "yes")
+
+
+def sidecar_path(path: str) -> str:
+    """Path to the sidecar for a PlateResults.txt file
+
+    Parameters
+    -----------
+    path : str
+        path to PlateResults.txt
+
+    Returns
+    --------
+    str
+    """
+    return os.path.join(os.path.dirname(path), SIDECAR_NAME)
+
+
+def _source_meta(stat: os.stat_result) -> Dict:
+    return {
+        "version": SIDECAR_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "columns": list(consts.PLATE_RESULTS_DTYPES),
+        "dtypes": list(consts.PLATE_RESULTS_DTYPES.values()),
+    }
+
+
+def _align(n: int) -> int:
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def read_sidecar(path: str) -> Optional[pd.DataFrame]:
+    """Memory-map the columns from the sidecar of a PlateResults.txt file
+
+    Parameters
+    -----------
+    path : str
+        path to PlateResults.txt
+
+    Returns
+    --------
+    pandas.DataFrame or None
+        columns are read-only arrays backed by the memory-mapped
+        sidecar, or `None` if there is no sidecar or it doesn't match
+        the source file.
+    """
+    sidecar = sidecar_path(path)
+    try:
+        with open(sidecar, "rb") as f:
+            meta = json.loads(f.readline())
+            expected = _source_meta(os.stat(path))
+            if {key: meta.get(key) for key in expected} != expected:
+                logging.debug("sidecar %s is out of date", sidecar)
+                return None
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        columns = {
+            col: np.frombuffer(buffer, dtype=dtype, count=meta["n_rows"], offset=offset)
+            for col, dtype, offset in zip(
+                meta["columns"], meta["dtypes"], meta["offsets"]
+            )
+        }
+    except (OSError, ValueError, KeyError) as error:
+        logging.debug("can't read sidecar %s: %s", sidecar, error)
+        return None
+    return pd.DataFrame(columns, copy=False)
+
+
+def write_sidecar(path: str, df: pd.DataFrame) -> None:
+    """Save the parsed columns of a PlateResults.txt file as a sidecar
+
+    The sidecar is written to a temporary file and then renamed, so
+    readers never see a partial sidecar. Failures are logged and
+    otherwise ignored.
+
+    Parameters
+    -----------
+    path : str
+        path to PlateResults.txt
+    df : pandas.DataFrame
+        from `plaque_assay.ingest.read_plate_results()`
+
+    Returns
+    --------
+    None
+    """
+    sidecar = sidecar_path(path)
+    tmp_path = None
+    try:
+        meta = _source_meta(os.stat(path))
+        arrays = [
+            df[col].to_numpy(dtype=dtype)
+            for col, dtype in zip(meta["columns"], meta["dtypes"])
+        ]
+        # offsets are from the start of the file, so depend on the length
+        # of the header, which is padded to leave room for the offsets
+        meta["n_rows"] = len(df)
+        meta["offsets"] = [0] * len(arrays)
+        header_size = _align(len(json.dumps(meta)) + 32 * len(arrays))
+        offset = header_size
+        for i, array in enumerate(arrays):
+            meta["offsets"][i] = offset
+            offset += _align(array.nbytes)
+        header = json.dumps(meta).encode() + b"\n"
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=f".{SIDECAR_NAME}."
+        )
+        with os.fdopen(fd, "wb") as f:
+            f.write(header.ljust(header_size, b" "))
+            for array in arrays:
+                data = array.tobytes()
+                f.write(data.ljust(_align(len(data)), b"\0"))
+        os.replace(tmp_path, sidecar)
+        tmp_path = None
+        logging.debug("saved sidecar %s", sidecar)
+    except OSError as error:
+        logging.debug("can't write sidecar %s: %s", sidecar, error)
+    finally:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
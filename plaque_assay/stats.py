@@ -2,25 +2,51 @@
 Stats and number crunching functions.
 """
 
+import functools
 import logging
-from typing import NamedTuple, List, Callable, Optional, Union
+import time
+from typing import NamedTuple, List, Callable, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import pandas as pd
 import scipy.optimize
-from numba import jit
 
 from plaque_assay import utils
 from plaque_assay import consts
-
+from plaque_assay import instrument
+from plaque_assay import kernels
 
 Numeric = Union[int, float]
 
 
+# initial guess, bounds and evaluation limit for fitting the 4 parameter
+# dose-response model, shared by the per-sample and batched fitting paths
+P0 = (0, 100, 0.015, 1)
+BOUNDS = ((0, 90, -10, 0), (20, 120, 10, 5))
+MAXFEV = 500
+# fits of `dr_4` with a hill slope below this are flat, so the EC50 is
+# undetermined and the curve heuristics depend on rounding. These are
+# fitted again with finite differences as `scipy.optimize.curve_fit()`
+# does by default, so they end up where they always have.
+COLLAPSED_HILL_SLOPE = 1e-6
+# version of the fitting and curve checking code, part of cache keys so
+# bump this whenever a change alters `ModelResults`, see `plaque_assay.cache`
+FIT_VERSION = 1
+
+# `classify_dilutions()` result for samples which need a model fitting
+NO_HEURISTIC = 0
+
+
+# reasons for failing to find a single intersect at the threshold
+NO_CROSSING = "no crossing"
+MULTIPLE_CROSSINGS = "multiple crossings"
+
+
 class Intersect(NamedTuple):
     x: Numeric
     y: Numeric
     error: bool
+    reason: Optional[str] = None
 
 
 class ModelParams(NamedTuple):
@@ -76,6 +102,101 @@ def dr_4(
     # during optimisation numpy doesn't like raising negative numbers
     # to a fractional power, this stops it spamming up the logs
     with np.errstate(invalid="ignore"):
+        return _dr_4(x, top, bottom, ec50, hill_slope)
+
+
+def _dr_4(
+    x: np.ndarray, top: Numeric, bottom: Numeric, ec50: Numeric, hill_slope: Numeric
+) -> np.ndarray:
+    """`dr_4` without the numpy error state, which is set once for a
+    whole fit rather than for every evaluation"""
+    return (bottom - top) / (1 + (x / ec50) ** hill_slope)
+
+
+def dr_3_jacobian(
+    x: np.ndarray, top: Numeric, bottom: Numeric, ec50: Numeric
+) -> np.ndarray:
+    """Partial derivatives of `dr_3` with respect to each parameter
+
+    Parameters
+    -----------
+    x : array-like
+    top : numeric
+    bottom : numeric
+    ec50 : numeric
+
+    Returns
+    --------
+    array-like
+        shape of `x` plus a last axis of the derivatives with respect to
+        top, bottom and ec50
+    """
+    x = np.asarray(x, dtype=float)
+    d_top = x / (ec50 + x)
+    d_ec50 = -x * (top - bottom) / (ec50 + x) ** 2
+    return np.stack([d_top, 1 - d_top, d_ec50], axis=-1)
+
+
+def dr_4_jacobian(
+    x: np.ndarray, top: Numeric, bottom: Numeric, ec50: Numeric, hill_slope: Numeric
+) -> np.ndarray:
+    """Partial derivatives of `dr_4` with respect to each parameter
+
+    Parameters
+    -----------
+    x : array-like
+    top : numeric
+    bottom : numeric
+    ec50 : numeric
+    hill_slope : numeric
+
+    Returns
+    --------
+    array-like
+        shape of `x` plus a last axis of the derivatives with respect to
+        top, bottom, ec50 and hill_slope
+    """
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        return _dr_4_jacobian(np.asarray(x, dtype=float), top, bottom, ec50, hill_slope)
+
+
+def _dr_4_jacobian(
+    x: np.ndarray, top: Numeric, bottom: Numeric, ec50: Numeric, hill_slope: Numeric
+) -> np.ndarray:
+    """`dr_4_jacobian` without the numpy error state, parameters can be
+    scalars or columns for many samples"""
+    ratio = x / ec50
+    # dr_4 is (bottom - top) * r, with r = 1 / (1 + u) and
+    # u = ratio ** hill_slope. The derivatives of r contain
+    # u / (1 + u) ** 2, written as r * (1 - r) to stay finite when u
+    # overflows
+    r = 1 / (1 + ratio ** hill_slope)
+    r_slope = r * (1 - r)
+    scale = bottom - top
+    d_ec50 = scale * r_slope * hill_slope / ec50
+    # log(ratio) is -inf where x is 0, but r_slope is then 0
+    d_hill_slope = np.where(r_slope == 0, 0.0, -scale * r_slope * np.log(ratio))
+    return np.stack(np.broadcast_arrays(-r, r, d_ec50, d_hill_slope), axis=-1)
+
+
+def dr_4_batch(x: np.ndarray, params: np.ndarray) -> np.ndarray:
+    """4 parameter dose response curve for many samples at once
+
+    Parameters
+    -----------
+    x : 2-d array
+        shape (n_samples, n_points), or (1, n_points) to evaluate every
+        sample at the same points
+    params : 2-d array
+        shape (n_samples, 4), columns of top, bottom, ec50, hill_slope
+
+    Returns
+    --------
+    2-d array
+        shape (n_samples, n_points)
+    """
+    top, bottom, ec50, hill_slope = (params[:, [i]] for i in range(4))
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
         return (bottom - top) / (1 + (x / ec50) ** hill_slope)
 
 
@@ -100,23 +221,111 @@ def intersect_between_curves(
     line = np.full(x.shape, intersect)
     idx_arr = np.argwhere(np.diff(np.sign(line - curve))).flatten()
     error = False
+    reason = None
     if len(idx_arr) != 1:
         error = True
+        reason = NO_CROSSING if len(idx_arr) == 0 else MULTIPLE_CROSSINGS
         x_intersect = np.nan
         y_intersect = np.nan
     else:
         try:
-            idx = int(idx_arr)
+            idx = int(idx_arr[0])
             x_intersect = float(x[idx])
             y_intersect = float(curve[idx])
         except (IndexError, ValueError):
             x_intersect = np.nan
             y_intersect = np.nan
             error = True
-    result = Intersect(x_intersect, y_intersect, error)
+    result = Intersect(x_intersect, y_intersect, error, reason)
     return result
 
 
+def intersect_dr_4(
+    x_min: Numeric,
+    x_max: Numeric,
+    model_params: ModelParams,
+    intersect: Numeric = 50,
+    grid_compatible: bool = False,
+) -> Intersect:
+    """Find where a fitted `dr_4` curve crosses y = `intersect`.
+
+    When the curve is monotonic between `x_min` and `x_max` (positive
+    `ec50` and `hill_slope`) there is at most one crossing, which is
+    solved directly with `find_y_intercept()`. Otherwise the curve is
+    evaluated with `intersect_between_curves()` to decide between no
+    crossing and multiple crossings.
+
+    Parameters
+    ----------
+    x_min : numeric
+    x_max : numeric
+    model_params : ModelParams
+        fitted parameters of `dr_4`
+    intersect : numeric
+    grid_compatible : bool
+        if `True` then return the same 10,000 point log-spaced grid value
+        as `intersect_between_curves()`, for comparison with historical
+        results. Otherwise return the exact crossing.
+
+    Returns
+    --------
+    Intersect
+    """
+    top, bottom, ec50, hill_slope = model_params
+    if not (ec50 > 0 and hill_slope > 0):
+        curve = dr_4(_intersect_grid(x_min, x_max), *model_params)
+        return intersect_between_curves(x_min, x_max, curve, intersect)
+    # dr_4 has no offset, so is `find_y_intercept()` with top = 0
+    # and bottom = (bottom - top)
+    y_min, y_max = dr_4(np.array([x_min, x_max], dtype=float), *model_params)
+    if np.sign(intersect - y_min) == np.sign(intersect - y_max):
+        return Intersect(np.nan, np.nan, True, NO_CROSSING)
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        x_intersect = find_y_intercept(0, bottom - top, ec50, hill_slope, intersect)
+    if not x_min <= x_intersect <= x_max:
+        # lost precision with a very steep or very flat curve
+        x_intersect = scipy.optimize.brentq(
+            lambda x: dr_4(x, *model_params) - intersect, x_min, x_max
+        )
+    if grid_compatible:
+        return _snap_intersect_to_grid(
+            x_min, x_max, x_intersect, model_params, intersect
+        )
+    return Intersect(float(x_intersect), float(intersect), False)
+
+
+@functools.lru_cache(maxsize=8)
+def _intersect_grid(x_min: Numeric, x_max: Numeric) -> np.ndarray:
+    """the x-values `intersect_between_curves()` expects `curve` to cover"""
+    grid = np.logspace(np.log10(x_min), np.log10(x_max), 10000)
+    grid.flags.writeable = False
+    return grid
+
+
+def _snap_intersect_to_grid(
+    x_min: Numeric,
+    x_max: Numeric,
+    x_intersect: float,
+    model_params: ModelParams,
+    intersect: Numeric,
+) -> Intersect:
+    """
+    Grid point before the crossing, as found by `intersect_between_curves()`,
+    only evaluating the curve on the grid points either side of the root.
+    """
+    grid = _intersect_grid(x_min, x_max)
+    idx = int(np.searchsorted(grid, x_intersect))
+    start = max(idx - 2, 0)
+    local_x = grid[start : idx + 2]
+    local_curve = dr_4(local_x, *model_params)
+    crossings = np.argwhere(np.diff(np.sign(intersect - local_curve))).flatten()
+    if len(crossings) != 1:
+        curve = dr_4(grid, *model_params)
+        return intersect_between_curves(x_min, x_max, curve, intersect)
+    local_idx = int(crossings[0])
+    return Intersect(float(local_x[local_idx]), float(local_curve[local_idx]), False)
+
+
 def find_y_intercept(
     top: float, bottom: float, ec50: float, hillslope: float, y: float = 50.0
 ) -> float:
@@ -130,10 +339,19 @@ def find_y_intercept(
     return ec50 * (((bottom - top) / (y - top)) - 1.0) ** (1.0 / hillslope)
 
 
+# functions evaluated while fitting each model, and their jacobians
+_FIT_FUNCTIONS = {dr_4: (_dr_4, _dr_4_jacobian), dr_3: (dr_3, dr_3_jacobian)}
+
+
 def non_linear_model(x: Numeric, y: Numeric, func: Callable = dr_4) -> ModelParams:
     """
     fit non-linear least squares to the data
 
+    `dr_4` and `dr_3` are fitted with their analytic jacobians, other
+    functions with finite differences. Fits of `dr_4` where the hill slope
+    collapses are fitted again with finite differences, see
+    `COLLAPSED_HILL_SLOPE`.
+
     Parameters
     ----------
     x : numeric
@@ -144,13 +362,131 @@ def non_linear_model(x: Numeric, y: Numeric, func: Callable = dr_4) -> ModelPara
     --------
     `plaque_assay.stats.ModelParams`
     """
-    # initial guess at sensible parameters
-    p0 = [0, 100, 0.015, 1]
-    bounds = ((0, 90, -10, 0), (20, 120, 10, 5))
-    popt, *_ = scipy.optimize.curve_fit(
-        func, x, y, p0=p0, method="trf", bounds=bounds, maxfev=500
-    )
-    return ModelParams(*popt)
+    return _non_linear_model(x, y, func)[0]
+
+
+def _non_linear_model(
+    x: Numeric, y: Numeric, func: Callable = dr_4, p0: Sequence[Numeric] = P0
+) -> Tuple[ModelParams, int]:
+    """`non_linear_model()` also returning the number of function evaluations"""
+    model, jac = _FIT_FUNCTIONS.get(func, (func, "2-point"))
+    model_params, nfev = _curve_fit(x, y, model, jac, p0)
+    collapsed = model_params.hill_slope < COLLAPSED_HILL_SLOPE
+    if func is dr_4 and jac != "2-point" and collapsed:
+        model_params, refit_nfev = _curve_fit(x, y, model, "2-point", p0)
+        nfev += refit_nfev
+    return model_params, nfev
+
+
+def _curve_fit(
+    x: Numeric,
+    y: Numeric,
+    func: Callable,
+    jac: Union[Callable, str],
+    p0: Sequence[Numeric],
+) -> Tuple[ModelParams, int]:
+    """`scipy.optimize.curve_fit()` with the bounds and evaluation limit
+    of `non_linear_model()`"""
+    # set once for the whole fit rather than for every evaluation, see `dr_4`
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        popt, _, infodict, *_ = scipy.optimize.curve_fit(
+            func,
+            x,
+            y,
+            p0=p0,
+            jac=jac,
+            method="trf",
+            bounds=BOUNDS,
+            maxfev=MAXFEV,
+            full_output=True,
+        )
+    return ModelParams(*popt), infodict["nfev"]
+
+
+def _warm_start_model(
+    x: Numeric, y: Numeric, p0: Optional[Sequence[Numeric]] = None
+) -> Tuple[Optional[ModelParams], int, bool]:
+    """
+    `_non_linear_model()` starting from `p0`, falling back to the default
+    initial guess `P0` if that doesn't converge.
+
+    Returns the model parameters, or `None` if neither fit converged,
+    the total number of function evaluations, and whether the fit fell
+    back to `P0`. Residuals which aren't finite at the initial guess,
+    such as from infinite values, also count as not converging.
+    """
+    model_params: Optional[ModelParams] = None
+    nfev = 0
+    if p0 is not None:
+        try:
+            model_params, nfev = _non_linear_model(x, y, p0=p0)
+        except RuntimeError:
+            nfev = MAXFEV
+        except ValueError as error:
+            logging.warning("can't fit from %s: %s", p0, error)
+    fallback = p0 is not None and model_params is None
+    if model_params is None:
+        try:
+            model_params, cold_nfev = _non_linear_model(x, y)
+        except RuntimeError:
+            cold_nfev = MAXFEV
+        except ValueError as error:
+            logging.warning("can't fit model: %s", error)
+            cold_nfev = 0
+        nfev += cold_nfev
+    return model_params, nfev, fallback
+
+
+def non_linear_model_batch(
+    xs: Sequence[np.ndarray],
+    ys: Sequence[np.ndarray],
+    p0s: Optional[Sequence[Optional[Sequence[Numeric]]]] = None,
+) -> List[Optional[ModelParams]]:
+    """
+    fit non-linear least squares to many samples
+
+    Each sample is fitted with the same `scipy.optimize.curve_fit()` call
+    as `non_linear_model()`, so the parameters are identical to fitting
+    the samples one at a time. The work around the fits, evaluating the
+    fitted curves and their errors and outliers, is done for all samples
+    together by `calc_model_results_batch()`.
+
+    Parameters
+    ----------
+    xs : list of array-like
+        x-values for each sample
+    ys : list of array-like
+        y-values for each sample, same lengths as `xs`
+    p0s : list, optional
+        initial guess for each sample, such as from
+        `plaque_assay.priors.PriorStore`, or `None` for samples which
+        start from `P0`. Samples which don't converge from their initial
+        guess are fitted again from `P0`.
+
+    Returns
+    --------
+    list
+        `plaque_assay.stats.ModelParams` for each sample, or `None` where
+        the fit did not converge (where `non_linear_model()` would raise a
+        `RuntimeError`).
+    """
+    return _non_linear_model_batch(xs, ys, p0s)[0]
+
+
+def _non_linear_model_batch(
+    xs: Sequence[np.ndarray],
+    ys: Sequence[np.ndarray],
+    p0s: Optional[Sequence[Optional[Sequence[Numeric]]]] = None,
+) -> Tuple[List[Optional[ModelParams]], np.ndarray, np.ndarray]:
+    """`non_linear_model_batch()` also returning the number of function
+    evaluations for each sample, and whether each sample fell back to `P0`"""
+    if p0s is None:
+        p0s = [None] * len(xs)
+    fits = [_warm_start_model(x, y, p0) for x, y, p0 in zip(xs, ys, p0s)]
+    results = [model_params for model_params, _, _ in fits]
+    nfev = np.array([n for _, n, _ in fits], dtype=int)
+    fallback = np.array([fell_back for _, _, fell_back in fits], dtype=bool)
+    return results, nfev, fallback
 
 
 def model_mse(y_observed: np.ndarray, y_fitted: np.ndarray) -> float:
@@ -173,6 +509,124 @@ def model_mse(y_observed: np.ndarray, y_fitted: np.ndarray) -> float:
     return np.nanmean((y_observed - y_fitted) ** 2)
 
 
+def dilution_array(
+    dilutions: Sequence[np.ndarray], values: Sequence[np.ndarray]
+) -> np.ndarray:
+    """
+    Arrange the percentage infected values of many samples by dilution
+    and replicate, for `classify_dilutions()`.
+
+    Missing values, and values with a missing dilution, are dropped.
+    Dilutions are converted to the 40 -> 40_000 labels used by
+    `plaque_assay.consts`, rounded to the nearest 10.
+
+    Parameters
+    -----------
+    dilutions : list of array-like
+        dilution values for each sample
+    values : list of array-like
+        percentage infected values for each sample, same lengths
+        as `dilutions`
+
+    Returns
+    --------
+    numpy.ndarray
+        shape `(n_samples, n_dilutions, n_replicates)`, NaN where a
+        sample has fewer replicates or is missing a dilution. The first
+        4 dilutions are `consts.DILUTION_1` to `consts.DILUTION_4`,
+        followed by any other dilutions found in ascending order.
+    """
+    lengths = [len(value) for value in values]
+    sample = np.repeat(np.arange(len(values)), lengths)
+    x = np.concatenate([np.asarray(i, dtype=float) for i in dilutions] + [[]])
+    y = np.concatenate([np.asarray(i, dtype=float) for i in values] + [[]])
+    keep = ~(np.isnan(x) | np.isnan(y))
+    sample, x, y = sample[keep], x[keep], y[keep]
+    # convert dilutions into 40 -> 40_000, rounded to nearest 10
+    labels = np.round((1 / x).astype(int), -1)
+    columns = [
+        consts.DILUTION_1,
+        consts.DILUTION_2,
+        consts.DILUTION_3,
+        consts.DILUTION_4,
+    ]
+    columns += sorted(set(np.unique(labels).tolist()) - set(columns))
+    column = (labels[:, np.newaxis] == np.array(columns)).argmax(axis=1)
+    # replicate number within each sample and dilution, keeping the
+    # original order of the values
+    order = np.lexsort((column, sample))
+    sample, column, y = sample[order], column[order], y[order]
+    group = sample * len(columns) + column
+    position = np.arange(len(group))
+    starts = np.ones(len(group), dtype=bool)
+    starts[1:] = group[1:] != group[:-1]
+    replicate = position - np.maximum.accumulate(np.where(starts, position, 0))
+    n_replicates = replicate.max() + 1 if len(replicate) else 1
+    arr = np.full((len(values), len(columns), n_replicates), np.nan)
+    arr[sample, column, replicate] = y
+    return arr
+
+
+def classify_dilutions(
+    arr: np.ndarray, threshold: Numeric, weak_threshold: Numeric
+) -> np.ndarray:
+    """Simple heuristics based on the values without model fitting,
+    for many samples at once
+
+    The mean of the replicates at each dilution is compared with the
+    thresholds:
+
+    - complete inhibition if every dilution, or the 2 most dilute
+      dilutions, are below `threshold`
+    - weak inhibition if the least dilute dilution is between
+      `threshold` and `weak_threshold`
+    - no inhibition if every dilution is above `weak_threshold`
+
+    Missing dilutions, possibly removed due to high-background, are
+    skipped for the next dilution along, and if that is missing too the
+    sample is labelled as failed to fit. Later rules take precedence.
+
+    Parameters
+    -----------
+    arr : numpy.ndarray
+        percentage infected values from `dilution_array()`
+    threshold : numeric
+    weak_threshold : numeric
+
+    Returns
+    --------
+    numpy.ndarray
+        integer result code for each sample, or `NO_HEURISTIC` where the
+        sample needs a model fitting
+    """
+    count = np.sum(~np.isnan(arr), axis=2)
+    present = count > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg = np.nansum(arr, axis=2) / count
+        below = present & (avg <= threshold)
+        weak = present & (avg > threshold) & (avg < weak_threshold)
+        above = present & (avg > weak_threshold)
+    has_1, has_2, has_3, has_4 = present[:, :4].T
+    below_2, below_3, below_4 = below[:, 1:4].T
+    complete_inhibition = utils.result_to_int("complete inhibition")
+    failed = utils.result_to_int("failed to fit model")
+    result = np.full(len(arr), NO_HEURISTIC)
+    result[np.all(below | ~present, axis=1)] = complete_inhibition
+    # if 2 most dilute values are below threshold, then label it as
+    # complete inhibition, trying the next dilution if one is missing
+    skip_4 = ~has_4 | (below_4 & ~has_3)
+    result[(below_4 & below_3) | (skip_4 & below_3 & below_2)] = complete_inhibition
+    result[skip_4 & (~has_3 | (below_3 & ~has_2))] = failed
+    # check for weak inhibition, trying the next dilution if one is missing
+    result[np.where(has_1, weak[:, 0], weak[:, 1])] = utils.result_to_int(
+        "weak inhibition"
+    )
+    result[~has_1 & ~has_2] = failed
+    # check for no inhibition
+    result[np.all(above | ~present, axis=1)] = utils.result_to_int("no inhibition")
+    return result
+
+
 def calc_heuristics_dilutions(
     group: pd.DataFrame, threshold: Numeric, weak_threshold: Numeric
 ) -> Optional[Numeric]:
@@ -189,65 +643,21 @@ def calc_heuristics_dilutions(
     numeric
         IC50 value, or negative integer indicating an error code
     """
-    result = None
-    avg = group.groupby("Dilution")["Percentage Infected"].mean()
-    # convert dilutions into 40 -> 40_000
-    avg.index = 1 / avg.index
-    avg.index = avg.index.astype(int)
-    # round to nearest 10
-    avg.index = [round(i, -1) for i in avg.index]
-    # for complete inhibition
-    if all(avg.values <= threshold):
-        result = "complete inhibition"
-    try:
-        # if 2 most dilute values are below threshold, then
-        # label it as complete inhibition
-        if avg[consts.DILUTION_4] <= threshold and avg[consts.DILUTION_3] <= threshold:
-            result = "complete inhibition"
-    except KeyError:
-        # missing this dilution, possibly removed due to high-background
-        try:
-            # try the next dilution
-            if (
-                avg[consts.DILUTION_3] <= threshold
-                and avg[consts.DILUTION_2] <= threshold
-            ):
-                result = "complete inhibition"
-        except KeyError:
-            # if this returns a KeyError aswell we're missing 2 dilutions
-            # so we can't get anthing meaningful from the model
-            result = "failed to fit model"
-    # check for weak inhibition
-    try:
-        if (
-            avg[consts.DILUTION_1] > threshold
-            and avg[consts.DILUTION_1] < weak_threshold
-        ):
-            result = "weak inhibition"
-    except KeyError:
-        # missing this dilution, possibly removed due to high-background
-        try:
-            # try the next dilution
-            if (
-                avg[consts.DILUTION_2] > threshold
-                and avg[consts.DILUTION_2] < weak_threshold
-            ):
-                result = "weak inhibition"
-        except KeyError:
-            # if this returns a KeyError aswell we're missing 2 dilutions
-            # so we can't get anthing meaningful from the model
-            result = "failed to fit model"
-    # check for no inhibition
-    if all(avg.values > weak_threshold):
-        result = "no inhibition"
-    if result:
-        return utils.result_to_int(result)
+    arr = dilution_array([group["Dilution"]], [group["Percentage Infected"]])
+    result = classify_dilutions(arr, threshold, weak_threshold)[0]
+    if result != NO_HEURISTIC:
+        return int(result)
     else:
         return None
 
 
 def calc_heuristics_curve(
-    name: str, x: np.ndarray, y: np.ndarray, threshold: Numeric, weak_threshold: Numeric
+    name: str,
+    x: np.ndarray,
+    y: np.ndarray,
+    threshold: Numeric,
+    weak_threshold: Numeric,
+    outliers: Optional[Sequence[int]] = None,
 ) -> Optional[int]:
     """
     heuristics based on the model fit where we cannot calculate the intercept
@@ -261,6 +671,9 @@ def calc_heuristics_curve(
     y : array-like
     threshold : numeric
     weak_threshold : numeric
+    outliers : list of int, optional
+        `hampel(y, 5)` if already calculated, such as by
+        `kernels.hampel_batch()` for many curves at once
 
     Returns
     -------
@@ -270,13 +683,16 @@ def calc_heuristics_curve(
     """
     result = None
     # look for sharp changes in the curve shape indicating a bad fit
-    outliers = hampel(y, 5)
-    if outliers:
+    if outliers is None:
+        outliers = hampel(y, 5)
+    if len(outliers):
         result = "failed to fit model"
         logging.warning("well %s model failed due to hampel outliers on curve", name)
     # look for times when the curve doesn't reach below threshold but
     # drops below weak_threshold indicated "weak inhibition"
-    if min(y) > threshold and min(y) < weak_threshold:
+    # same as the builtin `min(y)`, which is NaN if the first value is NaN
+    y_min = y[0] if np.isnan(y[0]) else np.nanmin(y)
+    if y_min > threshold and y_min < weak_threshold:
         # determine minimum is on the side we would expect (1:40)
         idx_min = np.argmin(y)
         # checking for greater than as the actual values are inverted because
@@ -292,7 +708,12 @@ def calc_heuristics_curve(
 
 
 def calc_model_results(
-    name: str, df: pd.DataFrame, threshold: int = 50, weak_threshold: int = 60
+    name: str,
+    df: pd.DataFrame,
+    threshold: int = 50,
+    weak_threshold: int = 60,
+    grid_compatible: bool = False,
+    p0: Optional[Sequence[Numeric]] = None,
 ) -> ModelResults:
     """
     Try simple heuristics first without model fitting.
@@ -305,58 +726,222 @@ def calc_model_results(
     df : pandas.DataFrame
     threshold : numeric
     weak_threshold : numeric
+    grid_compatible : bool
+        if `True` the IC50 is quantised to the 10,000 point grid used
+        by `intersect_between_curves()`, see `intersect_dr_4()`.
+    p0 : list, optional
+        initial guess for the model parameters, such as from
+        `plaque_assay.priors.PriorStore`. If the fit doesn't converge
+        then it is fitted again from the default `P0`.
 
     Returns
     --------
     `plaque_assay.stats.ModelResults`
     """
-    # TODO: fix this monstrosity
     df = df.dropna().sort_values("Dilution")
+    heuristic = calc_heuristics_dilutions(df, threshold, weak_threshold)
+    if heuristic is not None:
+        logging.debug("well %s fitted with method %s", name, "heuristic")
+        return ModelResults("heuristic", heuristic, None, None)
     x = df["Dilution"].values
+    y = df["Percentage Infected"].values
+    # fit non-linear_model
+    start = time.perf_counter()
+    model_params, nfev, fallback = _warm_start_model(x, y, p0)
+    instrument.record_fit(
+        name,
+        time.perf_counter() - start,
+        nfev,
+        converged=model_params is not None,
+        batched=False,
+        warm_start=p0 is not None,
+        fallback=fallback,
+    )
+    return _model_fit_results(
+        name, x, y, model_params, threshold, weak_threshold, grid_compatible
+    )
+
+
+def calc_model_results_batch(
+    names: Sequence[str],
+    dilutions: Sequence[np.ndarray],
+    values: Sequence[np.ndarray],
+    threshold: int = 50,
+    weak_threshold: int = 60,
+    grid_compatible: bool = False,
+    p0s: Optional[Sequence[Optional[Sequence[Numeric]]]] = None,
+) -> List[ModelResults]:
+    """
+    `calc_model_results()` for many samples, checking all curves together.
+
+    Heuristics are applied to all samples together with
+    `classify_dilutions()`, then every sample which needs a model is
+    fitted with `non_linear_model_batch()`, and the fitted curves are
+    evaluated and checked together.
+
+    Parameters
+    -----------
+    names : list of str
+        sample names, typically well labels
+    dilutions : list of array-like
+        dilution values for each sample
+    values : list of array-like
+        percentage infected values for each sample, same lengths
+        as `dilutions`
+    threshold : numeric
+    weak_threshold : numeric
+    grid_compatible : bool
+    p0s : list, optional
+        initial guess for each sample, or `None` for samples which start
+        from the default `P0`, see `non_linear_model_batch()`
+
+    Returns
+    --------
+    list
+        `plaque_assay.stats.ModelResults` for each sample, in the same
+        order as `names`
+    """
+    results: List[Optional[ModelResults]] = [None] * len(names)
+    to_fit = []
+    heuristics = classify_dilutions(
+        dilution_array(dilutions, values), threshold, weak_threshold
+    )
+    for idx, (name, dilution, value) in enumerate(zip(names, dilutions, values)):
+        if heuristics[idx] != NO_HEURISTIC:
+            logging.debug("well %s fitted with method %s", name, "heuristic")
+            results[idx] = ModelResults("heuristic", int(heuristics[idx]), None, None)
+        else:
+            x = np.asarray(dilution, dtype=float)
+            y = np.asarray(value, dtype=float)
+            keep = ~(np.isnan(x) | np.isnan(y))
+            order = np.argsort(x[keep], kind="quicksort")
+            to_fit.append((idx, x[keep][order], y[keep][order]))
+    if to_fit:
+        indices, xs, ys = zip(*to_fit)
+        p0 = [None if p0s is None else p0s[idx] for idx in indices]
+        start = time.perf_counter()
+        fitted, nfev, fallback = _non_linear_model_batch(xs, ys, p0)
+        seconds = (time.perf_counter() - start) / len(xs)
+        for idx, model_params, n, fell_back in zip(indices, fitted, nfev, fallback):
+            instrument.record_fit(
+                names[idx],
+                seconds,
+                n,
+                converged=model_params is not None,
+                batched=True,
+                warm_start=p0s is not None and p0s[idx] is not None,
+                fallback=fell_back,
+            )
+        fit_results = _model_fit_results_batch(
+            [names[idx] for idx in indices],
+            xs,
+            ys,
+            fitted,
+            threshold,
+            weak_threshold,
+            grid_compatible,
+        )
+        for idx, fit_result in zip(indices, fit_results):
+            results[idx] = fit_result
+    return results  # type: ignore
+
+
+def _model_fit_results(
+    name: str,
+    x: np.ndarray,
+    y: np.ndarray,
+    model_params: Optional[ModelParams],
+    threshold: Numeric,
+    weak_threshold: Numeric,
+    grid_compatible: bool = False,
+) -> ModelResults:
+    """
+    Curve heuristics and IC50 from fitted model parameters, `model_params`
+    is `None` if the model failed to fit.
+    """
+    return _model_fit_results_batch(
+        [name], [x], [y], [model_params], threshold, weak_threshold, grid_compatible
+    )[0]
+
+
+def _model_fit_results_batch(
+    names: Sequence[str],
+    xs: Sequence[np.ndarray],
+    ys: Sequence[np.ndarray],
+    fitted: Sequence[Optional[ModelParams]],
+    threshold: Numeric,
+    weak_threshold: Numeric,
+    grid_compatible: bool = False,
+) -> List[ModelResults]:
+    """
+    `_model_fit_results()` for many samples.
+
+    The interpolated curves, mean squared errors and Hampel outliers of
+    every fitted sample are calculated together, the latter two with
+    the compiled kernels in `plaque_assay.kernels`.
+    """
     x_min = (1 / consts.DILUTION_4) / 10
     x_max = (1 / consts.DILUTION_1) * 10
     x_interpolated = np.logspace(np.log10(x_min), np.log10(x_max), 10000)
-    y = df["Percentage Infected"].values
-    model_params = None
-    mean_squared_error = None
-    heuristic = calc_heuristics_dilutions(df, threshold, weak_threshold)
-    if heuristic is not None:
-        result = heuristic
-        fit_method = "heuristic"
-    else:
-        # fit non-linear_model
-        try:
-            model_params = non_linear_model(x, y)
-        except RuntimeError:
-            model_params = None
-            result = utils.result_to_int("failed to fit model")
+    is_fitted = [i for i, model_params in enumerate(fitted) if model_params is not None]
+    # row in the batched arrays for each fitted sample
+    rows = {i: row for row, i in enumerate(is_fitted)}
+    if is_fitted:
+        params = np.array([fitted[i] for i in is_fitted], dtype=float)
+        lengths = np.array([len(xs[i]) for i in is_fitted])
+        x_observed = np.full((len(is_fitted), lengths.max()), np.nan)
+        y_observed = np.full_like(x_observed, np.nan)
+        for row, i in enumerate(is_fitted):
+            x_observed[row, : lengths[row]] = xs[i]
+            y_observed[row, : lengths[row]] = ys[i]
+        # predicted y-values for interpolated x-values, useful to generate curve
+        curves = dr_4_batch(x_interpolated[np.newaxis], params)
+        # predicted y-values only for dilution x-values, useful for MSE
+        # calculation
+        y_hat = dr_4_batch(x_observed, params)
+        mean_squared_errors = kernels.mse_batch(y_hat, y_observed, lengths)
+        outliers = kernels.hampel_batch(curves, 5, 3)
+    results = []
+    for i, (name, x, model_params) in enumerate(zip(names, xs, fitted)):
+        mean_squared_error = None
         fit_method = "model fit"
-        if model_params is not None:
-            # predicted y-values for interpolated x-values, useful to generate curve
-            y_fitted = dr_4(x_interpolated, *model_params)
-            # predicted y-values only for dilution x-values, useful for MSE
-            # calculation
-            y_hat = dr_4(x, *model_params)
-            mean_squared_error = model_mse(y_hat, y)
+        if model_params is None:
+            result = utils.result_to_int("failed to fit model")
+        else:
+            row = rows[i]
+            mean_squared_error = float(mean_squared_errors[row])
             if mean_squared_error > 99999:
                 logging.warning("MSE > 99999, clipped to 99999 to fit in database")
                 mean_squared_error = 99999
             curve_heuristics = calc_heuristics_curve(
-                name, x_interpolated, y_fitted, threshold, weak_threshold
+                name,
+                x_interpolated,
+                curves[row],
+                threshold,
+                weak_threshold,
+                outliers=np.flatnonzero(outliers[row]),
             )
             if curve_heuristics is not None:
                 result = curve_heuristics
             else:
-                intersect = intersect_between_curves(x_min, x_max, y_fitted)
+                intersect = intersect_dr_4(
+                    x_min, x_max, model_params, threshold, grid_compatible
+                )
                 if intersect.error:
-                    logging.error("error caused when finding intersect at y=50")
+                    logging.error(
+                        "error caused when finding intersect at y=50: %s",
+                        intersect.reason,
+                    )
                     result = utils.result_to_int("failed to fit model")
                     model_params = None
                 else:
                     result = 1.0 / intersect.x
                     result = recast_if_out_of_bounds_ic50(result, x, name)
-    logging.debug("well %s fitted with method %s", name, fit_method)
-    return ModelResults(fit_method, result, model_params, mean_squared_error)
+        logging.debug("well %s fitted with method %s", name, fit_method)
+        results.append(
+            ModelResults(fit_method, result, model_params, mean_squared_error)
+        )
+    return results
 
 
 def recast_if_out_of_bounds_ic50(
@@ -385,11 +970,11 @@ def recast_if_out_of_bounds_ic50(
     return result
 
 
-@jit(nopython=True)
 def hampel(x: np.ndarray, k: int, t0: int = 3) -> List:
     """Hampel's outlier test
 
-    Adapted from hampel function in R package pracma.
+    Adapted from hampel function in R package pracma. The test is run
+    by `kernels.hampel_batch()`, use that directly for many series.
 
     Parameters
     -----------
@@ -405,14 +990,5 @@ def hampel(x: np.ndarray, k: int, t0: int = 3) -> List:
     array-like
         indices in x of outliers
     """
-    n = len(x)
-    L = 1.4826
-    indices = []
-    for i in range((k + 1), (n - k)):
-        if np.isnan(x[(i - k) : (i + k + 1)]).all():
-            continue
-        x0 = np.nanmedian(x[(i - k) : (i + k + 1)])
-        S0 = L * np.nanmedian(np.abs(x[(i - k) : (i + k + 1)] - x0))
-        if np.abs(x[i] - x0) > t0 * S0:
-            indices.append(i)
-    return indices
+    x = np.asarray(x, dtype=float)[np.newaxis]
+    return np.flatnonzero(kernels.hampel_batch(x, k, t0)[0]).tolist()
@@ -78,12 +78,9 @@ class TitrationDatabaseUploader(BaseDatabaseUploader):
         )
         # unpad wells
         normalised_results["well"] = [unpad_well(i) for i in normalised_results["well"]]
-        # remove NaN/infs
-        normalised_results = self.fix_for_mysql(normalised_results)
-        # bulk insert mappings
-        self.session.bulk_insert_mappings(
-            db_models.NE_virus_titration_normalised_results,
-            normalised_results.to_dict(orient="records"),
+        # NaN/infs are inserted as null
+        self.bulk_insert_dataframe(
+            db_models.NE_virus_titration_normalised_results, normalised_results
         )
 
     def upload_model_parameters(self, model_parameters: pd.DataFrame) -> None:
@@ -108,10 +105,8 @@ class TitrationDatabaseUploader(BaseDatabaseUploader):
         None
             writes to database
         """
-        model_parameters = self.fix_for_mysql(model_parameters)
-        self.session.bulk_insert_mappings(
-            db_models.NE_virus_titration_model_parameters,
-            model_parameters.to_dict(orient="records"),
+        self.bulk_insert_dataframe(
+            db_models.NE_virus_titration_model_parameters, model_parameters
         )
 
     def upload_final_results(self, final_results: pd.DataFrame) -> None:
@@ -133,12 +128,9 @@ class TitrationDatabaseUploader(BaseDatabaseUploader):
         None
             writes to database
         """
-        # remove NaN/infs
-        final_results = self.fix_for_mysql(final_results)
-        # bulk insert mappings
-        self.session.bulk_insert_mappings(
-            db_models.NE_virus_titration_final_results,
-            final_results.to_dict(orient="records"),
+        # NaN/infs are inserted as null
+        self.bulk_insert_dataframe(
+            db_models.NE_virus_titration_final_results, final_results
         )
 
     def update_workflow_tracking(self, workflow_id: int) -> None:
@@ -1,42 +1,44 @@
 import logging
 import os
-from glob import glob
 from typing import List
 
 import pandas as pd
 
 from plaque_assay import consts, utils
+from plaque_assay.ingest import find_plate_results, map_threads, read_plate_results
 from plaque_assay.titration import consts as titration_consts
 from plaque_assay.titration import utils as titration_utils
 
 
-def read_data_from_list(plate_list: List[str]) -> pd.DataFrame:
+def read_data_from_list(
+    plate_list: List[str], use_pyarrow: bool = False
+) -> pd.DataFrame:
     """Read in titration data from a plate_list,
     assigns dilution and sample info based on well position.
 
     Parameters
     -----------
     plate_list: list
+    use_pyarrow: bool
+        use the pyarrow csv engine, see `plaque_assay.ingest.read_plate_results()`
 
     Returns
     --------
     pd.DataFrame
+
+    Notes
+    ------
+    The plates are found and read concurrently, see
+    `plaque_assay.ingest.map_threads()`.
     """
-    dataframes = []
-    for path in plate_list:
-        evaluations = glob(os.path.join(path, "Evaluation*", "PlateResults.txt"))
-        plate_results_path = sorted(evaluations)[-1]
-        if len(evaluations) > 1:
-            logging.warning(
-                f"multiple Evaluation dirs found, using the latest: {plate_results_path}"
-            )
-        df = pd.read_csv(plate_results_path, skiprows=8, sep="\t")
+    plate_results_paths = map_threads(find_plate_results, plate_list)
+    dataframes = map_threads(
+        lambda path: read_plate_results(path, use_pyarrow), plate_results_paths
+    )
+    for path, df in zip(plate_list, dataframes):
         plate_barcode = path.split(os.sep)[-1].split("__")[0]
         logging.info("plate barcode detected as %s", plate_barcode)
-        well_labels = []
-        for row, col in df[["Row", "Column"]].itertuples(index=False):
-            well_labels.append(utils.row_col_to_well(row, col))
-        df["Well"] = well_labels
+        df["Well"] = utils.row_col_to_well_array(df["Row"], df["Column"])
         df["Plate_barcode"] = plate_barcode
         # Empty wells with no background produce NaNs rather than 0 in the
         # image analysis, which causes missing data for truely complete
@@ -45,7 +47,6 @@ def read_data_from_list(plate_list: List[str]) -> pd.DataFrame:
         fillna_cols = ["Normalised Plaque area", "Normalised Plaque intensity"]
         for colname in fillna_cols:
             df[colname] = df[colname].fillna(0)
-        dataframes.append(df)
     df_concat = pd.concat(dataframes)
     # sample dilutions (1-4)
     dilution_int = [
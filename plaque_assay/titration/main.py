@@ -1,43 +1,60 @@
-from typing import List
+from typing import List, Optional
 
 import sqlalchemy
 
-from plaque_assay import utils
-from plaque_assay.main import create_engine
+from plaque_assay import instrument, utils
+from plaque_assay.main import get_engine
 
 from . import db_uploader, ingest
 from .titration_class import Titration
 
 
-def run(plate_list: List[str]) -> None:
+def run(
+    plate_list: List[str], engine: Optional[sqlalchemy.engine.base.Engine] = None
+) -> None:
     """Run titration analysis pipeline
 
     Parameters
     -----------
     plate_list : list
+    engine : sqlalchemy.engine.Engine, optional
+        Database engine, if `None` then connects to the production
+        LIMS database with `plaque_assay.main.get_engine()`.
 
     Returns
     -------
     None
         writes to database
     """
-    engine = create_engine(test=False)
+    instrument.reset()
+    if engine is None:
+        engine = get_engine(test=False)
     Session = sqlalchemy.orm.sessionmaker(bind=engine)
-    session = Session()
-    lims_db_titration = db_uploader.TitrationDatabaseUploader(session)
-    workflow_id = utils.get_workflow_id_from_plate_list(plate_list)
-    variant = utils.get_variant_from_plate_list(plate_list, session, titration=True)
-    if lims_db_titration.already_uploaded(workflow_id):
-        print(f"workflow_id: {workflow_id} already have results in the database")
-        # still exist successfully so task is marked complete
-        return None
-    dataset = ingest.read_data_from_list(plate_list)
-    titration = Titration(dataset, variant=variant)
-    normalised_results = titration.get_normalised_results()
-    final_results = titration.get_final_results()
-    model_parameters = titration.get_model_parameters()
-    lims_db_titration.upload_normalised_results(normalised_results)
-    lims_db_titration.upload_final_results(final_results)
-    lims_db_titration.upload_model_parameters(model_parameters)
-    lims_db_titration.update_workflow_tracking(workflow_id=workflow_id)
-    lims_db_titration.commit()
+    # closing the session returns its connection to the engine's pool
+    with Session() as session:
+        lims_db_titration = db_uploader.TitrationDatabaseUploader(session)
+        with instrument.timer("lims_lookup"):
+            workflow_id = utils.get_workflow_id_from_plate_list(plate_list)
+            variant = utils.get_variant_from_plate_list(
+                plate_list, session, titration=True
+            )
+            already_uploaded = lims_db_titration.already_uploaded(workflow_id)
+        if already_uploaded:
+            print(f"workflow_id: {workflow_id} already have results in the database")
+            # still exist successfully so task is marked complete
+            return None
+        with instrument.timer("read_data"):
+            dataset = ingest.read_data_from_list(plate_list)
+        with instrument.timer("titration"):
+            titration = Titration(dataset, variant=variant)
+        with instrument.timer("results"):
+            normalised_results = titration.get_normalised_results()
+            final_results = titration.get_final_results()
+            model_parameters = titration.get_model_parameters()
+        with instrument.timer("upload"):
+            lims_db_titration.upload_normalised_results(normalised_results)
+            lims_db_titration.upload_final_results(final_results)
+            lims_db_titration.upload_model_parameters(model_parameters)
+            lims_db_titration.update_workflow_tracking(workflow_id=workflow_id)
+            lims_db_titration.commit()
+    instrument.export(f"titration workflow:{workflow_id}")
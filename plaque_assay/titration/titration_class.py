@@ -8,6 +8,7 @@ from typing import Dict, List, Optional
 
 import pandas as pd
 
+from plaque_assay import executor
 from plaque_assay import utils
 from plaque_assay.sample import Sample
 from plaque_assay.titration.dilution import TitrationDilution
@@ -19,11 +20,27 @@ class Titration:
     Parameters
     -----------
     titration_dataset: pd.DataFrame
+    variant: str
+    batch_fit: bool
+        if `True` then the fitted curves of all samples are checked
+        together with `plaque_assay.stats.calc_model_results_batch()`,
+        otherwise each sample is fitted and checked individually.
+    n_workers: int, optional
+        number of processes used to fit samples, see
+        `plaque_assay.executor.fit_samples()`.
     """
 
-    def __init__(self, titration_dataset: pd.DataFrame, variant: str):
+    def __init__(
+        self,
+        titration_dataset: pd.DataFrame,
+        variant: str,
+        batch_fit: bool = True,
+        n_workers: Optional[int] = None,
+    ):
         self.dataset = titration_dataset
         self.variant = variant
+        self.batch_fit = batch_fit
+        self.n_workers = n_workers
         self.workflow_id = self.dataset["Plate_barcode"].values[0][3:]
         dilution_store = dict()
         for dilution, df in titration_dataset.groupby("Virus_dilution_factor"):
@@ -47,12 +64,24 @@ class Titration:
             `{sample_name: Sample`}
         """
         sample_dict: Dict[str, Sample] = dict()
-        for (dilution, nanobody), group in self.df.groupby(
-            ["Virus_dilution_factor", "nanobody"]
-        ):
-            sample_df = group[["Dilution", "Percentage Infected"]]
-            sample_name = f"{dilution}-{int(nanobody)}"
-            sample_dict[sample_name] = Sample(sample_name, sample_df, self.variant)
+        groups = [
+            (f"{dilution}-{int(nanobody)}", group[["Dilution", "Percentage Infected"]])
+            for (dilution, nanobody), group in self.df.groupby(
+                ["Virus_dilution_factor", "nanobody"]
+            )
+        ]
+        names = [name for name, _ in groups]
+        all_model_results = executor.fit_samples(
+            names,
+            [sample_df["Dilution"].values for _, sample_df in groups],
+            [sample_df["Percentage Infected"].values for _, sample_df in groups],
+            batch_fit=self.batch_fit,
+            n_workers=self.n_workers,
+        )
+        for (sample_name, sample_df), model_results in zip(groups, all_model_results):
+            sample_dict[sample_name] = Sample(
+                sample_name, sample_df, self.variant, model_results
+            )
         return sample_dict
 
     def get_final_results(self) -> pd.DataFrame:
@@ -1,13 +1,22 @@
+import logging
 import math
 import os
 import string
-from typing import List, Union
+import threading
+import time
+import weakref
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import sqlalchemy
 import sqlalchemy.orm
 
-from plaque_assay.db_models import NE_available_strains
+from plaque_assay.db_models import (
+    NE_available_strains,
+    NE_final_results,
+    NE_workflow_tracking,
+)
 from plaque_assay.errors import VariantLookupError
 
 RESULT_TO_INT = {
@@ -98,6 +107,8 @@ def unpad_well(well: str) -> str:
 def unpad_well_col(well_col: Union[List, pd.Series]) -> List:
     """Remove padding from an entire column of well labels
 
+    Each unique well label is only unpadded once.
+
     Parameters
     -----------
     well_col : list or pandas.Series
@@ -107,7 +118,9 @@ def unpad_well_col(well_col: Union[List, pd.Series]) -> List:
     list
         list of same well labels as input but without zero-padding
     """
-    return [unpad_well(i) for i in well_col]
+    wells = pd.Categorical(well_col)
+    unpadded = wells.rename_categories([unpad_well(i) for i in wells.categories])
+    return list(unpadded)
 
 
 def well_384_to_96(well: str) -> str:
@@ -226,6 +239,161 @@ def mock_384_barcode(
     return new_barcodes
 
 
+# lookup tables for 384-well plates, indexed by `index_384(row, col)`
+N_ROWS_384 = 16
+N_COLS_384 = 24
+WELLS_384 = np.array(
+    [
+        row_col_to_well(row, col)
+        for row in range(1, N_ROWS_384 + 1)
+        for col in range(1, N_COLS_384 + 1)
+    ]
+)
+WELLS_96 = np.array(sorted({well_384_to_96(well) for well in WELLS_384}))
+# position of the 96-well label in `WELLS_96` for each 384 well
+WELLS_96_CODES_384 = np.searchsorted(
+    WELLS_96, [well_384_to_96(well) for well in WELLS_384]
+)
+DILUTIONS_384 = np.array([get_dilution_from_384_well_label(i) for i in WELLS_384])
+
+
+def index_384(
+    rows: Union[np.ndarray, pd.Series], cols: Union[np.ndarray, pd.Series]
+) -> np.ndarray:
+    """Position of wells in the 384-well lookup tables
+
+    Parameters
+    -----------
+    rows : array-like
+        integer row labels (1-indexed)
+    cols : array-like
+        integer column labels (1-indexed)
+
+    Returns
+    --------
+    numpy.ndarray
+    """
+    return (np.asarray(rows) - 1) * N_COLS_384 + np.asarray(cols) - 1
+
+
+def row_col_to_well_array(
+    rows: Union[np.ndarray, pd.Series], cols: Union[np.ndarray, pd.Series]
+) -> pd.Categorical:
+    """`row_col_to_well()` for arrays of 384-well plate rows and columns
+
+    Parameters
+    -----------
+    rows : array-like
+        integer row labels (1-indexed)
+    cols : array-like
+        integer column labels (1-indexed)
+
+    Returns
+    --------
+    pandas.Categorical
+        well labels
+    """
+    return pd.Categorical.from_codes(index_384(rows, cols), categories=WELLS_384)
+
+
+def well_384_to_96_array(
+    rows: Union[np.ndarray, pd.Series], cols: Union[np.ndarray, pd.Series]
+) -> pd.Categorical:
+    """`well_384_to_96()` for arrays of 384-well plate rows and columns
+
+    Parameters
+    -----------
+    rows : array-like
+        integer row labels (1-indexed)
+    cols : array-like
+        integer column labels (1-indexed)
+
+    Returns
+    --------
+    pandas.Categorical
+        96-well labels
+    """
+    codes = WELLS_96_CODES_384[index_384(rows, cols)]
+    return pd.Categorical.from_codes(codes, categories=WELLS_96)
+
+
+def well_96_positions(wells: Union[List, pd.Series]) -> np.ndarray:
+    """Position of 96-well labels in `WELLS_96`
+
+    Parameters
+    -----------
+    wells : list or pandas.Series
+        zero-padded 96-well labels
+
+    Returns
+    --------
+    numpy.ndarray
+        integer positions, row-major from "A01" = 0 to "H12" = 95
+
+    Raises
+    -------
+    ValueError
+        if any labels are not 96-well labels
+    """
+    positions = pd.Categorical(wells, categories=WELLS_96).codes.astype(np.intp)
+    if (positions < 0).any():
+        raise ValueError("unrecognised 96-well labels")
+    return positions
+
+
+def dilution_from_384_array(
+    rows: Union[np.ndarray, pd.Series], cols: Union[np.ndarray, pd.Series]
+) -> np.ndarray:
+    """`get_dilution_from_384_well_label()` for arrays of rows and columns
+
+    Parameters
+    -----------
+    rows : array-like
+        integer row labels (1-indexed)
+    cols : array-like
+        integer column labels (1-indexed)
+
+    Returns
+    --------
+    numpy.ndarray
+        dilution numbers [1, 2, 3 or 4]
+    """
+    return DILUTIONS_384[index_384(rows, cols)]
+
+
+def mock_384_barcode_array(
+    existing_barcodes: Union[List, pd.Series],
+    rows: Union[np.ndarray, pd.Series],
+    cols: Union[np.ndarray, pd.Series],
+) -> pd.Categorical:
+    """`mock_384_barcode()` for arrays of rows and columns
+
+    Parameters
+    -----------
+    existing_barcodes : list or pandas.Series
+    rows : array-like
+        integer row labels (1-indexed)
+    cols : array-like
+        integer column labels (1-indexed)
+
+    Returns
+    --------
+    pandas.Categorical
+        new barcodes
+    """
+    barcodes = pd.Categorical(existing_barcodes)
+    # every barcode with each of the 4 dilutions
+    mock_barcodes = np.array(
+        [
+            f"A{dilution_int}{barcode[2:]}"
+            for barcode in barcodes.categories
+            for dilution_int in (1, 2, 3, 4)
+        ]
+    )
+    codes = barcodes.codes * 4 + dilution_from_384_array(rows, cols) - 1
+    return pd.Categorical(mock_barcodes[codes])
+
+
 def get_prefix_from_full_path(full_path: str) -> str:
     """Get prefix from full path
 
@@ -248,6 +416,168 @@ def get_prefix_from_full_path(full_path: str) -> str:
     return prefix
 
 
+# seconds before the NE_available_strains index is read again
+STRAIN_INDEX_TTL = 600.0
+# minimum seconds between reading the index again for unknown prefixes,
+# so pairing many plates doesn't read the table for every mismatch
+STRAIN_INDEX_MISS_INTERVAL = 5.0
+
+
+class StrainIndex:
+    """In-memory index of NE_available_strains plate prefixes to variants.
+
+    The whole strain table is read in one query and kept for `ttl`
+    seconds, so resolving many plate pairs costs a single read. Prefixes
+    not in the index are looked up once more after reading the table
+    again, so newly registered strains are found without waiting for
+    the index to expire. Use `invalidate()` to force a fresh read.
+
+    Parameters
+    -----------
+    ttl : float
+        seconds before the table is read again
+    miss_interval : float
+        minimum seconds since the last read before the table is read
+        again for unknown prefixes
+    """
+
+    def __init__(
+        self,
+        ttl: float = STRAIN_INDEX_TTL,
+        miss_interval: float = STRAIN_INDEX_MISS_INTERVAL,
+    ):
+        self.ttl = ttl
+        self.miss_interval = miss_interval
+        self._variants: Dict[Tuple[str, str], str] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def invalidate(self) -> None:
+        """Discard the index so it is read again on next use"""
+        with self._lock:
+            self._loaded_at = None
+
+    def load(self, session: sqlalchemy.orm.Session) -> None:
+        """Read NE_available_strains into the index
+
+        Parameters
+        -----------
+        session : sqlalchemy.orm.session.Session
+        """
+        rows = session.execute(
+            sqlalchemy.select(
+                NE_available_strains.plate_id_1,
+                NE_available_strains.plate_id_2,
+                NE_available_strains.mutant_strain,
+            ).order_by(NE_available_strains.id)
+        ).all()
+        variants: Dict[Tuple[str, str], str] = {}
+        for plate_id_1, plate_id_2, mutant_strain in rows:
+            # first entry wins for duplicated prefixes
+            variants.setdefault((plate_id_1, plate_id_2), mutant_strain)
+        self._variants = variants
+        self._loaded_at = time.monotonic()
+        logging.debug("loaded %d strains from NE_available_strains", len(variants))
+
+    def lookup(self, prefixes: List[str], session: sqlalchemy.orm.Session) -> str:
+        """Variant name for a pair of "S" plate prefixes
+
+        The NE_available_strains table has no guarantee that the
+        prefixes will be registered with an "S" prefix, so the prefixes
+        are also tried without the "S" if not found.
+
+        Parameters
+        -----------
+        prefixes : list
+            2 plate prefixes starting with "S", e.g `["S01", "S02"]`
+        session : sqlalchemy.orm.session.Session
+            used to read the table if the index is stale, or the
+            prefixes are not found
+
+        Returns
+        --------
+        str
+            variant name
+
+        Raises
+        -------
+        plaque_assay.errors.VariantLookupError
+            if the prefixes do not match any known variant
+        """
+        with self._lock:
+            if self.is_stale:
+                self.load(session)
+            variant = self._find(prefixes)
+            if (
+                variant is None
+                and time.monotonic() - self._loaded_at >= self.miss_interval
+            ):
+                # may have been registered since the table was read
+                self.load(session)
+                variant = self._find(prefixes)
+        if variant is None:
+            raise VariantLookupError(
+                "plate barcode prefixes do not match any known variants in the ",
+                f"LIMS database: {prefixes}",
+            )
+        return variant
+
+    def _find(self, prefixes: List[str]) -> Optional[str]:
+        prefix_1, prefix_2 = sorted(prefixes)
+        variant = self._variants.get((prefix_1, prefix_2))
+        if variant is None:
+            variant = self._variants.get((prefix_1[1:], prefix_2[1:]))
+        return variant
+
+
+# one index per database, so test databases don't share strains with LIMS
+_STRAIN_INDEXES: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_STRAIN_INDEXES_LOCK = threading.Lock()
+
+
+def get_strain_index(session: sqlalchemy.orm.Session) -> StrainIndex:
+    """Shared `StrainIndex` for the database a session is bound to
+
+    Parameters
+    -----------
+    session : sqlalchemy.orm.session.Session
+
+    Returns
+    --------
+    StrainIndex
+    """
+    bind = session.get_bind()
+    with _STRAIN_INDEXES_LOCK:
+        index = _STRAIN_INDEXES.get(bind)
+        if index is None:
+            index = _STRAIN_INDEXES[bind] = StrainIndex()
+    return index
+
+
+def invalidate_strain_index(
+    session: Optional[sqlalchemy.orm.Session] = None,
+) -> None:
+    """Force NE_available_strains to be read again on next lookup
+
+    Parameters
+    -----------
+    session : sqlalchemy.orm.session.Session, optional
+        only invalidate the index for this session's database,
+        if `None` then all indexes are invalidated.
+    """
+    if session is not None:
+        get_strain_index(session).invalidate()
+        return None
+    with _STRAIN_INDEXES_LOCK:
+        indexes = list(_STRAIN_INDEXES.values())
+    for index in indexes:
+        index.invalidate()
+
+
 def get_variant_from_plate_list(
     plate_list: List, session: sqlalchemy.orm.Session, titration: bool = False
 ) -> str:
@@ -257,12 +587,18 @@ def get_variant_from_plate_list(
     prefixes which are matched to a variant name in the NE_available_strains
     table in the LIMS database.
 
+    The NE_available_strains table is read once and cached in memory,
+    see `StrainIndex`.
+
     Parameters
     -----------
     plate_list : list
         list of 2 full-length paths to plate directories
     session : sqlalchemy.orm.session.Session
         sqlalchemy sesssion to the LIMS serology database
+    titration : bool
+        if `True` then the plates are titration plates, which start
+        with "T" rather than "S".
 
     Returns
     --------
@@ -285,37 +621,133 @@ def get_variant_from_plate_list(
         prefixes = [i.replace("T", "S") for i in prefixes]
     else:
         prefixes = ["S" + prefix[1:] for prefix in prefixes]
-    prefix_1, prefix_2 = sorted(prefixes)
-    # query table to return variant name (mutant_strain) for entry matching
-    # both the plate barcode prefixes
-    return_val = (
-        session.query(NE_available_strains.mutant_strain)
-        .filter(
-            NE_available_strains.plate_id_1 == prefix_1,
-            NE_available_strains.plate_id_2 == prefix_2,
-        )
-        .first()
-    )
-    if return_val is None or len(return_val) != 1:
-        # try without sample prefix if variant is found.
-        # this is because the NE_available_strains table has no guarantee
-        # that the prefixes will be registered wth an "S" prefix.
-        prefix_1 = prefix_1[1:]
-        prefix_2 = prefix_2[1:]
-        return_val = (
-            session.query(NE_available_strains.mutant_strain)
-            .filter(
-                NE_available_strains.plate_id_1 == prefix_1,
-                NE_available_strains.plate_id_2 == prefix_2,
+    return get_strain_index(session).lookup(prefixes, session)
+
+
+class RunContext(NamedTuple):
+    """LIMS state for analysing a plate pair, from `get_run_context()`
+
+    `expected_n_variants` is `None` if the workflow isn't in
+    NE_workflow_tracking.
+    """
+
+    workflow_id: int
+    variant: str
+    already_uploaded: bool
+    expected_n_variants: Optional[int]
+
+    def is_final_upload(self, n_other_variants: int) -> bool:
+        """Whether uploading this run completes the workflow's variants
+
+        Parameters
+        -----------
+        n_other_variants : int
+            number of other variants of the workflow with results, from
+            `count_other_variants()` in the upload's transaction, as runs
+            of other variants may have been uploaded since this context
+            was fetched.
+
+        Returns
+        --------
+        bool
+
+        Raises
+        ------
+        RuntimeError
+            if the workflow is not in NE_workflow_tracking, or if this
+            upload would exceed the expected number of variants.
+        """
+        if self.expected_n_variants is None:
+            raise RuntimeError(
+                f"workflow {self.workflow_id} not found in NE_workflow_tracking"
             )
-            .first()
-        )
-        if return_val is None or len(return_val) != 1:
-            raise VariantLookupError(
-                "plate barcode prefixes do not match any known variants in the ",
-                f"LIMS database: {prefixes}",
+        n_variants = n_other_variants + 1
+        if n_variants > self.expected_n_variants:
+            raise RuntimeError(
+                f"unexpected no. of variants {n_variants}, expecting max of {self.expected_n_variants}"
             )
-    return return_val.mutant_strain
+        return n_variants == self.expected_n_variants
+
+
+def count_other_variants(
+    workflow_id: int, variant: str, session: sqlalchemy.orm.Session
+) -> int:
+    """
+    Number of variants other than `variant` with final results for a
+    workflow in the LIMS database.
+
+    This includes results uploaded but not yet committed in `session`.
+
+    Parameters
+    -----------
+    workflow_id : int
+    variant : str
+    session : sqlalchemy.orm.session.Session
+        sqlalchemy sesssion to the LIMS serology database
+
+    Returns
+    --------
+    int
+    """
+    query = sqlalchemy.select(
+        sqlalchemy.func.count(sqlalchemy.distinct(NE_final_results.variant))
+    ).where(
+        NE_final_results.workflow_id == workflow_id,
+        NE_final_results.variant != variant,
+    )
+    return int(session.execute(query).scalar())
+
+
+def get_run_context(
+    plate_list: List[str], session: sqlalchemy.orm.Session
+) -> RunContext:
+    """
+    Fetch everything needed from the LIMS database before an analysis
+    in a single query.
+
+    The variant is resolved with `get_variant_from_plate_list()` from
+    the cached strain index, then `AnalysisDatabaseUploader.already_uploaded()`
+    and the expected number of variants of the workflow are fetched as
+    scalar subqueries of one SELECT, so costs one round trip to the
+    database.
+
+    Parameters
+    -----------
+    plate_list : list
+        list of 2 full-length paths to plate directories
+    session : sqlalchemy.orm.session.Session
+        sqlalchemy sesssion to the LIMS serology database
+
+    Returns
+    --------
+    RunContext
+
+    Raises
+    -------
+    plaque_assay.errors.VariantError
+        if plate barcode prefixes to not mach any known variant
+        in the LIMS serology database
+    """
+    assert len(plate_list) == 2, "expected plate_list to have 2 paths"
+    workflow_id = get_workflow_id_from_plate_list(plate_list)
+    variant = get_variant_from_plate_list(plate_list, session)
+    uploaded = sqlalchemy.exists().where(
+        NE_final_results.workflow_id == workflow_id,
+        NE_final_results.variant == variant,
+    )
+    expected = (
+        sqlalchemy.select(NE_workflow_tracking.no_of_variants)
+        .where(NE_workflow_tracking.workflow_id == workflow_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    uploaded, expected = session.execute(sqlalchemy.select(uploaded, expected)).one()
+    return RunContext(
+        workflow_id=workflow_id,
+        variant=variant,
+        already_uploaded=bool(uploaded),
+        expected_n_variants=None if expected is None else int(expected),
+    )
 
 
 def get_workflow_id_from_full_path(full_path: str) -> int:
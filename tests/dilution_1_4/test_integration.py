@@ -72,7 +72,8 @@ def run_experiment(plate_list):
     dataset = ingest.read_data_from_list(plate_list)
     indexfiles = ingest.read_indexfiles_from_list(plate_list)
     # add variant information to dataset and indexfiles dataframes
-    variant = utils.get_variant_from_plate_list(plate_list, session)
+    context = utils.get_run_context(plate_list, session)
+    variant = context.variant
     dataset["variant"] = variant
     indexfiles["variant"] = variant
     experiment = Experiment(dataset)
@@ -89,7 +90,8 @@ def run_experiment(plate_list):
     lims_db.upload_failures(failures)
     lims_db.upload_model_parameters(model_parameters)
     lims_db.upload_reporter_plate_status(workflow_id, variant)
-    if lims_db.is_final_upload(workflow_id):
+    n_other_variants = utils.count_other_variants(workflow_id, variant, session)
+    if context.is_final_upload(n_other_variants):
         lims_db.update_workflow_tracking(workflow_id)
     lims_db.commit()
 
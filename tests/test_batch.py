@@ -0,0 +1,178 @@
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+import sqlalchemy
+
+from plaque_assay import db_models, db_uploader, ingest, main, priors, utils
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.abspath(os.path.join(CURRENT_DIR, "test_data", "dilution_1_10"))
+
+
+def setup_module():
+    """create in-memory sqlite Serology database for testing"""
+    global engine
+    global session
+    engine = sqlalchemy.create_engine("sqlite://")
+    Session = sqlalchemy.orm.sessionmaker(bind=engine)
+    session = Session()
+    db_models.Base.metadata.create_all(engine)
+    session.add(
+        db_models.NE_available_strains(
+            mutant_strain="England2", plate_id_1="S01", plate_id_2="S02"
+        )
+    )
+    session.add(
+        db_models.NE_available_strains(
+            mutant_strain="XBB.1.16", plate_id_1="S37", plate_id_2="S38"
+        )
+    )
+    for workflow_id in (1283, 1273):
+        session.add(
+            db_models.NE_workflow_tracking(
+                master_plate=f"master_plate_{workflow_id}",
+                start_date=datetime.now() - timedelta(days=1),
+                no_of_variants=1,
+                workflow_id=workflow_id,
+            )
+        )
+    session.commit()
+
+
+def test_find_plate_dirs():
+    plate_dirs = ingest.find_plate_dirs(TEST_DATA_DIR)
+    assert sorted(plate_dirs) == [1273, 1283]
+    assert all(len(plates) == 2 for plates in plate_dirs.values())
+
+
+def test_run_batch():
+    summary = main.run_batch(TEST_DATA_DIR, n_workers=2, engine=engine)
+    assert [(i.workflow_id, i.variant, i.status) for i in summary] == [
+        (1273, "XBB.1.16", main.UPLOADED),
+        (1283, "England2", main.UPLOADED),
+    ]
+    query = session.query(db_models.NE_final_results)
+    df = pd.read_sql(query.statement, con=engine)
+    assert df.groupby("workflow_id").size().to_dict() == {1273: 96, 1283: 96}
+    # running again should skip the uploaded pairs
+    summary = main.run_batch(TEST_DATA_DIR, n_workers=2, engine=engine)
+    assert all(i.status == main.ALREADY_UPLOADED for i in summary)
+
+
+def make_database(workflow_id, no_of_variants=1):
+    # share the in-memory database with the upload thread
+    new_engine = sqlalchemy.create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=sqlalchemy.pool.StaticPool,
+    )
+    db_models.Base.metadata.create_all(new_engine)
+    with sqlalchemy.orm.Session(new_engine) as new_session:
+        new_session.add(
+            db_models.NE_available_strains(
+                mutant_strain="England2", plate_id_1="S01", plate_id_2="S02"
+            )
+        )
+        new_session.add(
+            db_models.NE_workflow_tracking(
+                master_plate=f"master_plate_{workflow_id}",
+                start_date=datetime.now() - timedelta(days=1),
+                no_of_variants=no_of_variants,
+                workflow_id=workflow_id,
+            )
+        )
+        new_session.commit()
+    return new_engine
+
+
+def test_run():
+    new_engine = make_database(1283)
+    plate_list = ingest.find_plate_dirs(TEST_DATA_DIR)[1283]
+    main.run(plate_list, engine=new_engine)
+    counts = {
+        model.__tablename__: pd.read_sql(
+            sqlalchemy.select(sqlalchemy.func.count()).select_from(model),
+            con=new_engine,
+        ).iloc[0, 0]
+        for model in (
+            db_models.NE_raw_results,
+            db_models.NE_raw_index,
+            db_models.NE_final_results,
+            db_models.NE_reporter_plate_status,
+        )
+    }
+    assert counts == {
+        "NE_raw_results": 768,
+        "NE_raw_index": 1536,
+        "NE_final_results": 96,
+        "NE_reporter_plate_status": 1,
+    }
+    status = pd.read_sql(
+        sqlalchemy.select(db_models.NE_workflow_tracking.status), con=new_engine
+    )
+    assert status["status"].tolist() == ["complete"]
+
+
+def test_upload_queue_rollback():
+    new_engine = make_database(1283)
+    plate_list = ingest.find_plate_dirs(TEST_DATA_DIR)[1283]
+    dataset = main.read_plates(plate_list, "England2")
+
+    def fail():
+        raise RuntimeError("failed upload")
+
+    with sqlalchemy.orm.Session(new_engine) as new_session:
+        lims_db = db_uploader.AnalysisDatabaseUploader(new_session)
+        with pytest.raises(RuntimeError, match="failed upload"):
+            with db_uploader.UploadQueue(lims_db) as uploads:
+                uploads.submit(
+                    main.upload_raw_data, lims_db, dataset, plate_list, "England2"
+                )
+                uploads.submit(fail)
+                skipped = uploads.submit(lims_db.commit)
+        assert skipped.result() is None
+    # the raw data uploaded before the failure was rolled back
+    raw_results = pd.read_sql(
+        sqlalchemy.select(db_models.NE_raw_results.id), con=new_engine
+    )
+    assert len(raw_results) == 0
+
+
+def test_upload_stale_context():
+    """another variant of the workflow uploaded while this one was analysed"""
+    new_engine = make_database(1283, no_of_variants=2)
+    plate_list = ingest.find_plate_dirs(TEST_DATA_DIR)[1283]
+    context = utils.RunContext(1283, "England2", False, 2)
+    results = main.analyse(plate_list, "England2")
+    with sqlalchemy.orm.Session(new_engine) as new_session:
+        new_session.add(
+            db_models.NE_final_results(workflow_id=1283, variant="XBB.1.16", well="A1")
+        )
+        new_session.commit()
+    with sqlalchemy.orm.Session(new_engine) as new_session:
+        main.upload(db_uploader.AnalysisDatabaseUploader(new_session), results, context)
+    status = pd.read_sql(
+        sqlalchemy.select(db_models.NE_workflow_tracking.status), con=new_engine
+    )
+    assert status["status"].tolist() == ["complete"]
+
+
+def test_run_failed_upload_priors(tmp_path, monkeypatch):
+    """priors are only saved from results which were uploaded"""
+    priors_path = tmp_path / "priors.json"
+    monkeypatch.setenv(priors.PRIORS_ENV, str(priors_path))
+    plate_list = ingest.find_plate_dirs(TEST_DATA_DIR)[1283]
+
+    def fail(*args):
+        raise RuntimeError("failed upload")
+
+    monkeypatch.setattr(main, "upload_analysis_results", fail)
+    with pytest.raises(RuntimeError, match="failed upload"):
+        main.run(plate_list, engine=make_database(1283))
+    assert not priors_path.exists()
+    monkeypatch.undo()
+    monkeypatch.setenv(priors.PRIORS_ENV, str(priors_path))
+    main.run(plate_list, engine=make_database(1283))
+    assert priors_path.exists()
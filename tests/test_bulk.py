@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from plaque_assay import bulk, db_models
+
+
+def make_indexfiles(n_rows):
+    return pd.DataFrame(
+        {
+            "row": np.arange(n_rows) % 16 + 1,
+            "column": np.arange(n_rows) % 24 + 1,
+            "field": 1,
+            "channel_id": 1,
+            "channel_name": "DAPI",
+            "channel_type": "Fluorescence",
+            "url": [
+                f"http://host/images/r{i:02d}c01f01p01-ch1sk1fk1fl1.tiff"
+                for i in range(n_rows)
+            ],
+            "image_resolutionx": "1.1E-06",
+            "image_resolutiony": "1.1E-06",
+            "image_sizex": 1080,
+            "image_sizey": 1080,
+            "positionx": np.where(np.arange(n_rows) % 3 == 0, np.nan, 0.001),
+            "positiony": np.inf,
+            "time_stamp": "2023-08-16T17:29:53",
+            "plate_barcode": "S01001283",
+            "workflow_id": 1283,
+            "variant": "England2",
+            "not_a_column": 1,
+        }
+    )
+
+
+def test_dataframe_rows():
+    df = pd.DataFrame({"a": [1.0, np.nan, -np.inf], "b": ["x", None, "z"]})
+    rows = bulk.dataframe_rows(df, ["a", "b"])
+    assert rows == [(1.0, "x"), (None, None), (None, "z")]
+    # python floats rather than numpy scalars
+    assert type(rows[0][0]) is float
+
+
+def test_adaptive_chunk_size():
+    narrow = pd.DataFrame({"a": np.zeros(10)})
+    wide = make_indexfiles(10)
+    assert bulk.adaptive_chunk_size(narrow) == bulk.MAX_CHUNK_SIZE
+    assert bulk.adaptive_chunk_size(wide) < bulk.adaptive_chunk_size(narrow)
+    assert bulk.adaptive_chunk_size(wide, target_bytes=1) == bulk.MIN_CHUNK_SIZE
+
+
+def test_insert_dataframe():
+    engine = sqlalchemy.create_engine("sqlite://")
+    db_models.Base.metadata.create_all(engine)
+    df = make_indexfiles(1500)
+    table = db_models.NE_raw_index.__table__
+    with engine.begin() as connection:
+        # load_data falls back to executemany on sqlite
+        n_rows = bulk.insert_dataframe(
+            connection, table, df, chunk_size=400, load_data=True
+        )
+    assert n_rows == 1500
+    uploaded = pd.read_sql_table("NE_raw_index", engine)
+    assert uploaded.shape[0] == 1500
+    assert uploaded["url"].tolist() == df["url"].tolist()
+    assert uploaded["positionx"].isna().sum() == 500
+    assert uploaded["positiony"].isna().all()
+
+
+def test_load_data_escape():
+    assert bulk._escape(None) == "\\N"
+    assert bulk._escape("a\tb\\c\n") == "a\\tb\\\\c\\n"
+    assert bulk._escape(1.5) == "1.5"
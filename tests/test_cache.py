@@ -0,0 +1,106 @@
+import os
+from glob import glob
+
+import numpy as np
+
+from plaque_assay import cache, consts, executor, ingest, qc_criteria, stats
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(
+    CURRENT_DIR, "test_data", "dilution_1_10", "NA_raw_data_1283_Eng2"
+)
+PLATE_LIST = sorted(glob(os.path.join(TEST_DATA_DIR, "S*")))
+
+
+def test_result_cache_eviction(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path), max_bytes=13_000)
+    value = np.zeros(500)  # ~4kB pickled
+    for i in range(3):
+        result_cache.put(f"key{i}", value)
+        # make sure modification times are distinct
+        os.utime(tmp_path / f"key{i}.pkl", (i, i))
+    # key0 is the oldest, but using it makes key1 the least recently used
+    assert result_cache.get("key0") is not None
+    result_cache.put("key3", value)
+    assert result_cache.get("key1") is None
+    assert result_cache.get("key0") is not None
+    assert len(result_cache) == 3
+    assert result_cache.hits == 2 and result_cache.misses == 1
+
+
+def test_result_cache_size_tracked(tmp_path, monkeypatch):
+    result_cache = cache.ResultCache(str(tmp_path), max_bytes=13_000)
+    scans = []
+    entries = result_cache._entries
+    monkeypatch.setattr(result_cache, "_entries", lambda: scans.append(1) or entries())
+    value = np.zeros(500)
+    for i in range(3):
+        result_cache.put(f"key{i}", value)
+    # measured once, then only scanned again when over the limit
+    assert len(scans) == 1
+    result_cache.put("key3", value)
+    assert len(scans) == 2
+    assert len(entries()) == 3
+
+
+def test_get_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv(cache.CACHE_DIR_ENV, raising=False)
+    assert cache.get_cache() is None
+    monkeypatch.setenv(cache.CACHE_DIR_ENV, str(tmp_path))
+    result_cache = cache.get_cache()
+    assert cache.get_cache() is result_cache
+    monkeypatch.setenv(cache.CACHE_MAX_BYTES_ENV, "1000")
+    assert cache.get_cache() is not result_cache
+
+
+def test_make_key():
+    key = cache.make_key("a", [np.arange(3)], b"bytes")
+    assert key == cache.make_key("a", [np.arange(3)], b"bytes")
+    assert key != cache.make_key("a", [np.arange(3.0)], b"bytes")
+    assert key != cache.make_key("a", [np.arange(3)], b"bytez")
+
+
+def test_config_fingerprint(monkeypatch):
+    fingerprint = cache.config_fingerprint()
+    monkeypatch.setattr(qc_criteria, "low_cells_image_region_area_low", 0.7)
+    assert cache.config_fingerprint() != fingerprint
+
+
+def test_fit_version(tmp_path, monkeypatch):
+    """changes to the fitting code don't use fits cached before them"""
+    monkeypatch.setenv(cache.CACHE_DIR_ENV, str(tmp_path))
+    names = ["A01"]
+    dilutions = [np.array([1, 2, 3, 4.0])]
+    values = [np.array([100, 80, 40, 5.0])]
+    executor.fit_samples(names, dilutions, values)
+    result_cache = cache.get_cache()
+    misses = result_cache.misses
+    executor.fit_samples(names, dilutions, values)
+    assert result_cache.misses == misses
+    monkeypatch.setattr(stats, "FIT_VERSION", stats.FIT_VERSION + 1)
+    executor.fit_samples(names, dilutions, values)
+    assert result_cache.misses == misses + 1
+
+
+def test_cached_dataset_and_fits(tmp_path, monkeypatch):
+    monkeypatch.setenv(cache.CACHE_DIR_ENV, str(tmp_path))
+    df = ingest.read_data_from_list(PLATE_LIST)
+    df_cached = ingest.read_data_from_list(PLATE_LIST)
+    assert df_cached.equals(df)
+    names = ["A01", "A02"]
+    dilutions = [np.array([1, 2, 3, 4.0])] * 2
+    values = [np.array([100, 80, 40, 5.0]), np.array([100, 100, 100, 100.0])]
+    results = executor.fit_samples(names, dilutions, values)
+    assert executor.fit_samples(names, dilutions, values) == results
+    assert len(cache.get_cache()) == 2
+
+
+def test_cached_dataset_schema(tmp_path, monkeypatch):
+    monkeypatch.setenv(cache.CACHE_DIR_ENV, str(tmp_path))
+    ingest.read_data_from_list(PLATE_LIST)
+    dtypes = dict(consts.PLATE_RESULTS_DTYPES)
+    del dtypes["Number of Analyzed Fields"]
+    monkeypatch.setattr(consts, "PLATE_RESULTS_DTYPES", dtypes)
+    # a change to the columns read isn't served from the cache
+    df = ingest.read_data_from_list(PLATE_LIST)
+    assert "Number of Analyzed Fields" not in df.columns
@@ -69,3 +69,12 @@ def test_experiment_get_percentage_infected_dataframe():
         perc_infected_df = experiment.get_percentage_infected_dataframe()
         assert isinstance(perc_infected_df, pd.DataFrame)
         assert perc_infected_df.shape[0] > 0
+
+
+def test_experiment_parallel_samples():
+    serial = EXPERIMENT_LIST[0]
+    parallel = Experiment(EXPERIMENT_DF.copy(), n_workers=2)
+    assert list(parallel.sample_store) == list(serial.sample_store)
+    pd.testing.assert_frame_equal(
+        parallel.get_results_as_dataframe(), serial.get_results_as_dataframe()
+    )
@@ -0,0 +1,76 @@
+import os
+from glob import glob
+
+import pandas as pd
+
+from plaque_assay import consts, ingest
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(CURRENT_DIR, "test_data")
+PLATE_RESULTS_PATHS = sorted(
+    glob(os.path.join(TEST_DATA_DIR, "**", "PlateResults.txt"), recursive=True)
+)
+
+
+def test_read_plate_results():
+    for path in PLATE_RESULTS_PATHS:
+        df = ingest.read_plate_results(path)
+        assert df.shape == (384, len(consts.PLATE_RESULTS_DTYPES))
+        assert df.dtypes.astype(str).to_dict() == consts.PLATE_RESULTS_DTYPES
+        # same values as reading the whole file
+        df_all = pd.read_csv(path, skiprows=8, sep="\t")
+        for col in df.columns:
+            assert (df[col] == df_all[col]).all()
+
+
+def test_read_plate_results_blank_fields(tmp_path):
+    """partially imaged wells can have a blank number of analyzed fields"""
+    with open(PLATE_RESULTS_PATHS[0], encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    header = lines.index(ingest.DATA_MARKER) + 1
+    col = lines[header].split("\t").index("Number of Analyzed Fields")
+    row = lines[header + 1].split("\t")
+    row[col] = ""
+    lines[header + 1] = "\t".join(row)
+    path = tmp_path / "PlateResults.txt"
+    path.write_text("\n".join(lines), encoding="utf-8")
+    for use_pyarrow in (False, True):
+        df = ingest.read_plate_results(str(path), use_pyarrow=use_pyarrow)
+        fields = df["Number of Analyzed Fields"]
+        assert fields.isna().tolist() == [True] + [False] * (len(df) - 1)
+
+
+def test_iter_indexfiles():
+    plate_list = sorted(
+        glob(
+            os.path.join(TEST_DATA_DIR, "dilution_1_10", "NA_raw_data_1283_Eng2", "S*")
+        )
+    )
+    batches = list(ingest.iter_indexfiles(plate_list, batch_size=500))
+    assert [len(df) for df in batches] == [500, 268, 500, 268]
+    streamed = pd.concat(batches, ignore_index=True)
+    expected = ingest.read_indexfiles_from_list(plate_list).reset_index(drop=True)
+    assert (streamed["plate_barcode"] == expected["Plate_barcode"]).all()
+    for col, (name, _) in consts.INDEXFILE_COLUMNS.items():
+        assert (streamed[name] == expected[col]).all()
+
+
+def test_map_threads():
+    items = list(range(50))
+    assert ingest.map_threads(lambda x: x ** 2, items, n_threads=8) == [
+        x ** 2 for x in items
+    ]
+    assert ingest.map_threads(lambda x: x, [], n_threads=8) == []
+
+
+def test_read_data_from_list_threads():
+    plate_list = sorted(
+        glob(os.path.join(TEST_DATA_DIR, "dilution_1_10", "NA_raw_data_*", "S*"))
+    )
+    assert len(plate_list) == 4
+    serial = ingest.read_data_from_list(plate_list, n_threads=1)
+    threaded = ingest.read_data_from_list(plate_list, n_threads=4)
+    pd.testing.assert_frame_equal(serial, threaded)
+    serial = ingest.read_indexfiles_from_list(plate_list, n_threads=1)
+    threaded = ingest.read_indexfiles_from_list(plate_list, n_threads=4)
+    pd.testing.assert_frame_equal(serial, threaded)
@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+
+from plaque_assay import executor, instrument
+
+
+def test_timer_and_counters():
+    recorder = instrument.reset()
+
+    @instrument.timed("decorated")
+    def func():
+        return 1
+
+    with instrument.timer("stage"):
+        assert func() == 1
+    func()
+    instrument.count("things", 3)
+    report = recorder.report()
+    assert report["stages"]["stage"]["calls"] == 1
+    assert report["stages"]["decorated"]["calls"] == 2
+    assert report["counters"] == {"things": 3}
+
+
+def test_fit_records(tmp_path, monkeypatch):
+    instrument.reset()
+    names = ["A01", "A02", "A03"]
+    dilutions = [np.array([2.5e-5, 2.5e-4, 2.5e-3, 2.5e-2])] * 3
+    # A03 is a heuristic result so is not fitted
+    values = [
+        np.array([100, 80, 40, 5.0]),
+        np.array([100, 90, 60, 20.0]),
+        np.array([100, 100, 100, 100.0]),
+    ]
+    for batch_fit in (True, False):
+        executor.fit_samples(names, dilutions, values, batch_fit=batch_fit)
+    fits = instrument.RECORDER.fits
+    assert [(fit.well, fit.batched) for fit in fits] == [
+        ("A01", True),
+        ("A02", True),
+        ("A01", False),
+        ("A02", False),
+    ]
+    assert all(fit.nfev > 0 and fit.converged for fit in fits)
+    path = tmp_path / "profile.json"
+    monkeypatch.setenv(instrument.PROFILE_JSON_ENV, str(path))
+    instrument.export("test")
+    with open(path) as f:
+        report = json.load(f)
+    assert report["fits"]["n_fits"] == 4
+    assert report["stages"]["fit_samples"]["calls"] == 2
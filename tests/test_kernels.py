@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from plaque_assay import kernels, stats
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def reference_hampel(x, k, t0=3):
+    """pracma's hampel test, recalculating every window"""
+    indices = []
+    for i in range(k + 1, len(x) - k):
+        window = x[i - k : i + k + 1]
+        if np.isnan(window).all():
+            continue
+        x0 = np.nanmedian(window)
+        s0 = kernels.MAD_SCALE * np.nanmedian(np.abs(window - x0))
+        if np.abs(x[i] - x0) > t0 * s0:
+            indices.append(i)
+    return indices
+
+
+def test_hampel_batch():
+    rng = np.random.default_rng(42)
+    x_interpolated = np.logspace(-5, 0, 500)
+    curve = stats.dr_4(x_interpolated, 5, 100, 0.003, 1.7)
+    step = curve.copy()
+    step[250:] += 20
+    ties = rng.integers(0, 4, 500).astype(float)
+    with_nans = rng.normal(size=500)
+    with_nans[rng.random(500) < 0.3] = np.nan
+    with_nans[100:120] = np.nan
+    series = np.stack([rng.normal(size=500), curve, step, ties, with_nans])
+    for k in (1, 2, 5):
+        outliers = kernels.hampel_batch(series, k, 3)
+        assert outliers.shape == series.shape
+        for row, x in zip(outliers, series):
+            expected = reference_hampel(x, k)
+            assert np.flatnonzero(row).tolist() == expected
+            assert stats.hampel(x, k) == expected
+    # too short to test any points
+    assert stats.hampel(np.arange(5.0), 5) == []
+
+
+def test_mse_batch():
+    rng = np.random.default_rng(0)
+    lengths = np.array([8, 6, 1, 200, 0])
+    y_observed = np.full((len(lengths), lengths.max()), np.nan)
+    y_fitted = np.full_like(y_observed, np.nan)
+    for row, length in enumerate(lengths):
+        y_observed[row, :length] = rng.uniform(0, 100, length)
+        y_fitted[row, :length] = rng.uniform(0, 100, length)
+    y_observed[1, 2] = np.nan
+    mse = kernels.mse_batch(y_observed, y_fitted, lengths)
+    for row, length in enumerate(lengths[:-1]):
+        expected = stats.model_mse(y_observed[row, :length], y_fitted[row, :length])
+        assert np.isclose(mse[row], expected, rtol=1e-12)
+    assert np.isnan(mse[-1])
+
+
+def test_lazy_imports():
+    """numba and matplotlib are slow to import, and only imported when needed"""
+    code = "import sys, plaque_assay; print('numba' in sys.modules, 'matplotlib' in sys.modules)"
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT_DIR,
+    ).stdout
+    assert output.split() == ["False", "False"]
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from plaque_assay.plate import (
+    Plate,
+    plate_qc,
+    CELL_IMAGE_AREA_FAILURE,
+    DAPI_PLATE_FAILURE,
+    INFECTION_FAILURE,
+    PLATE_FAILURE_DTYPE,
+    VIRUS_ONLY_IDX,
+    WELL_FAILURE_DTYPE,
+)
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLE_EXPERIMENT_PATH = os.path.join(
+    CURRENT_DIR,
+    "test_data",
+    "dilution_1_10",
+    "experiment_df",
+    "experiment_df_example.csv",
+)
+EXPERIMENT_DF = pd.read_csv(EXAMPLE_EXPERIMENT_PATH)
+PLATE_DFS = [df for _, df in EXPERIMENT_DF.groupby("Plate_barcode")]
+
+
+def test_plate_arrays():
+    for df in PLATE_DFS:
+        plate = Plate(df.copy())
+        assert len(plate) == df.shape[0]
+        assert plate.percentage_infected.shape == (96,)
+        # virus only wells should be close to 100% infected
+        assert abs(np.nanmedian(plate.percentage_infected[VIRUS_ONLY_IDX]) - 100) < 1
+
+
+def test_plate_df():
+    df = PLATE_DFS[0]
+    plate = Plate(df.copy())
+    assert plate._df is None
+    plate_df = plate.df
+    assert list(plate_df["Well"]) == list(df["Well"])
+    assert np.allclose(
+        plate_df["Normalised Plaque area"], df["Normalised Plaque area"], equal_nan=True
+    )
+    assert "Percentage Infected" in plate_df.columns
+
+
+def test_plate_qc():
+    ratio = np.ones((3, 96))
+    # plate 0: a high and a low outlier, high one in control column 12
+    ratio[0, 11] = 2.0
+    ratio[0, 0] = 0.1
+    # plate 1: more than 8 outliers, plate 2: infection below limit
+    ratio[1, :10] = 0.1
+    infection = np.array([1.0, 1.0, 0.0])
+    input_order = np.tile(np.arange(96), (3, 1))
+    well_failures, plate_failures = plate_qc(ratio, infection, input_order, "England2")
+    assert well_failures.dtype == WELL_FAILURE_DTYPE
+    assert well_failures["plate"].tolist() == [0, 0] + [1] * 10
+    # low outliers before high outliers
+    assert well_failures["position"][:2].tolist() == [0, 11]
+    assert plate_failures.dtype == PLATE_FAILURE_DTYPE
+    assert sorted(plate_failures[["plate", "reason"]].tolist()) == [
+        (0, CELL_IMAGE_AREA_FAILURE),
+        (1, DAPI_PLATE_FAILURE),
+        (2, INFECTION_FAILURE),
+    ]
@@ -0,0 +1,125 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+import sqlalchemy.orm
+
+from plaque_assay import db_models, instrument, main, priors, stats
+from plaque_assay.experiment import Experiment
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PLATE_LIST = sorted(
+    glob(
+        os.path.join(
+            CURRENT_DIR, "test_data", "dilution_1_10", "NA_raw_data_1283_Eng2", "*"
+        )
+    )
+)
+VARIANT = "England2"
+DATASET = main.read_plates(PLATE_LIST, VARIANT)
+
+
+def test_prior_store(tmp_path):
+    model_parameters = Experiment(DATASET).get_model_parameters()
+    store = priors.PriorStore()
+    assert store.get(VARIANT, "A01") is None
+    store.update(VARIANT, model_parameters)
+    assert len(store) == 2
+    fitted = model_parameters.dropna(subset=priors.PARAM_COLUMNS)
+    is_control = fitted["well"].map(priors.well_type) == priors.POSITIVE_CONTROL
+    expected = fitted[~is_control][priors.PARAM_COLUMNS].median()
+    assert np.allclose(store.get(VARIANT, "A01"), expected)
+    assert store.get(VARIANT, "D12") != store.get(VARIANT, "A01")
+    # well labels are unpadded in the database
+    assert store.get(VARIANT, "A6") == store.get(VARIANT, "A06")
+    assert store.get("other variant", "A01") is None
+    path = str(tmp_path / "priors.json")
+    store.save(path)
+    assert priors.PriorStore.load(path).priors == store.priors
+    assert len(priors.PriorStore.load(str(tmp_path / "missing.json"))) == 0
+
+
+def save_priors(path, variant, model_parameters):
+    os.environ[priors.PRIORS_ENV] = path
+    priors.save_priors(variant, model_parameters)
+
+
+def test_save_priors_concurrently(tmp_path):
+    """concurrent runs sharing a priors file keep each other's updates"""
+    path = str(tmp_path / "priors.json")
+    model_parameters = Experiment(DATASET).get_model_parameters()
+    variants = [f"variant {i}" for i in range(16)]
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        for future in [
+            pool.submit(save_priors, path, variant, model_parameters)
+            for variant in variants
+        ]:
+            future.result()
+    store = priors.PriorStore.load(path)
+    assert all(store.get(variant, "A01") is not None for variant in variants)
+
+
+def test_warm_start():
+    instrument.reset()
+    cold = Experiment(DATASET)
+    store = priors.PriorStore()
+    store.update(VARIANT, cold.get_model_parameters())
+    warm = Experiment(DATASET, priors=store)
+    report = instrument.RECORDER.report()["fits"]
+    assert report["n_warm_start"] > 0
+    assert report["mean_nfev_warm_start"] < report["mean_nfev_cold_start"]
+    cold_results = cold.get_results_as_dataframe()
+    warm_results = warm.get_results_as_dataframe()
+    pd.testing.assert_frame_equal(cold_results, warm_results, rtol=1e-3)
+
+
+def test_warm_start_fallback(monkeypatch):
+    non_linear_model = stats._non_linear_model
+
+    def fail_from_prior(x, y, func=stats.dr_4, p0=stats.P0):
+        if p0 is not stats.P0:
+            raise RuntimeError("Optimal parameters not found")
+        return non_linear_model(x, y, func, p0)
+
+    monkeypatch.setattr(stats, "_non_linear_model", fail_from_prior)
+    instrument.reset()
+    df = pd.DataFrame(
+        {
+            "Dilution": [0.000025, 0.00025, 0.0025, 0.025] * 2,
+            "Percentage Infected": [96.1, 85.7, 49.6, 3.2, 90.0, 80.1, 39.7, 6.5],
+        }
+    )
+    cold = stats.calc_model_results("A01", df)
+    warm = stats.calc_model_results("A01", df, p0=(10, 100, 0.01, 2))
+    assert warm == cold
+    fit = instrument.RECORDER.fits[-1]
+    assert fit.warm_start and fit.fallback
+    assert fit.nfev > stats.MAXFEV
+
+
+def test_priors_from_database():
+    engine = sqlalchemy.create_engine("sqlite://")
+    db_models.Base.metadata.create_all(engine)
+    with sqlalchemy.orm.Session(engine) as session:
+        for workflow_id in range(12):
+            for well in ["A1", "D12"]:
+                session.add(
+                    db_models.NE_model_parameters(
+                        well=well,
+                        param_top=workflow_id,
+                        param_bottom=100,
+                        param_ec50=0.01,
+                        param_hillslope=1,
+                        workflow_id=workflow_id,
+                        variant=VARIANT,
+                    )
+                )
+        session.commit()
+        store = priors.PriorStore.from_database(session, VARIANT, n_workflows=4)
+        # median of the last 4 workflows
+        assert store.get(VARIANT, "A01") == (9.5, 100, 0.01, 1)
+        assert store.get(VARIANT, "D12") == (9.5, 100, 0.01, 1)
+        assert len(priors.PriorStore.from_database(session, "other variant")) == 0
@@ -0,0 +1,65 @@
+import os
+import shutil
+from glob import glob
+
+import pandas as pd
+
+from plaque_assay import ingest, sidecar
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PLATE_RESULTS_PATH = sorted(
+    glob(
+        os.path.join(
+            CURRENT_DIR,
+            "test_data",
+            "dilution_1_10",
+            "NA_raw_data_1283_Eng2",
+            "*",
+            "Evaluation1",
+            "PlateResults.txt",
+        )
+    )
+)[0]
+
+
+def copy_plate_results(tmp_path):
+    evaluation_dir = tmp_path / "Evaluation1"
+    evaluation_dir.mkdir()
+    path = str(evaluation_dir / "PlateResults.txt")
+    shutil.copy(PLATE_RESULTS_PATH, path)
+    return path
+
+
+def test_sidecar(tmp_path):
+    path = copy_plate_results(tmp_path)
+    assert sidecar.read_sidecar(path) is None
+    parsed = ingest.read_plate_results(path, use_sidecar=True)
+    assert os.path.exists(sidecar.sidecar_path(path))
+    mapped = sidecar.read_sidecar(path)
+    pd.testing.assert_frame_equal(parsed, mapped)
+    # columns are views of the memory-mapped file
+    assert all(not mapped[col].to_numpy().flags.writeable for col in mapped.columns)
+    pd.testing.assert_frame_equal(
+        ingest.read_plate_results(path, use_sidecar=True), parsed
+    )
+
+
+def test_sidecar_out_of_date(tmp_path):
+    path = copy_plate_results(tmp_path)
+    ingest.read_plate_results(path, use_sidecar=True)
+    # source file changed since the sidecar was written
+    with open(path, "a") as f:
+        f.write("\n")
+    assert sidecar.read_sidecar(path) is None
+    ingest.read_plate_results(path, use_sidecar=True)
+    assert sidecar.read_sidecar(path) is not None
+
+
+def test_sidecar_disabled(tmp_path, monkeypatch):
+    monkeypatch.delenv(sidecar.SIDECAR_ENV, raising=False)
+    path = copy_plate_results(tmp_path)
+    ingest.read_plate_results(path)
+    assert not os.path.exists(sidecar.sidecar_path(path))
+    monkeypatch.setenv(sidecar.SIDECAR_ENV, "1")
+    ingest.read_plate_results(path)
+    assert os.path.exists(sidecar.sidecar_path(path))
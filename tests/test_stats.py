@@ -1,4 +1,9 @@
+import os
+from glob import glob
+
+import numpy as np
 import pandas as pd
+import scipy.optimize
 
 from plaque_assay import consts, stats, utils
 
@@ -10,6 +15,10 @@ EPSILON = 15
 # maximum mean_squared_error value expected for fitted model
 MSE_PASS = 100
 
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data")
+# plate pairs of every test dataset
+DATASET_DIRS = sorted(glob(os.path.join(TEST_DATA_DIR, "*", "NA_raw_data_*")))
+
 
 def perc_difference(x: float, y: float) -> float:
     """percentage difference between two numbers"""
@@ -106,6 +115,43 @@ def test_calc_heuristics_dilutions():
     assert good_inhib_out is None
 
 
+def test_classify_dilutions():
+    nan = np.nan
+    x = np.array(dilutions)
+    all_perc = [
+        perc_inf_weak,
+        perc_inf_no,
+        perc_good,
+        # most dilute missing, next 2 below threshold
+        [nan, nan, 10, 20, 30, 40, 90, 95],
+        # 2 least dilute missing
+        [10, 20, 30, 40, nan, nan, nan, nan],
+        # one replicate missing at each dilution
+        [nan, 95.0, 80.0, nan, nan, 30.0, 55.0, nan],
+    ]
+    arr = stats.dilution_array([x] * len(all_perc), all_perc)
+    assert arr.shape == (len(all_perc), 4, 2)
+    # least dilute first
+    assert np.allclose(arr[0, 0], perc_inf_weak[6:])
+    results = stats.classify_dilutions(arr, THRESHOLD, WEAK_THRESHOLD)
+    expected = [
+        "weak inhibition",
+        "no inhibition",
+        None,
+        "complete inhibition",
+        "failed to fit model",
+        "weak inhibition",
+    ]
+    for perc, result, expected_result in zip(all_perc, results, expected):
+        if expected_result is None:
+            assert result == stats.NO_HEURISTIC
+        else:
+            assert utils.INT_TO_RESULT[result] == expected_result
+        df = pd.DataFrame({"Dilution": x, "Percentage Infected": perc}).dropna()
+        single = stats.calc_heuristics_dilutions(df, THRESHOLD, WEAK_THRESHOLD)
+        assert single == (None if expected_result is None else result)
+
+
 def good_ic50_fit(perc_infected, expected_ic50) -> bool:
     df = pd.DataFrame({"Dilution": dilutions, "Percentage Infected": perc_infected})
     fit_method, result, model_params, mean_squared_error = stats.calc_model_results(
@@ -228,3 +274,205 @@ def test_should_be_complete_or_fail():
     # high MSE, should be flagged
     assert mean_squared_error is not None
     assert mean_squared_error > MSE_PASS
+
+
+def test_calc_model_results_batch():
+    """batched fitting should give the same results as fitting individually"""
+    all_perc = [
+        perc_good,
+        perc_inf_weak,
+        perc_inf_no,
+        perc_should_be_complete_or_fail,
+        [107.4, 102.9, 102.0, 108.7, 88.7, 88.3, 38.1, 40.1],
+        [96.1, 85.7, 49.6, 39.7, 3.2, 6.5, 0.1, 0.0],
+        [118.4, 88.6, 103.9, 97.6, 48.8, 49.4, -0.06, -0.01],
+    ]
+    names = [str(i) for i in range(len(all_perc))]
+    batch_results = stats.calc_model_results_batch(
+        names, [dilutions] * len(all_perc), all_perc, THRESHOLD, WEAK_THRESHOLD
+    )
+    assert len(batch_results) == len(all_perc)
+    for name, perc, batch_result in zip(names, all_perc, batch_results):
+        df = pd.DataFrame({"Dilution": dilutions, "Percentage Infected": perc})
+        single_result = stats.calc_model_results(name, df, THRESHOLD, WEAK_THRESHOLD)
+        assert batch_result.fit_method == single_result.fit_method
+        if single_result.result < 0:
+            assert batch_result.result == single_result.result
+        else:
+            assert perc_difference(batch_result.result, single_result.result) < 1
+
+
+def test_non_linear_model_batch():
+    x = np.array(dilutions)
+    y = np.array(perc_good)
+    batch = stats.non_linear_model_batch([x, x[2:], x], [y, y[2:], y])
+    assert batch == [
+        stats.non_linear_model(x, y),
+        stats.non_linear_model(x[2:], y[2:]),
+        stats.non_linear_model(x, y),
+    ]
+
+
+def test_non_linear_model_batch_not_finite():
+    """samples which can't be fitted don't fail the rest of the batch"""
+    x = np.array(dilutions)
+    y = np.array(perc_good)
+    not_finite = y.copy()
+    not_finite[0] = np.inf
+    batch = stats.non_linear_model_batch([x, x, x], [y, not_finite, y])
+    assert batch[0] is not None
+    assert batch[0] == batch[2]
+    assert batch[1] is None
+
+
+def final_statuses(plate_dir, **experiment_kwargs):
+    """`{well: status}` of a test dataset, empty for wells with an IC50"""
+    from plaque_assay import main
+    from plaque_assay.experiment import Experiment
+
+    plate_list = sorted(glob(os.path.join(plate_dir, "*")))
+    experiment = Experiment(
+        main.read_plates(plate_list, "England2"), **experiment_kwargs
+    )
+    results = experiment.get_results_as_dataframe()
+    return dict(zip(results["well"], results["status"].fillna("")))
+
+
+def test_batch_fit_parameters():
+    """batched fits give the same parameters as fitting each sample, for
+    every well in the test data"""
+    from plaque_assay import main
+    from plaque_assay.experiment import Experiment
+
+    for plate_dir in DATASET_DIRS:
+        dataset = main.read_plates(
+            sorted(glob(os.path.join(plate_dir, "*"))), "England2"
+        )
+        batch, single = (
+            Experiment(dataset.copy(), batch_fit=batch_fit).get_model_parameters()
+            for batch_fit in (True, False)
+        )
+        assert len(batch) > 0
+        pd.testing.assert_frame_equal(batch, single, check_exact=True)
+
+
+def test_statuses_match_curve_fit(monkeypatch):
+    """batched fits, and fits with the analytic jacobians, give the same
+    results as `curve_fit()` with finite differences on every test dataset"""
+    fits = [
+        (
+            final_statuses(plate_dir, batch_fit=True),
+            final_statuses(plate_dir, batch_fit=False),
+        )
+        for plate_dir in DATASET_DIRS
+    ]
+    # curve_fit's default finite-difference jacobian for every model
+    monkeypatch.setattr(stats, "_FIT_FUNCTIONS", {})
+    for plate_dir, (batch, analytic) in zip(DATASET_DIRS, fits):
+        reference = final_statuses(plate_dir, batch_fit=False)
+        assert batch == reference, plate_dir
+        assert analytic == reference, plate_dir
+
+
+def test_jacobians():
+    x = np.array(dilutions + [0.0])
+    for params in [(5, 100, 0.003, 1.7), (0, 95, 1e-4, 4.9), (10, 110, 0.02, 0.3)]:
+        for func, jacobian, n_params in [
+            (stats.dr_4, stats.dr_4_jacobian, 4),
+            (stats.dr_3, stats.dr_3_jacobian, 3),
+        ]:
+            p = np.array(params[:n_params], dtype=float)
+            J = jacobian(x, *p)
+            assert J.shape == (len(x), n_params)
+            # central differences
+            for i in range(n_params):
+                h = np.zeros(n_params)
+                h[i] = 1e-6 * (abs(p[i]) or 1)
+                numerical = (func(x, *(p + h)) - func(x, *(p - h))) / (2 * h[i])
+                assert np.allclose(J[:, i], numerical, rtol=1e-5, atol=1e-6)
+
+
+def test_analytic_jacobian_fits():
+    """fits with the analytic jacobians match finite-difference fits"""
+    from plaque_assay import main
+    from plaque_assay.experiment import Experiment
+
+    plate_list = sorted(
+        glob(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "test_data",
+                "dilution_1_10",
+                "NA_raw_data_1283_Eng2",
+                "*",
+            )
+        )
+    )
+    experiment = Experiment(main.read_plates(plate_list, "England2"))
+    xs, ys = [], []
+    for sample in experiment.sample_store.values():
+        if sample.model_params is not None:
+            df = sample.data.dropna().sort_values("Dilution")
+            xs.append(df["Dilution"].values)
+            ys.append(df["Percentage Infected"].values)
+    assert len(xs) > 40
+    x_min = (1 / consts.DILUTION_4) / 10
+    x_max = (1 / consts.DILUTION_1) * 10
+    batch = stats.non_linear_model_batch(xs, ys)
+    for x, y, batch_params in zip(xs, ys, batch):
+        # previous finite-difference fit
+        reference, _ = scipy.optimize.curve_fit(
+            stats.dr_4,
+            x,
+            y,
+            p0=stats.P0,
+            method="trf",
+            bounds=stats.BOUNDS,
+            maxfev=stats.MAXFEV,
+        )
+        reference_mse = stats.model_mse(y, stats.dr_4(x, *reference))
+        reference_ic50 = stats.intersect_dr_4(x_min, x_max, reference)
+        for params in (stats.non_linear_model(x, y), batch_params):
+            # only the difference between top and bottom is identifiable
+            assert np.isclose(
+                params.bottom - params.top,
+                reference[1] - reference[0],
+                rtol=1e-2,
+            )
+            assert np.isclose(params.ec50, reference[2], rtol=1e-3)
+            assert stats.model_mse(y, stats.dr_4(x, *params)) <= reference_mse * (
+                1 + 1e-6
+            )
+            ic50 = stats.intersect_dr_4(x_min, x_max, params)
+            assert ic50.error == reference_ic50.error
+            if not ic50.error:
+                assert np.isclose(ic50.x, reference_ic50.x, rtol=1e-3)
+
+
+def test_intersect_dr_4():
+    x_min = (1 / consts.DILUTION_4) / 10
+    x_max = (1 / consts.DILUTION_1) * 10
+    x_grid = np.logspace(np.log10(x_min), np.log10(x_max), 10000)
+    model_params = stats.non_linear_model(np.array(dilutions), np.array(perc_good))
+    curve = stats.dr_4(x_grid, *model_params)
+    grid_intersect = stats.intersect_between_curves(x_min, x_max, curve)
+    exact = stats.intersect_dr_4(x_min, x_max, model_params)
+    assert not exact.error
+    assert np.isclose(stats.dr_4(exact.x, *model_params), 50)
+    # within a single grid step of the grid-based intersect
+    assert grid_intersect.x <= exact.x <= grid_intersect.x * (x_grid[1] / x_grid[0])
+    compatible = stats.intersect_dr_4(x_min, x_max, model_params, grid_compatible=True)
+    assert compatible == grid_intersect
+
+
+def test_intersect_dr_4_errors():
+    x_min = (1 / consts.DILUTION_4) / 10
+    x_max = (1 / consts.DILUTION_1) * 10
+    # curve never reaches 50
+    no_crossing = stats.intersect_dr_4(x_min, x_max, stats.ModelParams(0, 45, 0.01, 1))
+    assert no_crossing.error
+    assert no_crossing.reason == stats.NO_CROSSING
+    # negative ec50 gives an undefined curve
+    undefined = stats.intersect_dr_4(x_min, x_max, stats.ModelParams(0, 100, -1, 0.5))
+    assert undefined.error
+    assert undefined.reason == stats.MULTIPLE_CROSSINGS
@@ -1,7 +1,11 @@
+from datetime import datetime
+
+import pytest
 import sqlalchemy
 
 from plaque_assay import utils
 from plaque_assay import db_models
+from plaque_assay import errors
 
 
 THRESHOLD = 50
@@ -64,6 +68,26 @@ def test_mock_384_barcode():
     assert output == ["A41900001", "A22000001", "A42000001"]
 
 
+def test_384_well_arrays():
+    rows = [row for row in range(1, 17) for _ in range(1, 25)]
+    cols = [col for _ in range(1, 17) for col in range(1, 25)]
+    wells = [utils.row_col_to_well(row, col) for row, col in zip(rows, cols)]
+    assert list(utils.row_col_to_well_array(rows, cols)) == wells
+    assert list(utils.well_384_to_96_array(rows, cols)) == [
+        utils.well_384_to_96(i) for i in wells
+    ]
+    assert list(utils.dilution_from_384_array(rows, cols)) == [
+        utils.get_dilution_from_384_well_label(i) for i in wells
+    ]
+    barcodes = ["S01900001"] * 192 + ["S02000001"] * 192
+    output = utils.mock_384_barcode_array(barcodes, rows, cols)
+    assert list(output) == utils.mock_384_barcode(barcodes, wells)
+
+
+def test_unpad_well_col():
+    assert utils.unpad_well_col(["A01", "H12", "A01"]) == ["A1", "H12", "A1"]
+
+
 def test_get_prefix_from_full_path():
     path = "/path/to/plate/S01000001__2021_01_01T00_00_00-Measuremment 1"
     assert utils.get_prefix_from_full_path(path) == "S01"
@@ -107,6 +131,99 @@ def test_get_variant_from_plate_list():
     assert variant_titration_india == VARIANT_INDIA
 
 
+def test_get_run_context():
+    session.add(
+        db_models.NE_available_strains(
+            mutant_strain="XBB.1.16", plate_id_1="37", plate_id_2="38"
+        )
+    )
+    session.add(
+        db_models.NE_workflow_tracking(
+            master_plate="master_plate",
+            start_date=datetime(2021, 1, 1),
+            no_of_variants=3,
+            workflow_id=200,
+        )
+    )
+    session.add(
+        db_models.NE_final_results(well="A1", workflow_id=200, variant=VARIANT_ENGLAND)
+    )
+    session.commit()
+    plate_list_england2 = [
+        "/mnt/NA_raw_data/S01000200__2021_01_01T01_01_01-Measurement 1",
+        "/mnt/NA_raw_data/S02000200__2021_01_01T01_01_01-Measurement 1",
+    ]
+    # variant registered without the "S" prefix
+    plate_list_xbb = [
+        "/mnt/NA_raw_data/S38000200__2021_01_01T01_01_01-Measurement 1",
+        "/mnt/NA_raw_data/S37000200__2021_01_01T01_01_01-Measurement 1",
+    ]
+    statements = []
+
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    utils.invalidate_strain_index(session)
+    sqlalchemy.event.listen(engine, "before_cursor_execute", count_statements)
+    context_england2 = utils.get_run_context(plate_list_england2, session)
+    context_xbb = utils.get_run_context(plate_list_xbb, session)
+    sqlalchemy.event.remove(engine, "before_cursor_execute", count_statements)
+    # one read of the strain table, then a single query per lookup
+    assert len(statements) == 3
+    assert context_england2 == utils.RunContext(200, VARIANT_ENGLAND, True, 3)
+    assert context_xbb == utils.RunContext(200, "XBB.1.16", False, 3)
+    assert utils.count_other_variants(200, "XBB.1.16", session) == 1
+    assert utils.count_other_variants(200, VARIANT_ENGLAND, session) == 0
+    assert not context_xbb.is_final_upload(1)
+    assert context_xbb.is_final_upload(2)
+    with pytest.raises(RuntimeError):
+        context_xbb.is_final_upload(3)
+    with pytest.raises(errors.VariantLookupError):
+        utils.get_run_context(
+            [i.replace("S01", "S99") for i in plate_list_england2], session
+        )
+
+
+def test_strain_index():
+    index = utils.StrainIndex()
+    statements = []
+
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sqlalchemy.event.listen(engine, "before_cursor_execute", count_statements)
+    for _ in range(100):
+        assert index.lookup(["S02", "S01"], session) == VARIANT_ENGLAND
+        assert index.lookup(["S09", "S10"], session) == VARIANT_INDIA
+    assert len(statements) == 1
+    session.add(
+        db_models.NE_available_strains(
+            mutant_strain="BA.2", plate_id_1="41", plate_id_2="42"
+        )
+    )
+    session.commit()
+    # not read again for unknown prefixes straight after a read
+    with pytest.raises(errors.VariantLookupError):
+        index.lookup(["S41", "S42"], session)
+    # the insert, but no read
+    assert len(statements) == 2
+    # strains added after the index was read are found by reading again
+    index.miss_interval = 0
+    assert index.lookup(["S41", "S42"], session) == "BA.2"
+    assert len(statements) == 3
+    with pytest.raises(errors.VariantLookupError):
+        index.lookup(["S98", "S99"], session)
+    assert len(statements) == 4
+    index.invalidate()
+    assert index.lookup(["S41", "S42"], session) == "BA.2"
+    # expired entries are read again
+    index.ttl = 0
+    assert index.lookup(["S41", "S42"], session) == "BA.2"
+    sqlalchemy.event.remove(engine, "before_cursor_execute", count_statements)
+    assert len(statements) == 6
+    assert utils.get_strain_index(session) is utils.get_strain_index(session)
+
+
 def test_get_workflow_id_from_plate_list():
     plate_list_1 = [
         "/example/Titration_raw_data/T09000100__2021_01_01T01_01_01-Measurement 1",